@@ -0,0 +1,580 @@
+"""
+ASGI entry point for the web interface.
+The chat routes (/api/chat and /api/chat/stream) run as coroutines that talk to
+Ollama through ollama.AsyncClient and to Qdrant through httpx, so answers being
+generated wait on sockets instead of holding a thread each and many of them
+share one process. Every other route is served by the Flask app in web_app.py
+on a thread pool. Each backend has its own concurrency limit; requests beyond
+it queue on the event loop. Start it with serve.py.
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager, aclosing
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import ollama
+
+import web_app
+from web_app import (app as flask_app, build_prompt, hits_to_retrieval, health, store, COLLECTION,
+                     EMBEDDING_MODEL, CHAT_MODEL, OLLAMA_HOST, QDRANT_URL, TIMING_HEADER, USE_MOCK)
+from rag.config import MOCK_ANSWER, OLLAMA_KEEP_ALIVE
+from rag.embedding_cache import get_cache
+from rag.mock_embedder import mock_embed
+from rag.metrics import (REGISTRY, REQUEST_SECONDS, span, record, start_timing, current_timing, stop_timing,
+                         format_timing, timing_ms)
+from rag.profiler import get_profiler
+from rag.query_cache import normalize_question
+from rag.reranker import RERANK_ENABLED, RERANK_CANDIDATES, rerank, local_payloads, attach_payloads
+from rag.single_flight import AsyncSingleFlight
+
+OLLAMA_CHAT_CONCURRENCY = int(os.getenv("OLLAMA_CHAT_CONCURRENCY", "4"))
+# Limits the async routes' own embedding calls; with the embedding scheduler (EMBED_SCHEDULER=1)
+# the same setting is its number of dispatch threads instead (rag/embed_scheduler.py)
+OLLAMA_EMBED_CONCURRENCY = int(os.getenv("OLLAMA_EMBED_CONCURRENCY", "8"))
+QDRANT_CONCURRENCY = int(os.getenv("QDRANT_CONCURRENCY", "32"))
+# Threads running the Flask routes (uploads, status, metrics, batch endpoints, ...)
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "16"))
+
+
+class BackendLimit:
+    """Caps concurrent calls to one backend; callers beyond the limit wait their turn."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(self.limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        record(f"{self.name}_wait", time.perf_counter() - started)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+limits = {
+    "ollama_chat": BackendLimit("ollama_chat", OLLAMA_CHAT_CONCURRENCY),
+    "ollama_embed": BackendLimit("ollama_embed", OLLAMA_EMBED_CONCURRENCY),
+    "qdrant": BackendLimit("qdrant", QDRANT_CONCURRENCY),
+}
+
+
+class AsyncBackends:
+    """Async Ollama and Qdrant clients, created on the serving event loop on first use."""
+
+    def __init__(self):
+        self._ollama = None
+        self._qdrant = None
+
+    @property
+    def ollama(self):
+        if self._ollama is None:
+            self._ollama = ollama.AsyncClient(host=OLLAMA_HOST)
+        return self._ollama
+
+    @property
+    def qdrant(self):
+        if self._qdrant is None:
+            from rag.qdrant_http import AsyncQdrantHTTP
+            self._qdrant = AsyncQdrantHTTP(QDRANT_URL)
+        return self._qdrant
+
+    async def close(self):
+        if self._qdrant is not None:
+            await self._qdrant.aclose()
+        if self._ollama is not None:
+            await self._ollama.close()
+        self._ollama = self._qdrant = None
+
+
+backends = AsyncBackends()
+
+
+def collect_limit_metrics():
+    return [
+        ('rag_backend_in_flight', 'gauge', 'Calls to a backend currently in progress (ASGI chat path).',
+         [({'backend': name}, limit.in_flight) for name, limit in limits.items()]),
+        ('rag_backend_waiting', 'gauge', 'Calls waiting for a backend concurrency slot (ASGI chat path).',
+         [({'backend': name}, limit.waiting) for name, limit in limits.items()]),
+    ]
+
+
+REGISTRY.add_collector(collect_limit_metrics)
+
+
+# ---------------------------------------------------------------- chat pipeline
+
+async def ollama_embed_async(texts: list):
+    scheduler = web_app.embed_scheduler
+    if scheduler is not None:
+        # Batched with the questions of other requests (and the Flask routes) by the embedding scheduler,
+        # whose dispatch threads bound the calls to Ollama; a slot here would only cap the batch size
+        return await asyncio.wrap_future(scheduler.submit(texts))
+    async with limits["ollama_embed"].slot():
+        with span("ollama_embed"):
+            response = await backends.ollama.embed(model=EMBEDDING_MODEL, input=texts, keep_alive=OLLAMA_KEEP_ALIVE)
+    return response['embeddings']
+
+
+async def embed_async(texts: list):
+    """Embed texts, sending only embedding cache misses to Ollama."""
+    if USE_MOCK:
+        return mock_embed(texts)
+    cache = get_cache()
+    if cache is None:
+        return await ollama_embed_async(texts)
+    # SQLite lookups and writes stay off the event loop
+    vectors = await asyncio.to_thread(cache.get_many, EMBEDDING_MODEL, texts)
+    missing = [i for i, vec in enumerate(vectors) if vec is None]
+    if missing:
+        miss_texts = [texts[i] for i in missing]
+        fresh = await ollama_embed_async(miss_texts)
+        await asyncio.to_thread(cache.put_many, EMBEDDING_MODEL, miss_texts, fresh)
+        for i, vec in zip(missing, fresh):
+            vectors[i] = vec
+    return vectors
+
+
+async def search_async(vectors: list, limit: int, with_payload=True):
+    if store.name == "qdrant":
+        async with limits["qdrant"].slot():
+            return await backends.qdrant.search_batch(COLLECTION, vectors, limit=limit, with_payload=with_payload)
+    # The local store searches in NumPy, which releases the GIL
+    return await asyncio.to_thread(store.search_batch, COLLECTION, vectors, limit=limit, with_payload=with_payload)
+
+
+async def two_stage_search_async(question: str, vector, limit: int):
+    """rag.reranker.two_stage_search() for one question, with the vector store calls awaited."""
+    keyword_index = web_app.keyword_index
+    with span("vector_search"):
+        found = (await search_async([vector], max(limit, RERANK_CANDIDATES), with_payload=False))[0]
+    with span("rerank"):
+        ranked = [await asyncio.to_thread(rerank, question, found, limit, keyword_index)]
+    with span("fetch_payloads"):
+        payloads, missing = await asyncio.to_thread(local_payloads, ranked, keyword_index)
+        if missing:
+            if store.name == "qdrant":
+                async with limits["qdrant"].slot():
+                    payloads.update(await backends.qdrant.retrieve(COLLECTION, missing))
+            else:
+                payloads.update(await asyncio.to_thread(store.retrieve, COLLECTION, missing))
+    return attach_payloads(ranked, payloads)[0]
+
+
+# Async counterparts of web_app's in-flight calls; they share its counters, so /api/status reports both
+retrievals = AsyncSingleFlight(web_app.retrievals.counters)
+generations = AsyncSingleFlight(web_app.generations.counters)
+stream_generations = AsyncSingleFlight(web_app.generations.counters)
+
+
+async def coalesce_async(flight: AsyncSingleFlight, key, fn):
+    """web_app.coalesce() for coroutines; returns (result, shared)."""
+    if not web_app.COALESCE_REQUESTS:
+        return await fn(), False
+    started = time.perf_counter()
+    result, shared = await flight.do(key, fn)
+    if shared:
+        record("coalesced_wait", time.perf_counter() - started)
+    return result, shared
+
+
+async def retrieve_async(question: str, limit: int = 5):
+    """web_app.retrieve() with the embedding and vector search awaited instead of blocking."""
+    retrieval, shared = await coalesce_async(retrievals, (normalize_question(question), limit),
+                                             lambda: search_question_async(question, limit))
+    return {**retrieval, 'coalesced': shared}
+
+
+async def search_question_async(question: str, limit: int = 5):
+    """Embed, search and assemble the context for one question."""
+    result = {'context': "", 'sources': [], 'context_report': None, 'vector': None, 'cached': False}
+    with span("health_check"):
+        connected = web_app.check_qdrant_connection()
+    if not connected:
+        return result
+    query_cache = web_app.query_cache
+    candidates = web_app.retrieval_candidates(limit)
+    try:
+        with span("embed"):
+            vector = (await embed_async([question]))[0]
+        result['vector'] = vector
+        with span("retrieval_cache"):
+            hits = query_cache.get_retrieval(vector, candidates) if query_cache else None
+        cached = hits is not None
+        if hits is None:
+            try:
+                if RERANK_ENABLED:
+                    hits = await two_stage_search_async(question, vector, candidates)
+                else:
+                    with span("vector_search"):
+                        hits = (await search_async([vector], candidates))[0]
+            except Exception:
+                health.breaker("vector_store").record_failure()
+                raise
+            health.breaker("vector_store").record_success()
+            if query_cache:
+                query_cache.put_retrieval(vector, candidates, hits)
+        hits = (await asyncio.to_thread(web_app.fuse_keyword_hits, [question], [hits], limit))[0]
+        with span("assemble_context"):
+            result = hits_to_retrieval(vector, hits, cached, limit)
+    except Exception as e:
+        print(f"[warning] Qdrant search error: {e}")
+    return result
+
+
+async def chat_completion_async(prompt: str) -> str:
+    if USE_MOCK:
+        return MOCK_ANSWER
+    try:
+        async with limits["ollama_chat"].slot():
+            response = await backends.ollama.chat(model=CHAT_MODEL, messages=[{"role": "user", "content": prompt}],
+                                                  keep_alive=OLLAMA_KEEP_ALIVE)
+        return response['message']['content']
+    except Exception as e:
+        raise RuntimeError(f"Ollama chat completion failed: {e}") from e
+
+
+async def chat_completion_stream_async(prompt: str):
+    """Yield the r1 answer piece by piece; the chat slot is held until the stream ends."""
+    if USE_MOCK:
+        for word in MOCK_ANSWER.split(" "):
+            yield word + " "
+        return
+    try:
+        async with limits["ollama_chat"].slot():
+            stream = await backends.ollama.chat(
+                model=CHAT_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                keep_alive=OLLAMA_KEEP_ALIVE
+            )
+            async for part in stream:
+                content = part['message']['content']
+                if content:
+                    yield content
+    except Exception as e:
+        raise RuntimeError(f"Ollama chat completion failed: {e}") from e
+
+
+def stream_completion_async(question: str, retrieval: dict):
+    """web_app.stream_completion() for coroutines; returns (async tokens, shared)."""
+    prompt = build_prompt(question, retrieval['context'])
+
+    async def produce():
+        parts = []
+        async with aclosing(chat_completion_stream_async(prompt)) as tokens:
+            async for token in tokens:
+                parts.append(token)
+                yield token
+        web_app.remember_answer(question, retrieval, "".join(parts))
+
+    if not web_app.COALESCE_REQUESTS:
+        return produce(), False
+    return stream_generations.stream(web_app.generation_key(question, retrieval['context']), produce)
+
+
+# ---------------------------------------------------------------- HTTP plumbing
+
+class Request:
+    """The parts of an ASGI HTTP request the chat routes need."""
+
+    def __init__(self, scope, body: bytes, started: float):
+        self.started = started
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        self.args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        self.body = body
+
+    def json(self):
+        try:
+            data = json.loads(self.body or b"null")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+
+def switch(value, default: bool) -> bool:
+    """Interpret a per-request flag such as ?timing=1 or "semantic_cache": false."""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.lower() not in ("0", "false", "no")
+    return bool(value)
+
+
+async def read_body(receive) -> bytes:
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return bytes(body)
+
+
+async def send_json(send, status: int, data: dict, headers=()):
+    body = json.dumps(data).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                   + [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def chat(request: Request, send, receive):
+    """Async /api/chat; same request and response format as the Flask route."""
+    data = request.json() or {}
+    question = data.get('question', '')
+    if not question:
+        await send_json(send, 400, {'error': 'No question provided'})
+        return 400
+    try:
+        retrieval = await retrieve_async(question)
+        context = retrieval['context']
+        semantic = switch(data.get('semantic_cache', request.args.get('semantic_cache')), True)
+        answer, answer_hit = await asyncio.to_thread(web_app.cached_answer, question, retrieval, semantic)
+        shared = False
+        if answer is None:
+            async def generate_answer():
+                with span("generate"):
+                    answer = await chat_completion_async(build_prompt(question, context))
+                web_app.remember_answer(question, retrieval, answer)
+                return answer
+
+            answer, shared = await coalesce_async(generations, web_app.generation_key(question, context),
+                                                  generate_answer)
+        body = {
+            'answer': answer,
+            'has_context': bool(context),
+            'sources': retrieval['sources'],
+            'context_report': retrieval['context_report'],
+            'cache': {'retrieval': retrieval['cached'], 'answer': answer_hit},
+            'coalesced': {'retrieval': retrieval['coalesced'], 'answer': shared}
+        }
+        status = 200
+    except Exception as e:
+        body, status = {'error': str(e)}, 500
+    headers = []
+    if switch(request.headers.get('x-timing', request.args.get('timing')), TIMING_HEADER):
+        headers.append(('X-Timing', format_timing(current_timing(), time.perf_counter() - request.started)))
+    await send_json(send, status, body, headers)
+    return status
+
+
+async def chat_stream(request: Request, send, receive):
+    """Async /api/chat/stream: 'meta', 'token'... and 'done' or 'error' Server-Sent Events."""
+    data = (request.json() or {}) if request.method == 'POST' else request.args
+    question = data.get('question', '')
+    semantic = switch(data.get('semantic_cache', request.args.get('semantic_cache')), True)
+    timing = switch(request.headers.get('x-timing', request.args.get('timing')), TIMING_HEADER)
+    if not question:
+        await send_json(send, 400, {'error': 'No question provided'})
+        return 400
+
+    # Stop generating (and free the chat slot) as soon as the client goes away
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+
+    watcher = asyncio.create_task(watch_disconnect())
+
+    async def emit(event: str, payload: dict):
+        body = web_app.sse_event(event, payload).encode("utf-8")
+        await send({"type": "http.response.body", "body": body, "more_body": True})
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no")],
+    })
+    try:
+        retrieval = await retrieve_async(question)
+        context = retrieval['context']
+        answer, answer_hit = await asyncio.to_thread(web_app.cached_answer, question, retrieval, semantic)
+        tokens, shared = (None, False) if answer is not None else stream_completion_async(question, retrieval)
+        await emit('meta', {
+            'has_context': bool(context),
+            'sources': retrieval['sources'],
+            'context_report': retrieval['context_report'],
+            'cache': {'retrieval': retrieval['cached'], 'answer': answer_hit},
+            'coalesced': {'retrieval': retrieval['coalesced'], 'answer': shared}
+        })
+        if answer is not None:
+            await emit('token', {'content': answer})
+        else:
+            first = True
+            started = time.perf_counter()
+            try:
+                # Leaving early unsubscribes; the generation stops once no request listens to it
+                async with aclosing(tokens):
+                    async for token in tokens:
+                        if first:
+                            record("first_token", time.perf_counter() - started)
+                            first = False
+                        await emit('token', {'content': token})
+                        if disconnected.is_set():
+                            break
+            except Exception as e:
+                await emit('error', {'error': str(e)})
+                return 200
+            if disconnected.is_set():
+                return 499
+            record("generate", time.perf_counter() - started)
+        await emit('done', {'timing': timing_ms(current_timing())} if timing else {})
+        return 200
+    finally:
+        watcher.cancel()
+        await send({"type": "http.response.body", "body": b""})
+
+
+ROUTES = {
+    ('POST', '/api/chat'): chat,
+    ('GET', '/api/chat/stream'): chat_stream,
+    ('POST', '/api/chat/stream'): chat_stream,
+}
+
+
+class WSGIBridge:
+    """Serves a WSGI app from ASGI. Each request runs on a pool thread, which
+    hands the response body back to the event loop chunk by chunk."""
+
+    def __init__(self, wsgi_app, threads: int = WSGI_THREADS):
+        self.app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    @staticmethod
+    def environ(scope, body: bytes) -> dict:
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": str(server[0]),
+            "SERVER_PORT": str(server[1]),
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope["headers"]:
+            key = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if key == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+            elif key != "CONTENT_LENGTH":
+                key = f"HTTP_{key}"
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    async def __call__(self, scope, receive, send):
+        environ = self.environ(scope, await read_body(receive))
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        response = {}
+        done = object()
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+        def run():
+            try:
+                body = self.app(environ, start_response)
+                try:
+                    for chunk in body:
+                        if chunk:
+                            loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+                finally:
+                    if hasattr(body, "close"):
+                        body.close()
+                loop.call_soon_threadsafe(chunks.put_nowait, done)
+            except BaseException as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+
+        self.executor.submit(run)
+        item = await chunks.get()
+        if isinstance(item, BaseException) or "status" not in response:
+            await send_json(send, 500, {'error': str(item) if isinstance(item, BaseException) else 'No response'})
+            return
+        await send({"type": "http.response.start", "status": response["status"], "headers": response["headers"]})
+        while item is not done:
+            if isinstance(item, BaseException):
+                # Headers are out already; ending the body early is all that is left
+                print(f"[error] {scope['path']}: {item}")
+                break
+            await send({"type": "http.response.body", "body": item, "more_body": True})
+            item = await chunks.get()
+        await send({"type": "http.response.body", "body": b""})
+
+
+wsgi = WSGIBridge(flask_app)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Sampling profiler, only when PROFILE=1
+            get_profiler()
+            await asyncio.to_thread(web_app.startup_checks)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await backends.close()
+            wsgi.executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        await wsgi(scope, receive, send)
+        return
+    started = time.perf_counter()
+    token = start_timing()
+    status = 500
+    try:
+        request = Request(scope, await read_body(receive), started)
+        status = await handler(request, send, receive)
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, scope["path"], scope["method"], str(status))
+        stop_timing(token)
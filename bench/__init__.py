@@ -0,0 +1,6 @@
+"""
+Benchmark suite for the RAG scripts.
+Runs ingestion and chat workloads against local stand-ins for Qdrant and Ollama
+(bench.stubs) with configurable latency and writes the results as JSON
+(bench.run). bench.compare flags regressions between two result files.
+"""
@@ -0,0 +1,77 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+    python -m bench.compare baseline.json current.json --threshold 10
+
+Exits with status 1 when any tracked metric got worse by more than the
+threshold (in percent).
+"""
+import json
+import argparse
+
+# (path in the results, True if higher is better)
+METRICS = [
+    ("ingest.pages_per_s", True),
+    ("ingest.chunks_per_s", True),
+    ("chat.latency.p50_ms", False),
+    ("chat.latency.p90_ms", False),
+    ("chat.latency.p99_ms", False),
+    ("chat.stream_time_to_first_token.p50_ms", False),
+    ("chat.stream_time_to_first_token.p90_ms", False),
+    ("concurrent.requests_per_s", True),
+    ("concurrent.latency.p50_ms", False),
+    ("concurrent.latency.p99_ms", False),
+]
+
+
+def lookup(results: dict, path: str):
+    value = results
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(baseline: dict, current: dict, threshold: float):
+    """Yield (metric, baseline, current, change in percent, regressed) for every tracked metric."""
+    for path, higher_is_better in METRICS:
+        old, new = lookup(baseline, path), lookup(current, path)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or old == 0:
+            continue
+        change = (new - old) / old * 100.0
+        worse = -change if higher_is_better else change
+        yield path, old, new, change, worse > threshold
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two bench.run result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent by which a metric may get worse before it counts as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+
+    regressions = 0
+    print(f"{'metric':45} {'baseline':>12} {'current':>12} {'change':>9}")
+    for path, old, new, change, regressed in compare(baseline, current, args.threshold):
+        regressions += regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{path:45} {old:12.2f} {new:12.2f} {change:+8.1f}%{flag}")
+    if regressions:
+        print(f"[error] {regressions} metric(s) regressed by more than {args.threshold:g}%")
+        return 1
+    print(f"[info] no regressions beyond {args.threshold:g}%")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,89 @@
+"""
+Synthetic PDF corpus for the benchmarks.
+Writes minimal, dependency-free PDFs with seeded pseudo-English paragraphs, so
+every run ingests exactly the same text.
+"""
+import os
+import random
+
+WORDS = (
+    "thread process memory lock queue scheduler kernel signal buffer socket "
+    "request response cache index vector query document page section result "
+    "the a of to and in is for on with as by at from that this it be are was"
+).split()
+
+LINES_PER_PAGE = 56
+LINE_WIDTH = 90
+
+
+def _sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+def page_text(rng):
+    """Lines of one page: paragraphs of 3-6 sentences separated by blank lines."""
+    lines = []
+    while len(lines) < LINES_PER_PAGE:
+        paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+        line = ""
+        for word in paragraph.split():
+            if len(line) + len(word) + 1 > LINE_WIDTH:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.extend([line, ""])
+    return lines[:LINES_PER_PAGE]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: list):
+    """Write a PDF whose pages contain the given lists of text lines."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        ops = ["BT", "/F1 10 Tf", "13 TL", "50 780 Td"]
+        ops.extend(f"({_escape(line)}) Tj T*" for line in lines)
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref)
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{k} 0 R" for k in kids).encode("ascii"), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_corpus(folder: str, docs: int, pages_per_doc: int, seed: int = 0):
+    """Write docs PDFs of pages_per_doc pages each; returns the total page count."""
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    for d in range(docs):
+        pages = [page_text(rng) for _ in range(pages_per_doc)]
+        write_pdf(os.path.join(folder, f"bench-{d:03d}.pdf"), pages)
+    return docs * pages_per_doc
+
+
+def questions(count: int, seed: int = 1):
+    """Distinct benchmark questions, so caches do not short-circuit the measurement."""
+    rng = random.Random(seed)
+    return [f"Question {i}: how does the {rng.choice(WORDS)} affect the {rng.choice(WORDS)}?"
+            for i in range(count)]
@@ -0,0 +1,207 @@
+"""
+Benchmark two-stage retrieval against a single vector search.
+
+    python -m bench.rerank --chunks 5000 --queries 200 --output rerank.json
+
+Loads a synthetic collection into the Qdrant stand-in and a keyword index,
+then runs every query through both ways of retrieving:
+
+- single: one points/search for --fetch hits with payloads (RERANK=0)
+- two_stage: rag.reranker.two_stage_search(), i.e. --candidates hits without
+  payloads, a local rerank and payloads for the best --fetch hits, read from
+  the keyword index (or from Qdrant with --payloads qdrant)
+
+Mock embeddings carry no meaning, so hit quality is measured on hashed
+bag-of-words embeddings with Gaussian noise standing in for an imperfect
+embedding model. Chunks are drawn from a Zipf-distributed vocabulary; each
+query is a few distinctive words of one chunk plus unrelated words, and that
+chunk is the relevant hit. Reports latency, bytes received from Qdrant per
+query and hit@1, recall@--limit and MRR of the top --limit hits. The stand-in
+has no network in between, so the latency gain of smaller responses on a real
+link is not part of the numbers.
+"""
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import shutil
+
+import numpy as np
+
+from bench.run import percentiles
+from bench.stubs import FakeQdrant, Latency
+from rag.ingest_manifest import point_id
+from rag.keyword_index import KeywordIndex, tokenize, HYBRID_CANDIDATES
+from rag.qdrant_http import QdrantHTTP
+from rag.reranker import two_stage_search, RERANK_CANDIDATES, RERANK_LEXICAL_WEIGHT
+
+COLLECTION = "rerank-bench"
+DIM = 768
+
+
+def vocabulary(size: int):
+    rng = np.random.default_rng(7)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    words = {"".join(rng.choice(letters, rng.integers(4, 10))) for _ in range(size * 2)}
+    return sorted(words)[:size]
+
+
+def make_chunks(count: int, words: int, vocab: list, seed: int):
+    """Chunk texts of Zipf-distributed words."""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, len(vocab) + 1)
+    weights /= weights.sum()
+    picks = rng.choice(len(vocab), size=(count, words), p=weights)
+    return [" ".join(vocab[i] for i in row) for row in picks]
+
+
+def make_queries(chunks: list, count: int, words: int, noise_words: int, vocab: list, seed: int):
+    """(query, index of the relevant chunk): distinctive words of the chunk plus random ones."""
+    rng = np.random.default_rng(seed)
+    document_frequency = {}
+    for text in chunks:
+        for term in set(text.split()):
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+    queries = []
+    for target in rng.choice(len(chunks), size=count, replace=False):
+        terms = sorted(set(chunks[target].split()), key=lambda t: document_frequency[t])[:words * 2]
+        picked = list(rng.choice(terms, size=min(words, len(terms)), replace=False))
+        picked += list(rng.choice(vocab, size=noise_words))
+        rng.shuffle(picked)
+        queries.append((" ".join(picked), int(target)))
+    return queries
+
+
+def embed(texts: list, noise: float, seed: int):
+    """Hashed bag-of-words vectors plus Gaussian noise of norm ~noise, unit length."""
+    rng = np.random.default_rng(seed)
+    matrix = np.zeros((len(texts), DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for term in tokenize(text):
+            digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+            h = int.from_bytes(digest, "little")
+            matrix[row, h % DIM] += 1.0 if (h >> 32) & 1 else -1.0
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    matrix += rng.standard_normal(matrix.shape).astype(np.float32) * (noise / np.sqrt(DIM))
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    return matrix
+
+
+def quality(rankings: list, relevant: list, limit: int) -> dict:
+    ranks = []
+    for ids, target in zip(rankings, relevant):
+        ids = ids[:limit]
+        ranks.append(ids.index(target) + 1 if target in ids else None)
+    found = [r for r in ranks if r is not None]
+    return {
+        "hit_at_1": round(sum(1 for r in found if r == 1) / len(ranks), 4),
+        f"recall_at_{limit}": round(len(found) / len(ranks), 4),
+        "mrr": round(sum(1.0 / r for r in found) / len(ranks), 4),
+    }
+
+
+class _Payloads:
+    """Stands in for the keyword index when payloads come from Qdrant (--payloads qdrant)."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def score_ids(self, query, point_ids):
+        return self.index.score_ids(query, point_ids)
+
+    def payloads(self, point_ids):
+        return {}
+
+
+def run(args) -> dict:
+    vocab = vocabulary(args.vocabulary)
+    texts = make_chunks(args.chunks, args.chunk_words, vocab, args.seed)
+    queries = make_queries(texts, args.queries, args.query_words, args.query_noise_words, vocab, args.seed + 1)
+    ids = [point_id(f"doc-{i // 20}", str(i)) for i in range(len(texts))]
+    payloads = [{"text": text, "source": f"doc-{i // 20}.pdf", "chunk_index": i % 20}
+                for i, text in enumerate(texts)]
+
+    qdrant = FakeQdrant(search_latency=Latency(args.search_latency_ms)).start()
+    workdir = tempfile.mkdtemp(prefix="rag-rerank-")
+    try:
+        client = QdrantHTTP(qdrant.url)
+        client.ensure_collection(COLLECTION, size=DIM)
+        vectors = embed(texts, args.noise, args.seed + 2)
+        for i in range(0, len(ids), 1000):
+            client.upsert(COLLECTION, [{"id": pid, "vector": vec, "payload": payload} for pid, vec, payload in
+                                       zip(ids[i:i + 1000], vectors[i:i + 1000].tolist(), payloads[i:i + 1000])])
+        index = KeywordIndex(COLLECTION, root=workdir)
+        for i in range(0, len(ids), 20):
+            index.replace_source(f"doc-{i // 20}.pdf", list(zip(ids[i:i + 20], payloads[i:i + 20])))
+        index.commit()
+        keyword_index = index if args.payloads == "keyword" else _Payloads(index)
+
+        # Bytes of every Qdrant response body, to compare what crosses the wire
+        received = []
+        client.session.hooks["response"].append(lambda r, *a, **kw: received.append(len(r.content)))
+        question_vectors = embed([q for q, _ in queries], args.noise, args.seed + 3).tolist()
+        relevant = [ids[target] for _, target in queries]
+        results = {}
+        for mode in ("single", "two_stage"):
+            latencies, sizes, rankings = [], [], []
+            for (question, _), vector in zip(queries, question_vectors):
+                received.clear()
+                started = time.perf_counter()
+                if mode == "single":
+                    hits = client.search(COLLECTION, vector, limit=args.fetch)
+                else:
+                    hits = two_stage_search(client, COLLECTION, [question], [vector], args.fetch, keyword_index,
+                                            candidates=args.candidates)[0]
+                latencies.append(time.perf_counter() - started)
+                rankings.append([str(h["id"]) for h in hits])
+                sizes.append(sum(received))
+            results[mode] = {
+                "latency": percentiles(latencies),
+                "bytes_received_mean": int(np.mean(sizes)),
+                **quality(rankings, relevant, args.limit),
+            }
+        results["backend_calls"] = qdrant.stats()
+        return results
+    finally:
+        qdrant.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark two-stage retrieval against a single vector search.")
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--chunk-words", type=int, default=150)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-words", type=int, default=4, help="words taken from the relevant chunk")
+    parser.add_argument("--query-noise-words", type=int, default=2, help="unrelated words added to each query")
+    parser.add_argument("--noise", type=float, default=0.3,
+                        help="norm of the Gaussian noise added to unit-length embeddings")
+    parser.add_argument("--limit", type=int, default=5, help="hits that count for hit quality")
+    parser.add_argument("--fetch", type=int, default=HYBRID_CANDIDATES, help="hits returned with payloads")
+    parser.add_argument("--candidates", type=int, default=RERANK_CANDIDATES, help="hits the first stage returns")
+    parser.add_argument("--payloads", choices=("keyword", "qdrant"), default="keyword",
+                        help="where the two-stage search reads payloads from")
+    parser.add_argument("--search-latency-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"[info] {args.chunks} chunks, {args.queries} queries, lexical weight {RERANK_LEXICAL_WEIGHT} ...",
+          file=sys.stderr)
+    results = {"config": {k: v for k, v in vars(args).items() if k != "output"}, **run(args)}
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
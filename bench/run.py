@@ -0,0 +1,295 @@
+"""
+Run the benchmark suite and write the results as JSON.
+
+    python -m bench.run --output bench-results.json
+
+Starts the Qdrant and Ollama stand-ins, ingests a synthetic corpus with
+ingest_pdf.py, then starts the web app (Flask's server via web_app.py, or the
+ASGI app via serve.py with --server asgi) and measures sequential chat latency,
+streaming time to first token and throughput under concurrent requests. All
+scripts run as subprocesses with caches disabled, against a scratch directory.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from bench.corpus import make_corpus, questions
+from bench.stubs import FakeQdrant, FakeOllama, Latency
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLLECTION = "docs"
+
+
+def percentiles(samples: list) -> dict:
+    """Summary of latency samples given in seconds, reported in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p90_ms": round(float(np.percentile(ms, 90)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def bench_env(workdir: str, qdrant: FakeQdrant, ollama: FakeOllama, port: int) -> dict:
+    """Environment for the scripts under test: stand-in backends, caches off, state in workdir."""
+    cache = os.path.join(workdir, ".cache")
+    env = dict(os.environ)
+    env.update({
+        "QDRANT_URL": qdrant.url,
+        "OLLAMA_HOST": ollama.url,
+        "VECTOR_STORE": "qdrant",
+        "USE_MOCK": "0",
+        "EMBED_CACHE": "0",
+        "QUERY_CACHE": "0",
+        "SEMANTIC_CACHE": "0",
+        "PDF_FOLDER": os.path.join(workdir, "pdfs"),
+        "INGEST_MANIFEST_DIR": cache,
+        "COLLECTION_VERSION_DIR": cache,
+        "LOCAL_STORE_PATH": os.path.join(cache, "vectors"),
+        "KEYWORD_INDEX_PATH": os.path.join(cache, "keyword"),
+        "HEALTH_INTERVAL": "1",
+        "FLASK_DEBUG": "0",
+        "PORT": str(port),
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def bench_ingest(args, workdir: str, env: dict, qdrant: FakeQdrant, ollama: FakeOllama) -> dict:
+    folder = env["PDF_FOLDER"]
+    pages = make_corpus(folder, args.docs, args.pages_per_doc, seed=args.seed)
+    embeds_before = ollama.stats().get("texts_embedded", 0)
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(REPO, "ingest_pdf.py"), "--folder", folder],
+                          cwd=workdir, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"ingest_pdf.py failed ({proc.returncode}):\n{proc.stdout}\n{proc.stderr}")
+    chunks = qdrant.count_points(COLLECTION)
+    return {
+        "documents": args.docs,
+        "pages": pages,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "pages_per_s": round(pages / elapsed, 2),
+        "chunks_per_s": round(chunks / elapsed, 2),
+        "texts_embedded": ollama.stats().get("texts_embedded", 0) - embeds_before,
+    }
+
+
+def start_web_app(workdir: str, env: dict, port: int, server: str = "flask", timeout: float = 60):
+    log = open(os.path.join(workdir, "web_app.log"), "w")
+    script = "serve.py" if server == "asgi" else "web_app.py"
+    proc = subprocess.Popen([sys.executable, os.path.join(REPO, script)],
+                            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            break
+        try:
+            status = requests.get(f"{url}/api/status", timeout=2).json()
+            if status.get("qdrant_connected") and status.get("ollama_connected"):
+                return proc, url
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{script} did not become ready, see {log.name}")
+
+
+def ask(session: requests.Session, url: str, question: str):
+    started = time.perf_counter()
+    r = session.post(f"{url}/api/chat", json={"question": question}, timeout=120)
+    elapsed = time.perf_counter() - started
+    return elapsed, r.ok and "answer" in r.json()
+
+
+def time_to_first_token(session: requests.Session, url: str, question: str):
+    """Seconds until the first 'token' event and until the stream ends."""
+    started = time.perf_counter()
+    first = None
+    with session.post(f"{url}/api/chat/stream", json={"question": question}, stream=True, timeout=120) as r:
+        for line in r.iter_lines():
+            if first is None and line == b"event: token":
+                first = time.perf_counter() - started
+    return first, time.perf_counter() - started
+
+
+def bench_chat(args, url: str) -> dict:
+    session = requests.Session()
+    # Warm up connections and lazily initialized state
+    for q in questions(3, seed=args.seed + 100):
+        ask(session, url, q)
+
+    latencies, errors = [], 0
+    for q in questions(args.chat_requests, seed=args.seed + 1):
+        elapsed, ok = ask(session, url, q)
+        latencies.append(elapsed)
+        errors += 0 if ok else 1
+
+    ttft, total = [], []
+    for q in questions(args.stream_requests, seed=args.seed + 2):
+        first, elapsed = time_to_first_token(session, url, q)
+        if first is not None:
+            ttft.append(first)
+        total.append(elapsed)
+
+    return {
+        "latency": percentiles(latencies),
+        "errors": errors,
+        "stream_time_to_first_token": percentiles(ttft),
+        "stream_total": percentiles(total),
+    }
+
+
+def bench_concurrent(args, url: str) -> dict:
+    local = threading.local()
+
+    def worker(question):
+        # One keep-alive session per client thread
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        session = local.session
+        try:
+            return ask(session, url, question)
+        except requests.RequestException:
+            return None, False
+
+    qs = questions(args.concurrent_requests, seed=args.seed + 3)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(worker, qs))
+    elapsed = time.perf_counter() - started
+    latencies = [r[0] for r in results if r[0] is not None]
+    errors = sum(1 for r in results if not r[1])
+    return {
+        "concurrency": args.concurrency,
+        "requests": len(qs),
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(len(qs) / elapsed, 2),
+        "errors": errors,
+        "latency": percentiles(latencies),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and chat against local stand-ins.")
+    parser.add_argument("--output", help="write the JSON results to this file (default: stdout only)")
+    parser.add_argument("--only", choices=("ingest", "chat"), help="run only one part of the suite")
+    parser.add_argument("--docs", type=int, default=8, help="synthetic PDFs to ingest")
+    parser.add_argument("--pages-per-doc", type=int, default=25)
+    parser.add_argument("--chat-requests", type=int, default=50, help="sequential /api/chat requests")
+    parser.add_argument("--stream-requests", type=int, default=20, help="/api/chat/stream requests")
+    parser.add_argument("--concurrent-requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask",
+                        help="serve web_app.py with Flask's threaded server or asgi_app.py with uvicorn")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--search-latency-ms", type=float, default=2.0)
+    parser.add_argument("--upsert-latency-ms", type=float, default=5.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0, help="per embed request")
+    parser.add_argument("--embed-per-item-ms", type=float, default=2.0, help="per embedded text")
+    parser.add_argument("--chat-ttft-ms", type=float, default=50.0, help="time to the first chat token")
+    parser.add_argument("--chat-token-ms", type=float, default=5.0, help="time per further chat token")
+    parser.add_argument("--chat-tokens", type=int, default=32)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    qdrant = FakeQdrant(search_latency=Latency(args.search_latency_ms),
+                        upsert_latency=Latency(args.upsert_latency_ms)).start()
+    ollama = FakeOllama(embed_latency=Latency(args.embed_latency_ms, args.embed_per_item_ms),
+                        chat_ttft_ms=args.chat_ttft_ms, chat_token_ms=args.chat_token_ms,
+                        chat_tokens=args.chat_tokens).start()
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    port = free_port()
+    env = bench_env(workdir, qdrant, ollama, port)
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "keep")},
+            "backends": {
+                "qdrant": {"search": qdrant.search_latency.to_dict(), "upsert": qdrant.upsert_latency.to_dict()},
+                "ollama": {"embed": ollama.embed_latency.to_dict(), "chat_ttft_ms": args.chat_ttft_ms,
+                           "chat_token_ms": args.chat_token_ms, "chat_tokens": args.chat_tokens},
+            },
+        }
+    }
+    web = None
+    try:
+        if args.only in (None, "ingest", "chat"):
+            # Chat needs a populated collection, so the corpus is always ingested
+            print(f"[info] ingesting {args.docs} x {args.pages_per_doc} pages ...", file=sys.stderr)
+            results["ingest"] = bench_ingest(args, workdir, env, qdrant, ollama)
+        if args.only in (None, "chat"):
+            print(f"[info] starting the web app ({args.server}) ...", file=sys.stderr)
+            web, url = start_web_app(workdir, env, port, args.server)
+            print(f"[info] {args.chat_requests} sequential chat requests ...", file=sys.stderr)
+            results["chat"] = bench_chat(args, url)
+            print(f"[info] {args.concurrent_requests} requests at concurrency {args.concurrency} ...",
+                  file=sys.stderr)
+            results["concurrent"] = bench_concurrent(args, url)
+        results["backend_calls"] = {"qdrant": qdrant.stats(), "ollama": ollama.stats()}
+    finally:
+        if web is not None:
+            web.terminate()
+            try:
+                web.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                web.kill()
+        qdrant.stop()
+        ollama.stop()
+        if args.keep:
+            print(f"[info] scratch directory kept at {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
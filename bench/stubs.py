@@ -0,0 +1,505 @@
+"""
+Local stand-ins for the Qdrant REST API and Ollama's embed/chat endpoints.
+Both keep everything in memory, answer with configurable latency and count the
+calls they receive, so benchmarks measure this repo's code rather than the
+backends. Run `python -m bench.stubs` from the repository root to serve them
+on fixed ports for manual testing.
+"""
+import re
+import gzip
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from rag.mock_embedder import mock_embed_array, MOCK_DIM
+from rag.vector_store import matches_filter
+
+
+class Latency:
+    """Simulated service time: a base delay plus a per-item delay, with jitter."""
+
+    def __init__(self, base_ms: float = 0.0, per_item_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.base_ms = base_ms
+        self.per_item_ms = per_item_ms
+        self.jitter_ms = jitter_ms
+
+    def wait(self, items: int = 1):
+        delay = self.base_ms + self.per_item_ms * items
+        if self.jitter_ms:
+            delay += random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def to_dict(self):
+        return {"base_ms": self.base_ms, "per_item_ms": self.per_item_ms, "jitter_ms": self.jitter_ms}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """JSON request handler dispatching to the stub's route table."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; avoid Nagle/delayed-ACK stalls
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        return json.loads(data) if data else {}
+
+    def send_json(self, status: int, obj):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_chunked(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _dispatch(self, method: str):
+        stub = self.server.stub
+        path = self.path.split("?", 1)[0]
+        # Always consume the body so the keep-alive connection stays in sync
+        body = self._body() if method in ("POST", "PUT") else {}
+        for route_method, pattern, handler in stub.routes:
+            if route_method != method:
+                continue
+            m = pattern.fullmatch(path)
+            if m:
+                stub.count(handler.__name__)
+                try:
+                    handler(self, body, *m.groups())
+                except Exception as e:
+                    self.send_json(500, {"status": {"error": str(e)}})
+                return
+        self.send_json(404, {"status": {"error": f"no route for {method} {path}"}})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+class StubServer:
+    """Threaded HTTP server running on a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.routes = []
+        self.calls = {}
+        self._calls_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self, method: str, pattern: str, handler):
+        self.routes.append((method, re.compile(pattern), handler))
+
+    def count(self, name: str, amount: int = 1):
+        with self._calls_lock:
+            self.calls[name] = self.calls.get(name, 0) + amount
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self):
+        with self._calls_lock:
+            return dict(self.calls)
+
+
+class _Collection:
+    """In-memory collection: a growing float32 matrix plus payloads."""
+
+    def __init__(self, size: int, distance: str):
+        self.size = size
+        self.distance = distance
+        self.matrix = np.zeros((1024, size), dtype=np.float32)
+        self.alive = np.zeros(1024, dtype=bool)
+        self.ids = []
+        self.payloads = []
+        self.rows = {}
+        self.lock = threading.Lock()
+
+    def _normalize(self, vectors):
+        mat = np.asarray(vectors, dtype=np.float32).reshape(-1, self.size)
+        if self.distance.lower() == "cosine":
+            mat = mat / (np.linalg.norm(mat, axis=1, keepdims=True) + 1e-12)
+        return mat
+
+    def upsert(self, ids, vectors, payloads):
+        mat = self._normalize(vectors)
+        with self.lock:
+            for pid, vec, payload in zip(ids, mat, payloads):
+                row = self.rows.get(pid)
+                if row is None:
+                    row = len(self.ids)
+                    if row >= len(self.matrix):
+                        grow = len(self.matrix)
+                        self.matrix = np.concatenate([self.matrix, np.zeros((grow, self.size), np.float32)])
+                        self.alive = np.concatenate([self.alive, np.zeros(grow, dtype=bool)])
+                    self.ids.append(pid)
+                    self.payloads.append(payload)
+                    self.rows[pid] = row
+                self.matrix[row] = vec
+                self.payloads[row] = payload or {}
+                self.alive[row] = True
+
+    def delete(self, selector):
+        with self.lock:
+            if "points" in selector:
+                rows = [self.rows[pid] for pid in selector["points"] if pid in self.rows]
+            else:
+                flt = selector.get("filter") or {}
+                rows = [r for r in np.flatnonzero(self.alive) if matches_filter(self.payloads[r], flt)]
+            for row in rows:
+                self.alive[row] = False
+                self.rows.pop(self.ids[row], None)
+
+    def count(self):
+        with self.lock:
+            return int(self.alive.sum())
+
+    def retrieve(self, ids, with_payload):
+        with self.lock:
+            points = []
+            for pid in ids:
+                row = self.rows.get(pid)
+                if row is not None:
+                    point = {"id": pid}
+                    if with_payload:
+                        point["payload"] = self.payloads[row]
+                    points.append(point)
+            return points
+
+    def scroll(self, offset, limit: int, with_payload, with_vector):
+        # Qdrant's next_page_offset is the ID of the first point of the next page
+        with self.lock:
+            start = self.rows.get(offset, 0) if offset is not None else 0
+            rows = np.flatnonzero(self.alive[start:len(self.ids)])[:limit + 1] + start
+            points = []
+            for row in rows[:limit]:
+                point = {"id": self.ids[row]}
+                if with_payload:
+                    point["payload"] = self.payloads[row]
+                if with_vector:
+                    point["vector"] = self.matrix[row].tolist()
+                points.append(point)
+            return points, self.ids[rows[limit]] if len(rows) > limit else None
+
+    def search(self, vectors, limit: int, with_payload):
+        queries = self._normalize(vectors)
+        with self.lock:
+            n = len(self.ids)
+            scores = queries @ self.matrix[:n].T
+            scores[:, ~self.alive[:n]] = -np.inf
+            results = []
+            for row_scores in scores:
+                k = min(limit, n)
+                if k <= 0:
+                    results.append([])
+                    continue
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                top = top[np.argsort(-row_scores[top])]
+                hits = []
+                for i in top:
+                    if not np.isfinite(row_scores[i]):
+                        continue
+                    hit = {"id": self.ids[i], "version": 0, "score": float(row_scores[i])}
+                    if with_payload:
+                        hit["payload"] = self.payloads[i]
+                    hits.append(hit)
+                results.append(hits)
+            return results
+
+
+class FakeQdrant(StubServer):
+    """Emulates the parts of the Qdrant REST API used by rag.qdrant_http."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, search_latency: Latency = None,
+                 upsert_latency: Latency = None):
+        super().__init__(host, port)
+        self.search_latency = search_latency or Latency()
+        self.upsert_latency = upsert_latency or Latency()
+        self.collections = {}
+        self._lock = threading.Lock()
+        c = r"/collections/([^/]+)"
+        self.route("GET", r"/collections", self.list_collections)
+        self.route("GET", c, self.get_collection)
+        self.route("PUT", c, self.create_collection)
+        self.route("DELETE", c, self.delete_collection)
+        self.route("PUT", c + r"/points", self.upsert)
+        self.route("POST", c + r"/points", self.points)
+        self.route("POST", c + r"/points/scroll", self.scroll)
+        self.route("POST", c + r"/points/search", self.search)
+        self.route("POST", c + r"/points/search/batch", self.search_batch)
+        self.route("POST", c + r"/points/delete", self.delete)
+
+    def _collection(self, name):
+        with self._lock:
+            return self.collections.get(name)
+
+    def count_points(self, name: str) -> int:
+        col = self._collection(name)
+        return col.count() if col else 0
+
+    @staticmethod
+    def list_collections(h, body):
+        names = list(h.server.stub.collections)
+        h.send_json(200, {"result": {"collections": [{"name": n} for n in names]}, "status": "ok"})
+
+    @staticmethod
+    def get_collection(h, body, name):
+        col = h.server.stub._collection(name)
+        if col is None:
+            return h.send_json(404, {"status": {"error": f"Collection `{name}` doesn't exist!"}})
+        h.send_json(200, {"result": {"status": "green", "points_count": col.count(),
+                                     "config": {"params": {"vectors": {"size": col.size, "distance": col.distance}}}},
+                          "status": "ok"})
+
+    @staticmethod
+    def create_collection(h, body, name):
+        stub = h.server.stub
+        vectors = body.get("vectors") or {}
+        with stub._lock:
+            if name not in stub.collections:
+                stub.collections[name] = _Collection(int(vectors.get("size", MOCK_DIM)),
+                                                     vectors.get("distance", "Cosine"))
+        h.send_json(200, {"result": True, "status": "ok"})
+
+    @staticmethod
+    def delete_collection(h, body, name):
+        stub = h.server.stub
+        with stub._lock:
+            stub.collections.pop(name, None)
+        h.send_json(200, {"result": True, "status": "ok"})
+
+    @staticmethod
+    def upsert(h, body, name):
+        stub = h.server.stub
+        col = stub._collection(name)
+        if col is None:
+            return h.send_json(404, {"status": {"error": f"Collection `{name}` doesn't exist!"}})
+        if "batch" in body:
+            batch = body["batch"]
+            ids, vectors = batch["ids"], batch["vectors"]
+            payloads = batch.get("payloads") or [{}] * len(ids)
+        else:
+            points = body.get("points") or []
+            ids = [p["id"] for p in points]
+            vectors = [p["vector"] for p in points]
+            payloads = [p.get("payload") or {} for p in points]
+        stub.upsert_latency.wait(len(ids))
+        col.upsert(ids, vectors, payloads)
+        stub.count("points_upserted", len(ids))
+        h.send_json(200, {"result": {"operation_id": 0, "status": "completed"}, "status": "ok"})
+
+    @staticmethod
+    def points(h, body, name):
+        # POST .../points retrieves points by ID; upserts are PUT only, like in Qdrant
+        if "ids" not in body:
+            return h.send_json(400, {"status": {"error": "missing field `ids`"}})
+        stub = h.server.stub
+        col = stub._collection(name)
+        if col is None:
+            return h.send_json(404, {"status": {"error": f"Collection `{name}` doesn't exist!"}})
+        stub.count("points_retrieved", len(body["ids"]))
+        h.send_json(200, {"result": col.retrieve(body["ids"], body.get("with_payload", True)), "status": "ok"})
+
+    @staticmethod
+    def scroll(h, body, name):
+        stub = h.server.stub
+        col = stub._collection(name)
+        if col is None:
+            return h.send_json(404, {"status": {"error": f"Collection `{name}` doesn't exist!"}})
+        points, next_offset = col.scroll(body.get("offset"), int(body.get("limit", 10)),
+                                         body.get("with_payload", True), body.get("with_vector", False))
+        stub.count("points_scrolled", len(points))
+        h.send_json(200, {"result": {"points": points, "next_page_offset": next_offset}, "status": "ok"})
+
+    @staticmethod
+    def search(h, body, name):
+        stub = h.server.stub
+        col = stub._collection(name)
+        if col is None:
+            return h.send_json(404, {"status": {"error": f"Collection `{name}` doesn't exist!"}})
+        stub.search_latency.wait(1)
+        hits = col.search([body["vector"]], int(body.get("limit", 10)), body.get("with_payload", False))[0]
+        h.send_json(200, {"result": hits, "status": "ok"})
+
+    @staticmethod
+    def search_batch(h, body, name):
+        stub = h.server.stub
+        col = stub._collection(name)
+        if col is None:
+            return h.send_json(404, {"status": {"error": f"Collection `{name}` doesn't exist!"}})
+        searches = body.get("searches") or []
+        stub.search_latency.wait(len(searches))
+        results = [col.search([s["vector"]], int(s.get("limit", 10)), s.get("with_payload", False))[0]
+                   for s in searches]
+        h.send_json(200, {"result": results, "status": "ok"})
+
+    @staticmethod
+    def delete(h, body, name):
+        col = h.server.stub._collection(name)
+        if col is not None:
+            col.delete(body)
+        h.send_json(200, {"result": {"operation_id": 0, "status": "completed"}, "status": "ok"})
+
+
+class FakeOllama(StubServer):
+    """Emulates Ollama's /api/embed, /api/chat, /api/generate and /api/tags endpoints."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, embed_latency: Latency = None,
+                 chat_ttft_ms: float = 0.0, chat_token_ms: float = 0.0, chat_tokens: int = 32,
+                 dim: int = MOCK_DIM):
+        super().__init__(host, port)
+        self.embed_latency = embed_latency or Latency()
+        self.chat_ttft_ms = chat_ttft_ms
+        self.chat_token_ms = chat_token_ms
+        self.chat_tokens = chat_tokens
+        self.dim = dim
+        self.route("GET", r"/api/tags", self.tags)
+        self.route("GET", r"/api/version", self.version)
+        self.route("POST", r"/api/embed", self.embed)
+        self.route("POST", r"/api/embeddings", self.embeddings)
+        self.route("POST", r"/api/chat", self.chat)
+        self.route("POST", r"/api/generate", self.generate)
+
+    @staticmethod
+    def tags(h, body):
+        h.send_json(200, {"models": [{"name": "nomic-embed-text:latest"}, {"name": "r1:latest"}]})
+
+    @staticmethod
+    def version(h, body):
+        h.send_json(200, {"version": "stub"})
+
+    @staticmethod
+    def embed(h, body):
+        stub = h.server.stub
+        texts = body.get("input") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        stub.embed_latency.wait(len(texts))
+        stub.count("texts_embedded", len(texts))
+        vectors = mock_embed_array(texts, stub.dim)
+        h.send_json(200, {"model": body.get("model"), "embeddings": vectors.tolist()})
+
+    @staticmethod
+    def embeddings(h, body):
+        stub = h.server.stub
+        stub.embed_latency.wait(1)
+        stub.count("texts_embedded")
+        h.send_json(200, {"embedding": mock_embed_array([body.get("prompt", "")], stub.dim)[0].tolist()})
+
+    @staticmethod
+    def generate(h, body):
+        # Only the model-loading form (no prompt) that chat.py sends to pin r1 with keep_alive
+        h.server.stub.count("model_loads")
+        h.send_json(200, {"model": body.get("model"), "response": "", "done": True, "done_reason": "load"})
+
+    @staticmethod
+    def chat(h, body):
+        stub = h.server.stub
+        model = body.get("model")
+        tokens = [f"token{i} " for i in range(stub.chat_tokens)]
+
+        def message(content, done):
+            msg = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                   "message": {"role": "assistant", "content": content}, "done": done}
+            if done:
+                msg["done_reason"] = "stop"
+            return msg
+
+        time.sleep(stub.chat_ttft_ms / 1000.0)
+        if not body.get("stream", True):
+            time.sleep(stub.chat_token_ms * len(tokens) / 1000.0)
+            return h.send_json(200, message("".join(tokens), True))
+        h.start_chunked("application/x-ndjson")
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(stub.chat_token_ms / 1000.0)
+            h.write_chunk(json.dumps(message(token, False)).encode("utf-8") + b"\n")
+        h.write_chunk(json.dumps(message("", True)).encode("utf-8") + b"\n")
+        h.end_chunked()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Qdrant and Ollama stand-ins.")
+    parser.add_argument("--qdrant-port", type=int, default=6333)
+    parser.add_argument("--ollama-port", type=int, default=11434)
+    parser.add_argument("--search-latency-ms", type=float, default=2.0)
+    parser.add_argument("--upsert-latency-ms", type=float, default=5.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--embed-per-item-ms", type=float, default=2.0)
+    parser.add_argument("--chat-ttft-ms", type=float, default=50.0)
+    parser.add_argument("--chat-token-ms", type=float, default=5.0)
+    parser.add_argument("--chat-tokens", type=int, default=32)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    qdrant = FakeQdrant(port=args.qdrant_port, search_latency=Latency(args.search_latency_ms),
+                        upsert_latency=Latency(args.upsert_latency_ms)).start()
+    ollama = FakeOllama(port=args.ollama_port,
+                        embed_latency=Latency(args.embed_latency_ms, args.embed_per_item_ms),
+                        chat_ttft_ms=args.chat_ttft_ms, chat_token_ms=args.chat_token_ms,
+                        chat_tokens=args.chat_tokens).start()
+    print(f"[info] Qdrant stand-in at {qdrant.url}, Ollama stand-in at {ollama.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        qdrant.stop()
+        ollama.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,103 +1,179 @@
-import requests
+"""
+Chat with the indexed PDFs from the command line.
+Questions are answered in one session until "exit", "quit" or end of input:
+the Ollama client and the vector store connection stay open, both models are
+kept loaded with Ollama's keep_alive, and earlier turns are sent along as a
+bounded history (see rag/conversation.py).
+
+Only the standard library and python-dotenv are imported before the first
+prompt appears; the rag package, the Ollama client and the vector store probe
+load in a background thread while the question is typed. Each question is
+embedded and searched as soon as its line is read, so a question typed (or
+piped in) while the previous answer is still printing is ready when its turn
+comes.
+"""
 import os
+import sys
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import ollama
 
 # Load environment variables from .env file
 load_dotenv()
 
-qdrant_available = True
-
-# Ollama configuration
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-EMBEDDING_MODEL = "nomic-embed-text"
-CHAT_MODEL = "r1"
-COLLECTION = "docs"
-USE_MOCK = os.getenv("USE_MOCK", "0").lower() in ("1", "true", "yes")
-
-# Initialize Ollama client
-ollama_client = ollama.Client(host=OLLAMA_HOST)
-
-def client_embeddings(text: str):
-    """Generate embeddings using Ollama with nomic-embed-text model."""
-    response = ollama_client.embed(model=EMBEDDING_MODEL, input=text)
-    return response['embeddings'][0]
-qdrant = None
-if qdrant_available:
-    QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
-    try:
-        r = requests.get(f"{QDRANT_URL}/collections")
-        if r.ok:
-            print(f"[info] Qdrant REST reachable at {QDRANT_URL}")
-        else:
-            print(f"[warning] Qdrant REST returned status {r.status_code}")
-    except Exception as e:
-        print(f"[warning] could not reach Qdrant at {QDRANT_URL}: {e}")
-        qdrant_available = False
+# Print the answer token by token (python chat.py --stream, or CHAT_STREAM=1)
+STREAM = os.getenv("CHAT_STREAM", "0").lower() in ("1", "true", "yes")
+# How long Ollama keeps both models loaded between questions of a session
+CHAT_KEEP_ALIVE = os.getenv("CHAT_KEEP_ALIVE") or os.getenv("OLLAMA_KEEP_ALIVE") or "30m"
+EXIT_COMMANDS = ("exit", "quit")
 
-def embed(text: str):
-    return client_embeddings(text)
 
-question = input("❓ Frage: ")
+class Backend:
+    """Imports the rag library and checks the vector store off the main thread."""
 
-if qdrant_available:
-    try:
-        qvec = embed(question)
-        body = {"vector": qvec, "limit": 5, "with_payload": True}
-        r = requests.post(f"{QDRANT_URL}/collections/{COLLECTION}/points/search", json=body, timeout=30)
-        if r.ok:
-            data = r.json()
-            hits = data.get("result") or data.get("data") or []
-            texts = []
-            for h in hits:
-                payload = h.get("payload") or h.get("payload", {})
-                if isinstance(payload, dict) and "text" in payload:
-                    texts.append(payload["text"])
-            context = "\n".join(texts)
-        else:
-            print(f"[warning] Qdrant search failed: {r.status_code} {r.text}")
-            context = ""
-    except Exception as e:
-        print(f"[warning] Qdrant REST search error: {e}")
-        context = ""
-else:
-    print("[warning] Qdrant not available — proceeding without context from vector DB.")
-    context = ""
-
-prompt = f"""
-Nutze nur diese Infos:
-{context}
-
-Frage:
-{question}
-"""
+    def __init__(self, keep_alive):
+        self.keep_alive = keep_alive
+        self.store = None
+        self.embedder = None
+        self.ready = threading.Event()
+        threading.Thread(target=self._load, daemon=True).start()
+
+    def _load(self):
+        try:
+            from rag.config import QDRANT_URL, USE_MOCK
+            from rag.embedder import Embedder
+            from rag.vector_store import get_store
+            import rag.generator  # noqa: F401  (imported here so answering does not wait for it)
+
+            if not USE_MOCK:
+                # Loading r1 can take several seconds; it happens while the question is typed
+                from rag.ollama_client import preload_models
+                threading.Thread(target=preload_models, args=(self.keep_alive,), daemon=True).start()
+            self.embedder = Embedder(keep_alive=self.keep_alive)
+            store = get_store(QDRANT_URL)
+            try:
+                if store.is_available(timeout=10):
+                    print(f"[info] {store.name} vector store reachable")
+                    self.store = store
+                else:
+                    print(f"[warning] {store.name} vector store not reachable")
+            except Exception as e:
+                print(f"[warning] could not reach Qdrant at {QDRANT_URL}: {e}")
+        finally:
+            self.ready.set()
+
+    def context(self, question: str):
+        """Texts of the five best matching chunks, or "" without a vector store."""
+        self.ready.wait()
+        if self.store is None:
+            print("[warning] Qdrant not available — proceeding without context from vector DB.")
+            return ""
+        from rag.config import COLLECTION
+        try:
+            qvec = self.embedder.embed(question)
+            hits = self.store.search(COLLECTION, qvec, limit=5)
+        except Exception as e:
+            print(f"[warning] Qdrant REST search error: {e}")
+            return ""
+        texts = []
+        for h in hits:
+            payload = h.get("payload") or {}
+            if isinstance(payload, dict) and "text" in payload:
+                texts.append(payload["text"])
+        return "\n".join(texts)
+
+
+def read_questions(questions: queue.Queue, backend: Backend, prefetch: ThreadPoolExecutor):
+    """Queue (question, future context) for every line of input, then None at its end."""
+    for line in sys.stdin:
+        question = line.strip()
+        if not question:
+            continue
+        if question.lower() in EXIT_COMMANDS:
+            break
+        questions.put((question, prefetch.submit(backend.context, question)))
+    questions.put(None)
 
-def chat_completion(prompt: str):
-    """Generate chat completion using Ollama with r1 model."""
-    if USE_MOCK:
-        return {"choices": [{"message": {"content": f"[MOCK] Response to your query"}}]}
+
+def answer(prompt: str, history: list, keep_alive, stream: bool):
+    """Print the answer to prompt and return its text ("" on failure)."""
+    from rag.generator import chat_completion, chat_completion_stream
+
+    if stream:
+        print("\n💡 Antwort:")
+        tokens = []
+        try:
+            for token in chat_completion_stream(prompt, history, keep_alive):
+                tokens.append(token)
+                print(token, end="", flush=True)
+            print()
+        except RuntimeError as err:
+            print(f"\n[error] {err}")
+            return ""
+        return "".join(tokens)
     try:
-        response = ollama_client.chat(
-            model=CHAT_MODEL,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        # Convert Ollama response format to OpenAI-like format for compatibility
-        return {
-            "choices": [{
-                "message": {
-                    "content": response['message']['content']
-                }
-            }]
-        }
-    except Exception as e:
-        raise RuntimeError(f"Ollama chat completion failed: {e}") from e
-
-try:
-    resp = chat_completion(prompt)
-    print("\n💡 Antwort:")
+        resp = chat_completion(prompt, history, keep_alive)
+        print("\n💡 Antwort:")
+        try:
+            content = resp["choices"][0]["message"]["content"]
+            print(content)
+            return content
+        except Exception:
+            print(resp)
+            return ""
+    except RuntimeError as err:
+        print(f"[error] {err}")
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat with the indexed PDFs")
+    parser.add_argument("--stream", action="store_true", default=STREAM,
+                        help="print the answer token by token (CHAT_STREAM)")
+    parser.add_argument("--keep-alive", default=CHAT_KEEP_ALIVE,
+                        help="how long Ollama keeps the models loaded, e.g. 30m or -1 (CHAT_KEEP_ALIVE)")
+    parser.add_argument("--no-history", action="store_true",
+                        help="answer every question on its own, without the earlier turns")
+    args = parser.parse_args()
+    keep_alive = int(args.keep_alive) if args.keep_alive.lstrip("-").isdigit() else args.keep_alive
+
+    backend = Backend(keep_alive)
+    questions = queue.Queue()
+    prefetch = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+    threading.Thread(target=read_questions, args=(questions, backend, prefetch), daemon=True).start()
+
+    from rag.config import USE_MOCK
+    from rag.conversation import Conversation
+    from rag.generator import build_prompt
+
+    summarize = None
+    if not USE_MOCK:
+        def summarize(prompt):
+            from rag.generator import chat_completion
+            return chat_completion(prompt, keep_alive=keep_alive)["choices"][0]["message"]["content"]
+    conversation = Conversation(summarize)
+
     try:
-        print(resp["choices"][0]["message"]["content"])
-    except Exception:
-        print(resp)
-except RuntimeError as err:
-    print(f"[error] {err}")
+        while True:
+            print("❓ Frage: ", end="", flush=True)
+            item = questions.get()
+            if item is None:
+                print()
+                break
+            question, context = item
+            prompt = build_prompt(question, context.result())
+            history = [] if args.no_history else conversation.messages()
+            text = answer(prompt, history, keep_alive, args.stream)
+            if text and not args.no_history:
+                conversation.add(question, text)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        prefetch.shutdown(wait=False, cancel_futures=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
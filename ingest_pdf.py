@@ -1,173 +1,448 @@
+"""
+Command-line ingestion of a folder of PDFs into the vector store.
+A thin entry point over the rag package: nothing is connected or loaded until
+main() runs, and the extraction worker processes only import rag.chunker.
+Documents are extracted in page ranges spread over the worker processes, and
+extracted pages are kept in the page cache (rag/page_cache.py), so re-chunking
+or ingesting into another collection does not parse the PDFs again.
+
+    python ingest_pdf.py --folder pdfs --workers 4 --embed-concurrency 2
+"""
 import os
-import uuid
-import requests
+import queue
+import argparse
+import threading
 import time
-import random
-from PyPDF2 import PdfReader
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
-import ollama
 
 # Load environment variables from .env file
 load_dotenv()
 
-# ------------------- CONFIG -------------------
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-EMBEDDING_MODEL = "nomic-embed-text"
-PDF_FOLDER = os.getenv("PDF_FOLDER", "pdfs")
-COLLECTION = "docs"
-CHUNK_SIZE = 500
-USE_MOCK = os.getenv("USE_MOCK", "0").lower() in ("1", "true", "yes")
-# ---------------------------------------------
+from rag.config import QDRANT_URL, OLLAMA_HOST, EMBEDDING_DIM, PDF_FOLDER, COLLECTION, MAX_UPSERT, USE_MOCK
+from rag.chunker import chunk_pages, extract_page_range, page_count, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from rag.ingest_manifest import file_sha256
+from rag.metrics import REGISTRY, span, record, stage_summary
+from rag.vector_store import PointBatch
 
-# Initialize Ollama client
-ollama_client = ollama.Client(host=OLLAMA_HOST)
+# Write the stage histograms here after each run (e.g. for node_exporter's textfile collector)
+METRICS_FILE = os.getenv("METRICS_FILE")
+# Fewest pages per extraction task. Every task opens the PDF again, so a document
+# is split into at most one page range per worker, and only if the ranges get this long.
+PAGES_PER_TASK = int(os.getenv("PAGES_PER_TASK", "32"))
 
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+_DONE = object()
+
+class _Extraction:
+    """Page texts of one document, gathered from its extraction tasks."""
+
+    def __init__(self, path, sha256, total, pages):
+        self.path = path
+        self.sha256 = sha256
+        self.total = total
+        self.pages = pages
+        self.tasks = 0
+        self.failed = False
+
+    def ranges(self, workers: int, min_size: int):
+        """[start, stop) ranges of the pages that are not extracted yet, one per worker
+        but at least min_size pages long. The whole document if its page count is unknown."""
+        if self.total is None:
+            return [[0, None]]
+        missing = [i for i in range(self.total) if i not in self.pages]
+        size = max(min_size, -(-len(missing) // workers))
+        ranges = []
+        for i in missing:
+            if ranges and ranges[-1][1] == i and i - ranges[-1][0] < size:
+                ranges[-1][1] = i + 1
+            else:
+                ranges.append([i, i + 1])
+        return ranges
+
+
+class IngestPipeline:
+    """
+    Staged ingestion: a process pool extracts page ranges of the PDFs, a set of embedding threads
+    turns chunk batches into points and a single upserter streams them to Qdrant.
+    All stages are connected by bounded queues, so a slow stage blocks the ones
+    feeding it instead of letting work pile up in memory.
+    """
+
+    def __init__(self, manifest, store, embedder, keyword_index=None, page_cache=None, workers: int = 2,
+                 embed_concurrency: int = 2, upsert_size: int = MAX_UPSERT, queue_size: int = 8,
+                 chunk_tokens: int = CHUNK_TOKENS, chunk_overlap: int = CHUNK_OVERLAP_TOKENS,
+                 pages_per_task: int = PAGES_PER_TASK):
+        self.manifest = manifest
+        self.store = store
+        self.embedder = embedder
+        self.keyword_index = keyword_index
+        self.page_cache = page_cache
+        self.pages_per_task = max(1, pages_per_task)
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.workers = max(1, workers)
+        self.embed_concurrency = max(1, embed_concurrency)
+        self.upsert_size = upsert_size
+        self.embed_queue = queue.Queue(maxsize=queue_size * self.embed_concurrency)
+        self.upsert_queue = queue.Queue(maxsize=queue_size * self.embed_concurrency)
+        self.lock = threading.Lock()
+        # source -> {"remaining": chunks not yet upserted, "entry": manifest entry, "failed": bool}
+        self.pending = {}
+        self.files = 0
+        self.skipped = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.upserted = 0
+        self.removed = 0
+        self.failed_batches = 0
+        self.pages_extracted = 0
+        self.pages_cached = 0
+
+    def _upsert(self, points):
+        """Upsert one batch of points (a PointBatch or a list of point dicts)."""
+        if self.store.upsert(COLLECTION, points):
+            print(f"✅ Upserted {len(points)} points")
+            return True
+        return False
+
+    def _settle(self, source, count, ok):
+        """Record the manifest entry once every new chunk of a document is stored."""
+        with self.lock:
+            doc = self.pending[source]
+            doc["remaining"] -= count
+            doc["failed"] = doc["failed"] or not ok
+            if doc["remaining"] > 0:
+                return
+            del self.pending[source]
+        if not doc["failed"]:
+            self.manifest.record(source, doc["entry"])
+
+    def _embed_worker(self):
+        while True:
+            item = self.embed_queue.get()
+            if item is _DONE:
+                break
+            source, batch = item
+            try:
+                with span("embed"):
+                    vectors = self.embedder.embed_batch([chunk["text"] for _, _, chunk in batch])
+            except Exception as e:
+                print(f"[error] embedding batch failed: {e}")
+                self._settle(source, len(batch), False)
+                continue
+            kept = [(item, vec) for item, vec in zip(batch, vectors) if vec is not None]
+            # One float32 matrix per batch instead of a list of Python floats per point
+            points = PointBatch([pid for (pid, _, _), _ in kept], [vec for _, vec in kept],
+                                [{**chunk, "source": source, "chunk_hash": digest} for (_, digest, chunk), _ in kept])
+            if len(points) < len(batch):
+                self._settle(source, len(batch) - len(points), False)
+            with self.lock:
+                self.embedded += len(points)
+            self.upsert_queue.put(points)
+
+    def _upserter(self):
+        parts = []
+        buffered = 0
+        while True:
+            item = self.upsert_queue.get()
+            if item is not _DONE and len(item):
+                parts.append(item)
+                buffered += len(item)
+            while buffered >= self.upsert_size or (item is _DONE and buffered):
+                buffer = PointBatch.concat(parts)
+                sub, rest = buffer[:self.upsert_size], buffer[self.upsert_size:]
+                parts, buffered = [rest], len(rest)
+                with span("upsert"):
+                    ok = self._upsert(sub)
+                if ok:
+                    self.upserted += len(sub)
+                else:
+                    print(f"[error] failed to upsert batch of {len(sub)} points")
+                    self.failed_batches += 1
+                counts = {}
+                for payload in sub.payloads:
+                    source = payload["source"]
+                    counts[source] = counts.get(source, 0) + 1
+                for source, count in counts.items():
+                    self._settle(source, count, ok)
+            if item is _DONE:
+                break
+
+    def _enqueue_document(self, path, chunks, sha256):
+        source = os.path.basename(path)
+        with span("plan"):
+            plan = self.manifest.plan(source, path, chunks, sha256)
+        self.files += 1
+        self.chunks += len(plan.entry["chunks"])
+        if self.keyword_index is not None:
+            # Indexed right away, it needs no embeddings; written in one segment when the run ends
+            self.keyword_index.replace_source(source, [
+                (pid, {**chunk, "source": source, "chunk_hash": digest}) for pid, digest, chunk in plan.chunks])
+        with span("delete_stale"):
+            if plan.is_new:
+                # Clears points from earlier runs that used random IDs
+                self.store.delete_source(COLLECTION, source)
+            elif plan.stale_ids:
+                for i in range(0, len(plan.stale_ids), 1000):
+                    self.store.delete_points(COLLECTION, {"points": plan.stale_ids[i:i+1000]})
+                self.removed += len(plan.stale_ids)
+        if not plan.new_chunks:
+            self.manifest.record(source, plan.entry)
+            return
+        with self.lock:
+            self.pending[source] = {"remaining": len(plan.new_chunks), "entry": plan.entry, "failed": False}
+        for batch in self.embedder.batcher.batches(plan.new_chunks, text=lambda c: c[2]["text"]):
+            # Blocks while the embedders are behind (backpressure on extraction)
+            with span("enqueue_wait"):
+                self.embed_queue.put((source, batch))
+
+    def _extractions(self, paths):
+        """Yield (extraction, start, stop) for every page range to extract; start is None
+        for documents whose pages are all in the page cache."""
+        for path in paths:
+            source = os.path.basename(path)
+            # Unchanged documents are still read once if they are missing from the keyword index
+            indexed = self.keyword_index is None or self.keyword_index.has_source(source)
+            if self.manifest.is_unchanged(source, path) and indexed:
+                self.skipped += 1
+                continue
+            try:
+                with span("page_plan"):
+                    sha256 = file_sha256(path)
+                    total, pages = self.page_cache.get(sha256) if self.page_cache is not None else (None, {})
+                    if total is None and self.workers > 1:
+                        # Needed to split the document over the workers
+                        total = page_count(path)
+            except Exception as e:
+                print(f"[error] could not extract {path}: {e}")
+                continue
+            extraction = _Extraction(path, sha256, total, pages)
+            self.pages_cached += len(pages)
+            ranges = extraction.ranges(self.workers, self.pages_per_task)
+            extraction.tasks = len(ranges)
+            if not ranges:
+                yield extraction, None, None
+            for start, stop in ranges:
+                yield extraction, start, stop
+
+    def _extracted(self, extraction, start, texts, total):
+        """Collect the pages of one finished task."""
+        extraction.total = total
+        fresh = {start + i: text for i, text in enumerate(texts)}
+        extraction.pages.update(fresh)
+        self.pages_extracted += len(fresh)
+        if self.page_cache is not None:
+            with span("page_cache"):
+                self.page_cache.put(extraction.sha256, extraction.total, fresh)
+
+    def _chunk_document(self, extraction):
+        with span("chunk"):
+            pages = ((i + 1, extraction.pages.get(i, "")) for i in range(extraction.total))
+            chunks = list(chunk_pages(pages, self.chunk_tokens, self.chunk_overlap))
+        self._enqueue_document(extraction.path, chunks, extraction.sha256)
+
+    def run(self, paths):
+        embedders = [threading.Thread(target=self._embed_worker, daemon=True)
+                     for _ in range(self.embed_concurrency)]
+        upserter = threading.Thread(target=self._upserter, daemon=True)
+        for t in embedders:
+            t.start()
+        upserter.start()
 
-def ensure_collection(url: str, collection: str, size: int = 768, distance: str = "Cosine"):
-    """Ensure collection exists in Qdrant. nomic-embed-text uses 768 dimensions."""
-    try:
-        r = requests.get(f"{url}/collections", timeout=10)
-        if r.ok:
-            j = r.json()
-           
-            cols = []
-            if isinstance(j, dict):
-                if "result" in j and isinstance(j["result"], dict) and "collections" in j["result"]:
-                    cols = j["result"]["collections"]
-                elif "collections" in j and isinstance(j["collections"], list):
-                    cols = j["collections"]
-                elif "result" in j and isinstance(j["result"], list):
-                    cols = j["result"]
-            names = [c.get("name") if isinstance(c, dict) else c for c in cols]
-            if collection in names:
-                print(f"[info] collection '{collection}' already exists")
-                return True
-    except Exception:
-        pass
-    body = {"vectors": {"size": size, "distance": distance}}
-    for endpoint in (f"{url}/collections/{collection}/create", f"{url}/collections/{collection}"):
         try:
-            r = requests.put(endpoint, json=body, timeout=10)
-            if r.ok or r.status_code in (200, 201, 204):
-                print(f"[info] created collection via {endpoint}")
-                return True
-        except Exception:
-            pass
-    raise RuntimeError(f"Could not create collection '{collection}' at {url}")
-
-def embed_batch(texts: list, max_retries: int = 3):
-    """Generate embeddings using Ollama with nomic-embed-text model."""
-    if USE_MOCK:
-        from hashlib import sha256
-        vecs = []
-        for t in texts:
-            h = sha256(t.encode("utf-8") + b"::embed").digest()
-            seed = int.from_bytes(h[:8], "big")
-            import random as _random
-            rnd = _random.Random(seed)
-            vec = [rnd.uniform(-1, 1) for _ in range(768)]  # nomic-embed-text uses 768 dimensions
-            vecs.append(vec)
-        return vecs
-    
-    for attempt in range(max_retries):
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                # future -> (extraction, first page of its range)
+                pending = {}
+                tasks = self._extractions(paths)
+                exhausted = False
+                while pending or not exhausted:
+                    # Keep only a couple of page ranges per worker in flight
+                    while not exhausted and len(pending) < self.workers * 2:
+                        task = next(tasks, None)
+                        if task is None:
+                            exhausted = True
+                            break
+                        extraction, start, stop = task
+                        if start is None:
+                            self._chunk_document(extraction)
+                            continue
+                        pending[pool.submit(extract_page_range, extraction.path, start, stop)] = (extraction, start)
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        extraction, start = pending.pop(future)
+                        extraction.tasks -= 1
+                        try:
+                            texts, total, seconds = future.result()
+                        except Exception as e:
+                            if not extraction.failed:
+                                print(f"[error] could not extract {extraction.path}: {e}")
+                            extraction.failed = True
+                        else:
+                            record("extract", seconds)
+                            self._extracted(extraction, start, texts, total)
+                        # Chunked once all its pages are in; pages extracted so far stay cached
+                        if not extraction.tasks and not extraction.failed:
+                            self._chunk_document(extraction)
+        finally:
+            for _ in embedders:
+                self.embed_queue.put(_DONE)
+            for t in embedders:
+                t.join()
+            self.upsert_queue.put(_DONE)
+            upserter.join()
+            if self.keyword_index is not None:
+                with span("keyword_index"):
+                    self.keyword_index.commit()
+            with span("manifest"):
+                self.manifest.save()
+        return self
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest PDFs into the Qdrant collection.")
+    parser.add_argument("--folder", default=PDF_FOLDER, help="folder containing PDF files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                        help="processes used for PDF text extraction")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK,
+                        help="fewest pages per extraction task when a document is split over the workers")
+    parser.add_argument("--embed-concurrency", type=int, default=2,
+                        help="concurrent embedding requests sent to Ollama")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="fixed chunks per embedding request (default: adapt to Ollama's latency)")
+    parser.add_argument("--upsert-size", type=int, default=MAX_UPSERT, help="points per Qdrant upsert")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS, help="maximum tokens per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP_TOKENS,
+                        help="tokens of trailing sentences repeated at the start of the next chunk")
+    parser.add_argument("--force", action="store_true",
+                        help="ignore the ingestion manifest and re-ingest every document")
+    return parser.parse_args(argv)
+
+def print_stage_timings():
+    """One line per stage: calls, total and mean time."""
+    summary = stage_summary()
+    if not summary:
+        return
+    print("[info] stage timings:")
+    for stage, (count, total) in sorted(summary.items(), key=lambda item: -item[1][1]):
+        print(f"[info]   {stage:14} {count:6d}x  total {total:8.2f}s  mean {total / count * 1000:8.1f}ms")
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The rest of the library is imported only once there is work to do
+    from rag.adaptive_batch import AdaptiveBatcher
+    from rag.embedder import Embedder
+    from rag.embedding_cache import get_cache
+    from rag.ingest_manifest import IngestManifest
+    from rag.keyword_index import get_keyword_index
+    from rag.ollama_client import get_ollama_client
+    from rag.page_cache import get_page_cache
+    from rag.profiler import get_profiler
+    from rag.query_cache import CollectionVersion
+    from rag.vector_store import get_store
+
+    # Sampling profiler, only when PROFILE=1
+    get_profiler()
+    folder = args.folder
+    batcher = None
+    if args.batch_size:
+        batcher = AdaptiveBatcher(start=args.batch_size, minimum=args.batch_size, maximum=args.batch_size)
+    embedder = Embedder(batcher)
+    # Vector store backend (VECTOR_STORE=qdrant|local); Qdrant uses a pooled keep-alive client
+    store = get_store(QDRANT_URL)
+
+    # Create PDF folder if it doesn't exist
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+        print(f"[info] Created {folder} folder. Please add PDF files to ingest.")
+
+    # Check if folder has any PDFs
+    pdf_files = sorted(f for f in os.listdir(folder) if f.lower().endswith(".pdf"))
+    if not pdf_files:
+        print(f"[warning] No PDF files found in {folder} folder.")
+        print(f"[info] Add PDF files to the {folder} folder and run this script again.")
+        return 0
+
+    # Check Ollama connection (skip in mock mode)
+    if not USE_MOCK:
         try:
-            # Ollama embed supports batch processing
-            response = ollama_client.embed(model=EMBEDDING_MODEL, input=texts)
-            return response['embeddings']
+            get_ollama_client().list()
+            print(f"[info] Ollama connection verified at {OLLAMA_HOST}")
         except Exception as e:
-            if attempt < max_retries - 1:
-                wait = (2 ** attempt) + random.random()
-                print(f"[warn] Ollama embedding failed (attempt {attempt+1}): {e}. Backing off {wait:.1f}s")
-                time.sleep(wait)
-                continue
-            raise RuntimeError(f"Failed to get embeddings after {max_retries} retries: {e}") from e
-
-def embed(text: str):
-    return embed_batch([text])[0]
-
-def pdf_to_text(path):
-    reader = PdfReader(path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    return text
-
-points = []
-
-# Create PDF folder if it doesn't exist
-if not os.path.exists(PDF_FOLDER):
-    os.makedirs(PDF_FOLDER)
-    print(f"[info] Created {PDF_FOLDER} folder. Please add PDF files to ingest.")
-
-# Check if folder has any PDFs
-pdf_files = [f for f in os.listdir(PDF_FOLDER) if f.lower().endswith(".pdf")]
-if not pdf_files:
-    print(f"[warning] No PDF files found in {PDF_FOLDER} folder.")
-    print(f"[info] Add PDF files to the {PDF_FOLDER} folder and run this script again.")
-    exit(0)
-
-# Check Ollama connection (skip in mock mode)
-if not USE_MOCK:
+            print(f"[error] Cannot connect to Ollama at {OLLAMA_HOST}: {e}")
+            print("[error] Make sure Ollama is running: https://ollama.ai")
+            print("[info] Alternatively, use USE_MOCK=1 for testing without Ollama")
+            return 1
+
+    # Try to create the collection (nomic-embed-text uses 768 dimensions)
     try:
-        ollama_client.list()
-        print(f"[info] Ollama connection verified at {OLLAMA_HOST}")
+        if not store.ensure_collection(COLLECTION, size=EMBEDDING_DIM, distance="Cosine"):
+            print(f"[error] Could not create collection '{COLLECTION}' at {QDRANT_URL}")
+            print("[error] Make sure Qdrant is running: docker run -p 6333:6333 qdrant/qdrant")
+            return 1
     except Exception as e:
-        print(f"[error] Cannot connect to Ollama at {OLLAMA_HOST}: {e}")
-        print("[error] Make sure Ollama is running: https://ollama.ai")
-        print("[info] Alternatively, use USE_MOCK=1 for testing without Ollama")
-        exit(1)
-
-# Try to create collection in Qdrant (nomic-embed-text uses 768 dimensions)
-try:
-    if not ensure_collection(QDRANT_URL, COLLECTION, size=768, distance="Cosine"):
-        print(f"[error] Could not create collection '{COLLECTION}' at {QDRANT_URL}")
+        print(f"[error] Failed to connect to Qdrant at {QDRANT_URL}: {e}")
         print("[error] Make sure Qdrant is running: docker run -p 6333:6333 qdrant/qdrant")
-        exit(1)
-except Exception as e:
-    print(f"[error] Failed to connect to Qdrant at {QDRANT_URL}: {e}")
-    print("[error] Make sure Qdrant is running: docker run -p 6333:6333 qdrant/qdrant")
-    exit(1)
-
-BATCH_SIZE = 16
-for filename in os.listdir(PDF_FOLDER):
-    if filename.lower().endswith(".pdf"):
-        path = os.path.join(PDF_FOLDER, filename)
-        text = pdf_to_text(path)
-        chunks = [text[i:i+CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
-        for i in range(0, len(chunks), BATCH_SIZE):
-            batch_chunks = chunks[i:i+BATCH_SIZE]
-            try:
-                vectors = embed_batch(batch_chunks)
-            except Exception as e:
-                print(f"[error] embedding batch failed: {e}")
-                vectors = [None] * len(batch_chunks)
-            for chunk, vec in zip(batch_chunks, vectors):
-                if vec is None:
-                    continue
-                points.append({
-                    "id": str(uuid.uuid4()),
-                    "vector": vec,
-                    "payload": {"text": chunk, "source": filename}
-                })
-
-MAX_UPSERT = 500
-for i in range(0, len(points), MAX_UPSERT):
-    sub = {"points": points[i:i+MAX_UPSERT]}
-    success = False
-    for method in ("post", "put"):
-        try:
-            fn = getattr(requests, method)
-            r = fn(f"{QDRANT_URL}/collections/{COLLECTION}/points", json=sub, timeout=60)
-            if r.ok:
-                print(f"✅ Upserted {len(sub['points'])} points (via {method.upper()})")
-                success = True
-                break
-            else:
-                print(f"[warning] upsert via {method.upper()} returned {r.status_code}: {r.text}")
-        except Exception as e:
-            print(f"[warning] upsert via {method.upper()} failed: {e}")
-    if not success:
-        print(f"[error] failed to upsert batch starting at {i}")
-        break
-print(f"✅ Fertig, {len(points)} Chunks gespeichert")
+        return 1
+
+    # BM25 index over the same chunks for hybrid retrieval (KEYWORD_INDEX=0 disables it)
+    keyword_index = get_keyword_index(COLLECTION)
+    manifest = IngestManifest(COLLECTION)
+    if args.force:
+        for source in manifest.sources():
+            manifest.forget(source)
+
+    # Documents that disappeared from the folder are removed from the collection
+    deleted = 0
+    for source in sorted(manifest.sources() - set(pdf_files)):
+        if store.delete_source(COLLECTION, source):
+            if keyword_index is not None:
+                keyword_index.delete_source(source)
+            manifest.forget(source)
+            deleted += 1
+            print(f"[info] removed deleted document {source}")
+
+    pipeline = IngestPipeline(
+        manifest,
+        store,
+        embedder,
+        keyword_index,
+        page_cache=get_page_cache(),
+        workers=args.workers,
+        pages_per_task=args.pages_per_task,
+        embed_concurrency=args.embed_concurrency,
+        upsert_size=args.upsert_size,
+        chunk_tokens=args.chunk_tokens,
+        chunk_overlap=args.chunk_overlap,
+    )
+    started = time.perf_counter()
+    pipeline.run(os.path.join(folder, f) for f in pdf_files)
+    elapsed = time.perf_counter() - started
+
+    # Invalidate cached retrievals and answers of running web apps
+    if pipeline.upserted or pipeline.removed or deleted or pipeline.files:
+        CollectionVersion(COLLECTION).bump()
+
+    print(f"✅ Fertig, {pipeline.upserted} Chunks gespeichert")
+    print(f"[info] {pipeline.files} files ingested, {pipeline.skipped} unchanged, {deleted} deleted, "
+          f"{pipeline.removed} stale chunks removed, {pipeline.chunks} chunks in {elapsed:.1f}s")
+    batches = embedder.batcher.stats()
+    if batches["calls"]:
+        print(f"[info] embedding: {batches['calls']} requests, final batch size {batches['batch_size']}, "
+              f"{batches['failures']} failures")
+    coalesced = embedder.coalescer.stats()
+    if coalesced["duplicates"] or coalesced["shared"]:
+        print(f"[info] embedding: {coalesced['duplicates'] + coalesced['shared']} repeated texts not embedded again")
+    cache = get_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"[info] embedding cache: {stats['memory_hits'] + stats['disk_hits']} hits, {stats['misses']} misses")
+    if pipeline.pages_extracted or pipeline.pages_cached:
+        print(f"[info] pages: {pipeline.pages_extracted} extracted, {pipeline.pages_cached} from the page cache")
+    print_stage_timings()
+    if METRICS_FILE:
+        REGISTRY.write_textfile(METRICS_FILE)
+    return 1 if pipeline.failed_batches else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
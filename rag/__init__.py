@@ -0,0 +1,66 @@
+"""
+Core library of the RAG system: configuration, embeddings, vector stores,
+chunking, retrieval helpers and answer generation. web_app.py, asgi_app.py,
+ingest_pdf.py and chat.py are thin entry points on top of it.
+
+Importing the package has no side effects and loads none of the submodules;
+each name below is imported on first access, so a CLI or a worker process
+only pays for what it uses:
+
+    import rag
+    store = rag.get_store()          # imports rag.vector_store only
+    rag.chunker.page_count(path)     # submodules are reachable the same way
+"""
+import importlib
+
+# Public name -> submodule defining it
+_EXPORTS = {
+    "Embedder": "embedder",
+    "build_prompt": "generator",
+    "chat_completion": "generator",
+    "chat_completion_stream": "generator",
+    "get_ollama_client": "ollama_client",
+    "preload_models": "ollama_client",
+    "Conversation": "conversation",
+    "get_store": "vector_store",
+    "PointBatch": "vector_store",
+    "VectorStore": "vector_store",
+    "chunk_pdf": "chunker",
+    "count_tokens": "chunker",
+    "get_page_cache": "page_cache",
+    "IngestManifest": "ingest_manifest",
+    "get_cache": "embedding_cache",
+    "get_keyword_index": "keyword_index",
+    "reciprocal_rank_fusion": "keyword_index",
+    "two_stage_search": "reranker",
+    "export_collection": "snapshot",
+    "import_snapshot": "snapshot",
+    "assemble": "context_assembler",
+    "QueryCache": "query_cache",
+    "CollectionVersion": "query_cache",
+}
+
+_SUBMODULES = {
+    "adaptive_batch", "chunker", "config", "context_assembler", "conversation", "embed_scheduler",
+    "embedder", "embedding_cache", "file_lock", "generator", "health", "ingest_manifest", "jobs", "keyword_index",
+    "metrics", "mock_embedder", "ollama_client", "page_cache", "profiler", "qdrant_http", "query_cache",
+    "reranker", "single_flight", "snapshot", "vector_store",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    # Cache it, so later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | _SUBMODULES)
@@ -0,0 +1,157 @@
+"""
+Adaptive batch sizing for embedding requests.
+The batch size follows observed latency: it grows while Ollama answers well
+within the target latency and shrinks when calls get slow or fail. Batches are
+also capped by their total number of characters, so a run of long chunks does
+not turn into one oversized request. A failing batch is split in half and
+retried instead of sleeping and resending the same payload. Only failures caused
+by the size of a batch (HTTP 413, context length) cap how far it may grow again;
+outages and timeouts do not.
+"""
+import os
+import re
+import time
+import random
+import threading
+
+EMBED_BATCH_START = int(os.getenv("EMBED_BATCH_START", "16"))
+EMBED_BATCH_MIN = int(os.getenv("EMBED_BATCH_MIN", "1"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "256"))
+EMBED_BATCH_MAX_CHARS = int(os.getenv("EMBED_BATCH_MAX_CHARS", "64000"))
+EMBED_TARGET_LATENCY = float(os.getenv("EMBED_TARGET_LATENCY", "2.0"))
+# Successful batches after which a ceiling set by a size error is lifted again
+CEILING_RESET_STREAK = 50
+
+_SIZE_ERROR_RE = re.compile(r"\b413\b|too large|context length|context window|input length", re.IGNORECASE)
+
+
+def is_size_error(error: Exception) -> bool:
+    """Whether a failed embedding call was rejected for the size of its batch."""
+    if getattr(error, "status_code", None) == 413:
+        return True
+    return bool(_SIZE_ERROR_RE.search(str(error)))
+
+
+class AdaptiveBatcher:
+    """Batch size controller shared by all embedding calls of a process."""
+
+    def __init__(self, start: int = EMBED_BATCH_START, minimum: int = EMBED_BATCH_MIN,
+                 maximum: int = EMBED_BATCH_MAX, max_chars: int = EMBED_BATCH_MAX_CHARS,
+                 target_latency: float = EMBED_TARGET_LATENCY):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.size = min(max(start, self.minimum), self.maximum)
+        self.max_chars = max_chars
+        self.target_latency = target_latency
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.items = 0
+        self.failures = 0
+        self.splits = 0
+        self.last_latency = None
+        # Largest batch size that worked before the last size error; growth past it is additive
+        self.ceiling = None
+        self._streak = 0
+
+    def _take(self, items, start: int, text) -> int:
+        """End index of the batch starting at items[start]."""
+        size = self.size
+        end, chars = start, 0
+        while end < len(items) and end - start < size:
+            n = len(text(items[end]))
+            if end > start and chars + n > self.max_chars:
+                break
+            chars += n
+            end += 1
+        return end
+
+    def batches(self, items, text=lambda item: item):
+        """Split items into batches of the current size and character budget."""
+        start = 0
+        while start < len(items):
+            end = self._take(items, start, text)
+            yield items[start:end]
+            start = end
+
+    def record(self, count: int, seconds: float):
+        """Move the batch size toward what fits into the target latency."""
+        with self._lock:
+            self.calls += 1
+            self.items += count
+            self.last_latency = seconds
+            ideal = count * self.target_latency / max(seconds, 1e-3)
+            # A partial batch says nothing about whether a larger one would still be fast
+            if count < self.size and ideal >= self.size:
+                return
+            size = int(round((self.size + ideal) / 2))
+            size = max(self.size // 2, min(size, self.size * 2))
+            self._streak += 1
+            if self.ceiling is not None and count > self.ceiling:
+                # A larger batch went through, so the ceiling moves up with it
+                self.ceiling = count
+            if self.ceiling is not None and self._streak >= CEILING_RESET_STREAK:
+                self.ceiling = None
+            if self.ceiling is not None and size > self.ceiling:
+                # Probe one step past the ceiling only after a run of successes
+                size = max(self.size, self.ceiling)
+                if self._streak % 10 == 0 and count >= self.size:
+                    size += 1
+            self.size = max(self.minimum, min(size, self.maximum))
+
+    def record_failure(self, count: int = None, size_error: bool = False):
+        """Halve the batch size; a size error also caps growth just below the failed batch."""
+        with self._lock:
+            self.failures += 1
+            self._streak = 0
+            if size_error and count is not None and count > 1:
+                self.ceiling = max(self.minimum, count - 1)
+            self.size = max(self.minimum, self.size // 2)
+
+    def run(self, texts: list, embed_fn, max_retries: int = 3) -> list:
+        """Embed texts with embed_fn(batch) -> vectors in adaptively sized batches.
+
+        After a failure the batch is retried at half the size after a short
+        jitter; only a batch that cannot shrink any further backs off
+        exponentially. Raises RuntimeError after max_retries consecutive failures.
+        """
+        vectors = []
+        start = 0
+        failures = 0
+        while start < len(texts):
+            end = self._take(texts, start, lambda t: t)
+            batch = texts[start:end]
+            began = time.monotonic()
+            try:
+                result = embed_fn(batch)
+            except Exception as e:
+                failures += 1
+                self.record_failure(len(batch), size_error=is_size_error(e))
+                if failures >= max_retries:
+                    raise RuntimeError(f"Failed to get embeddings after {max_retries} retries: {e}") from e
+                if len(batch) > 1:
+                    with self._lock:
+                        self.splits += 1
+                    print(f"[warning] Ollama embedding of {len(batch)} texts failed: {e}. Retrying in smaller batches")
+                    time.sleep(random.random() * 0.5)
+                else:
+                    wait = (2 ** (failures - 1)) + random.random()
+                    print(f"[warning] Ollama embedding failed (attempt {failures}): {e}. Retrying in {wait:.1f}s...")
+                    time.sleep(wait)
+                continue
+            failures = 0
+            self.record(len(batch), time.monotonic() - began)
+            vectors.extend(result)
+            start = end
+        return vectors
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batch_size": self.size,
+                "calls": self.calls,
+                "texts": self.items,
+                "failures": self.failures,
+                "splits": self.splits,
+                "ceiling": self.ceiling,
+                "last_latency_ms": round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+            }
@@ -0,0 +1,170 @@
+"""
+Structure-aware streaming chunker.
+Pages are read one at a time and split into paragraphs and sentences, which are
+packed into chunks up to a token budget with a configurable overlap. The chunker
+itself only holds the current page and the chunk being built. Ingestion still
+collects all chunks of a document: the manifest diff needs every chunk hash to
+tell which stored chunks went stale. That list is about the size of the
+document's text. Every chunk records the pages it spans and its character
+offsets in the document text (pages joined with newlines).
+"""
+import os
+import re
+import time
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+[\"')\]]*|\n|$)")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count: words and punctuation marks."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of text with at most max_tokens tokens."""
+    for i, match in enumerate(_TOKEN_RE.finditer(text)):
+        if i == max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def iter_pages(path, on_page=None):
+    """Yield (page_number, text) for each page of a PDF, starting at 1."""
+    from PyPDF2 import PdfReader
+    reader = PdfReader(path)
+    total = len(reader.pages)
+    for number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text() or ""
+        if on_page is not None:
+            on_page(number, total)
+        yield number, text
+
+
+def page_count(path) -> int:
+    """Number of pages of a PDF."""
+    from PyPDF2 import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def extract_page_range(path, start: int = 0, stop: int = None):
+    """Extract the text of pages [start, stop) (0-based, stop=None: to the end).
+    Runs inside ingestion worker processes.
+
+    Each call opens the PDF itself, so ranges of one document can be extracted
+    by several processes at once. Returns (texts, page count, seconds spent).
+    """
+    from PyPDF2 import PdfReader
+    started = time.perf_counter()
+    reader = PdfReader(path)
+    total = len(reader.pages)
+    stop = total if stop is None else min(stop, total)
+    texts = [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+    return texts, total, time.perf_counter() - started
+
+
+def _split_sentence(sentence: str, max_tokens: int) -> list:
+    """(start, end, tokens) pieces of a sentence over the budget, each at most max_tokens tokens.
+
+    Pieces end on word boundaries; words that alone exceed the budget (long code
+    lines, URLs) are split on token boundaries.
+    """
+    max_tokens = max(1, max_tokens)
+    spans = []
+    for word in re.finditer(r"\S+", sentence):
+        tokens = [m.span() for m in _TOKEN_RE.finditer(word.group())]
+        if len(tokens) <= max_tokens:
+            spans.append((word.start(), word.end(), len(tokens)))
+            continue
+        for k in range(0, len(tokens), max_tokens):
+            part = tokens[k:k + max_tokens]
+            spans.append((word.start() + part[0][0], word.start() + part[-1][1], len(part)))
+    pieces = []
+    for span_start, span_end, tokens in spans:
+        if pieces and pieces[-1][2] + tokens <= max_tokens:
+            pieces[-1] = (pieces[-1][0], span_end, pieces[-1][2] + tokens)
+        else:
+            pieces.append((span_start, span_end, tokens))
+    return pieces
+
+
+def _units(text: str, base: int, max_tokens: int):
+    """Split a page into (start, end, text, tokens, paragraph_end) sentence units."""
+    pos = 0
+    for para in _PARAGRAPH_RE.split(text):
+        para_start = text.find(para, pos)
+        pos = para_start + len(para)
+        sentences = [m for m in _SENTENCE_RE.finditer(para) if m.group().strip()]
+        for i, m in enumerate(sentences):
+            sentence = m.group().strip()
+            start = base + para_start + m.start() + (len(m.group()) - len(m.group().lstrip()))
+            last = i == len(sentences) - 1
+            tokens = count_tokens(sentence)
+            if tokens <= max_tokens:
+                yield start, start + len(sentence), sentence, tokens, last
+                continue
+            pieces = _split_sentence(sentence, max_tokens)
+            for j, (piece_start, piece_end, piece_tokens) in enumerate(pieces):
+                yield (start + piece_start, start + piece_end, sentence[piece_start:piece_end], piece_tokens,
+                       last and j == len(pieces) - 1)
+
+
+def chunk_pages(pages, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+    """Pack the sentences of an iterable of (page_number, text) into chunks.
+
+    Yields dicts with 'text', 'page_start', 'page_end', 'char_start', 'char_end'.
+    """
+    current = []  # (start, end, text, tokens, page)
+    size = 0
+    base = 0
+
+    def emit():
+        text = " ".join(u[2] for u in current)
+        return {
+            "text": text,
+            "page_start": current[0][4],
+            "page_end": current[-1][4],
+            "char_start": current[0][0],
+            "char_end": current[-1][1],
+        }
+
+    def carry_over():
+        # Trailing sentences of the previous chunk, up to the overlap budget
+        kept, total = [], 0
+        for unit in reversed(current):
+            if total + unit[3] > overlap_tokens:
+                break
+            kept.insert(0, unit)
+            total += unit[3]
+        return kept, total
+
+    fresh = 0  # sentences added since the last emitted chunk
+    for number, text in pages:
+        for start, end, sentence, tokens, paragraph_end in _units(text, base, max_tokens):
+            if fresh and size + tokens > max_tokens:
+                yield emit()
+                current, size = carry_over()
+                fresh = 0
+                if size + tokens > max_tokens:
+                    current, size = [], 0
+            current.append((start, end, sentence, tokens, number))
+            size += tokens
+            fresh += 1
+            # Prefer to end chunks at paragraph boundaries once they are reasonably full
+            if paragraph_end and size >= max_tokens * 0.75:
+                yield emit()
+                current, size = carry_over()
+                fresh = 0
+        base += len(text) + 1
+    if fresh:
+        yield emit()
+
+
+def chunk_pdf(path, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS, on_page=None):
+    """Stream the chunks of a PDF page by page."""
+    return chunk_pages(iter_pages(path, on_page), max_tokens, overlap_tokens)
+
@@ -0,0 +1,27 @@
+"""
+Settings shared by the web app, ingest_pdf.py and chat.py.
+Read from the environment when first imported; entry points load .env
+(python-dotenv) before importing the rag package. Settings of a single
+component (caches, indexes, batching) live in that component's module.
+"""
+import os
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+EMBEDDING_MODEL = "nomic-embed-text"
+# nomic-embed-text produces 768-dimensional vectors
+EMBEDDING_DIM = 768
+CHAT_MODEL = "r1"
+COLLECTION = "docs"
+PDF_FOLDER = os.getenv("PDF_FOLDER", "pdfs")
+# Points per vector store upsert
+MAX_UPSERT = 500
+# How long Ollama keeps a model loaded after a request ("30m", "-1" for ever);
+# unset leaves Ollama's default of five minutes
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE") or None
+if OLLAMA_KEEP_ALIVE and OLLAMA_KEEP_ALIVE.lstrip("-").isdigit():
+    # Plain numbers are seconds
+    OLLAMA_KEEP_ALIVE = int(OLLAMA_KEEP_ALIVE)
+USE_MOCK = os.getenv("USE_MOCK", "0").lower() in ("1", "true", "yes")
+# Canned answer of the chat model in mock mode
+MOCK_ANSWER = "[MOCK] This is a mock response."
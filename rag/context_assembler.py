@@ -0,0 +1,197 @@
+"""
+Prompt context assembly.
+Retrieved hits often repeat themselves: the same chunk ingested under two file
+names, chunks that differ only in whitespace, and neighbouring chunks that share
+their overlap sentences. Every repeated token lengthens r1's prefill. The
+assembler walks the hits in score order, drops exact and near duplicates, merges
+neighbouring chunks of a document into one passage, and stops when the token
+budget or the chunk limit is reached.
+"""
+import os
+import re
+import hashlib
+import threading
+
+from .chunker import count_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Share of a chunk's word 3-grams found in a kept chunk above which it counts as a near duplicate
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+_WORD = re.compile(r"\w+")
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).lower().encode("utf-8")).hexdigest()
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) <= n:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _join(first: str, second: str, overlap: int) -> str:
+    """Concatenate two chunk texts, dropping the overlap the second repeats from the first.
+
+    overlap is the length of the chunks' shared character range in the document.
+    Chunk texts join their sentences with single spaces, so where the document
+    had other whitespace the cut misses and the repeated text is searched for.
+    """
+    if overlap <= 0:
+        return f"{first} {second}"
+    if first.endswith(second[:overlap]):
+        return first + second[overlap:]
+    probe = second[:min(40, overlap)]
+    start = first.find(probe)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return first + second[len(first) - start:]
+        start = first.find(probe, start + 1)
+    return f"{first} {second}"
+
+
+class _Passage:
+    """One or more neighbouring chunks of a document, in document order."""
+
+    def __init__(self, hit: dict, payload: dict, tokens: int):
+        self.hits = [hit]
+        self.source = payload.get("source")
+        self.text = payload["text"]
+        self.tokens = tokens
+        self.score = hit.get("score") or 0.0
+        self.page_start = payload.get("page_start")
+        self.page_end = payload.get("page_end")
+        self.char_start = payload.get("char_start")
+        self.char_end = payload.get("char_end")
+
+    def adjacent(self, payload: dict) -> bool:
+        """Whether a chunk overlaps or directly follows/precedes this passage in the same document."""
+        start, end = payload.get("char_start"), payload.get("char_end")
+        if payload.get("source") != self.source or None in (start, end, self.char_start, self.char_end):
+            return False
+        return start <= self.char_end + 1 and end >= self.char_start - 1
+
+    def joined(self, payload: dict) -> str:
+        """The passage text with a neighbouring chunk added on the side it belongs."""
+        if payload["char_start"] >= self.char_start and payload["char_end"] <= self.char_end:
+            return self.text
+        if payload["char_start"] < self.char_start:
+            return _join(payload["text"], self.text, payload["char_end"] - self.char_start)
+        return _join(self.text, payload["text"], self.char_end - payload["char_start"])
+
+    def merge(self, hit: dict, payload: dict, text: str, tokens: int):
+        self.hits.append(hit)
+        self.text = text
+        self.tokens = tokens
+        self.char_start = min(self.char_start, payload["char_start"])
+        self.char_end = max(self.char_end, payload["char_end"])
+        starts = [p for p in (self.page_start, payload.get("page_start")) if p is not None]
+        ends = [p for p in (self.page_end, payload.get("page_end")) if p is not None]
+        self.page_start = min(starts) if starts else None
+        self.page_end = max(ends) if ends else None
+
+
+class ContextStats:
+    """Totals over every assembled context, for /api/status and /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contexts = 0
+        self.tokens = 0
+        self.saved_tokens = 0
+        self.duplicates = 0
+        self.merged = 0
+
+    def add(self, report: dict):
+        with self._lock:
+            self.contexts += 1
+            self.tokens += report["tokens"]
+            self.saved_tokens += max(0, report["saved_tokens"])
+            self.duplicates += report["duplicates"]
+            self.merged += report["merged"]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "contexts": self.contexts,
+                "tokens": self.tokens,
+                "saved_tokens": self.saved_tokens,
+                "duplicates": self.duplicates,
+                "merged": self.merged,
+            }
+
+
+context_stats = ContextStats()
+
+
+def assemble(hits: list, limit: int = 5, budget: int = CONTEXT_TOKEN_BUDGET,
+             threshold: float = NEAR_DUPLICATE_THRESHOLD):
+    """Build the prompt context from hits ordered best first.
+
+    At most limit chunks are used and the context stays within budget tokens;
+    chunks that do not fit are skipped in favour of later, smaller ones.
+    Returns (passages, report): passages as dicts with 'text', 'source',
+    'score', 'page_start', 'page_end' and 'hits', best first; the report counts
+    tokens used, tokens saved against joining the first limit hits as they are,
+    and duplicates, merges and budget drops.
+    """
+    report = {"tokens": 0, "baseline_tokens": 0, "saved_tokens": 0, "duplicates": 0, "merged": 0, "dropped": 0}
+    passages = []
+    seen = set()
+    kept_shingles = []
+    used = 0
+    for rank, hit in enumerate(hits):
+        payload = hit.get("payload")
+        if not isinstance(payload, dict) or "text" not in payload:
+            continue
+        text = payload["text"]
+        tokens = count_tokens(text)
+        if rank < limit:
+            report["baseline_tokens"] += tokens
+        if used >= limit:
+            continue
+        # Exact duplicates: identical text, whatever the source or point ID
+        fingerprint = _fingerprint(text)
+        if fingerprint in seen:
+            report["duplicates"] += 1
+            continue
+        shingles = _shingles(text)
+        if any(len(shingles & kept) >= threshold * len(shingles) for kept in kept_shingles):
+            report["duplicates"] += 1
+            continue
+        neighbour = next((p for p in passages if p.adjacent(payload)), None)
+        if neighbour is not None:
+            text = neighbour.joined(payload)
+            merged_tokens = count_tokens(text)
+            grown = merged_tokens - neighbour.tokens
+            if report["tokens"] + grown > budget:
+                report["dropped"] += 1
+                continue
+            neighbour.merge(hit, payload, text, merged_tokens)
+            report["tokens"] += grown
+            report["merged"] += 1
+        else:
+            if report["tokens"] + tokens > budget:
+                report["dropped"] += 1
+                continue
+            passages.append(_Passage(hit, payload, tokens))
+            report["tokens"] += tokens
+        seen.add(fingerprint)
+        kept_shingles.append(shingles)
+        used += 1
+    report["saved_tokens"] = report["baseline_tokens"] - report["tokens"]
+    context_stats.add(report)
+    passages.sort(key=lambda p: -p.score)
+    return [
+        {
+            "text": p.text,
+            "source": p.source,
+            "score": p.score,
+            "page_start": p.page_start,
+            "page_end": p.page_end,
+            "hits": p.hits,
+        }
+        for p in passages
+    ], report
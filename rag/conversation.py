@@ -0,0 +1,110 @@
+"""
+Conversation history for multi-turn chat.
+The last CHAT_HISTORY_TURNS question/answer pairs are sent to the model
+verbatim; older turns are folded into a running summary of at most
+CHAT_SUMMARY_TOKENS tokens. Answers are clipped to CHAT_TURN_TOKENS, so the
+history part of the prompt stays the same size however long the conversation
+gets. Folding runs in a background thread while the next question is typed.
+"""
+import os
+import re
+import threading
+
+from .chunker import count_tokens, truncate_tokens
+
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "3"))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "200"))
+CHAT_TURN_TOKENS = int(os.getenv("CHAT_TURN_TOKENS", "300"))
+
+# r1 writes its reasoning between <think> tags before the answer
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+
+def strip_reasoning(answer: str) -> str:
+    return _THINK_RE.sub("", answer).strip()
+
+
+def summary_prompt(summary: str, turns: list, max_tokens: int) -> str:
+    """Prompt asking the chat model to fold turns into the existing summary."""
+    lines = [f"Summary so far:\n{summary}\n"] if summary else []
+    for question, answer in turns:
+        lines.append(f"User: {question}\nAssistant: {answer}\n")
+    return (
+        f"Summarize this conversation in at most {max_tokens} words. Keep names, numbers, "
+        "facts from documents and open questions; leave out greetings and filler.\n\n"
+        + "\n".join(lines)
+    )
+
+
+class Conversation:
+    """Bounded chat history: recent turns verbatim plus a summary of the rest.
+
+    summarize(prompt) returns the model's summary; without it, or when it
+    fails, older turns are kept as clipped text instead.
+    """
+
+    def __init__(self, summarize=None, max_turns: int = CHAT_HISTORY_TURNS,
+                 summary_tokens: int = CHAT_SUMMARY_TOKENS, turn_tokens: int = CHAT_TURN_TOKENS):
+        self.summarize = summarize
+        self.max_turns = max(0, max_turns)
+        self.summary_tokens = summary_tokens
+        self.turn_tokens = turn_tokens
+        self.turns = []
+        self.summary = ""
+        self.folded = 0
+        self._lock = threading.Lock()
+        self._folding = None
+
+    def add(self, question: str, answer: str):
+        """Record a finished turn; turns beyond max_turns are summarized in the background."""
+        answer = truncate_tokens(strip_reasoning(answer), self.turn_tokens)
+        with self._lock:
+            self.turns.append((question, answer))
+            if len(self.turns) <= self.max_turns:
+                return
+            split = len(self.turns) - self.max_turns
+            old, self.turns = self.turns[:split], self.turns[split:]
+            previous = self._folding
+            self._folding = threading.Thread(target=self._fold, args=(old, previous), daemon=True)
+            self._folding.start()
+
+    def _fold(self, turns: list, previous):
+        # Folds happen in order, each on top of the summary of the one before
+        if previous is not None:
+            previous.join()
+        summary = None
+        if self.summarize is not None:
+            try:
+                summary = strip_reasoning(self.summarize(summary_prompt(self.summary, turns, self.summary_tokens)))
+            except Exception as e:
+                print(f"[warning] could not summarize the conversation: {e}")
+        if not summary:
+            # Keep the newest text when clipping, it is the most likely to be referred to
+            parts = [self.summary] + [f"{q} {a}" for q, a in turns]
+            summary = " ".join(p for p in parts if p)
+            words = summary.split()
+            while words and count_tokens(" ".join(words)) > self.summary_tokens:
+                words = words[max(1, len(words) // 10):]
+            summary = " ".join(words)
+        with self._lock:
+            self.summary = truncate_tokens(summary, self.summary_tokens)
+            self.folded += len(turns)
+
+    def messages(self) -> list:
+        """Chat messages to send before the next question."""
+        with self._lock:
+            folding = self._folding
+        if folding is not None:
+            folding.join()
+        with self._lock:
+            messages = []
+            if self.summary:
+                messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+            for question, answer in self.turns:
+                messages.append({"role": "user", "content": question})
+                messages.append({"role": "assistant", "content": answer})
+            return messages
+
+    def tokens(self) -> int:
+        """Approximate size of the history part of the prompt."""
+        return sum(count_tokens(m["content"]) for m in self.messages())
@@ -0,0 +1,173 @@
+"""
+Micro-batching embedding scheduler.
+Under concurrent chat traffic every request used to embed its question on its
+own, so Ollama saw a stream of batch-of-one calls. Requests now hand their texts
+to the scheduler, which waits a few milliseconds for other requests to arrive and
+sends everything collected as one embed call. Interactive texts (questions) are
+always served before bulk texts (upload ingestion), and bulk batches never
+occupy every dispatcher, so a long upload cannot hold up chat.
+"""
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from .metrics import record
+
+EMBED_SCHEDULER_ENABLED = os.getenv("EMBED_SCHEDULER", "1").lower() in ("1", "true", "yes")
+# How long the first waiting question is held back for others to join its batch
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_SCHEDULER_MAX_BATCH = int(os.getenv("EMBED_SCHEDULER_MAX_BATCH", "64"))
+# Threads sending batches to Ollama, i.e. its concurrent embedding calls; bulk batches may use
+# all but one of them. serve.py --embed-concurrency (OLLAMA_EMBED_CONCURRENCY) sets it when it is not set itself.
+EMBED_SCHEDULER_WORKERS = int(os.getenv("EMBED_SCHEDULER_WORKERS", os.getenv("OLLAMA_EMBED_CONCURRENCY", "2")))
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+class _Request:
+    def __init__(self, texts: list, priority: str):
+        self.texts = list(texts)
+        self.priority = priority
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        self.dispatched = None
+
+
+class EmbeddingScheduler:
+    """Collects texts from concurrent callers into batches for embed_fn(texts) -> vectors."""
+
+    def __init__(self, embed_fn, window_ms: float = EMBED_BATCH_WINDOW_MS, max_batch: int = EMBED_SCHEDULER_MAX_BATCH,
+                 workers: int = EMBED_SCHEDULER_WORKERS):
+        self.embed_fn = embed_fn
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self.workers = max(1, workers)
+        self._cond = threading.Condition()
+        self._queues = {INTERACTIVE: deque(), BULK: deque()}
+        self._bulk_running = 0
+        self._threads = []
+        self.batches = {INTERACTIVE: 0, BULK: 0}
+        self.texts = {INTERACTIVE: 0, BULK: 0}
+        self.requests = {INTERACTIVE: 0, BULK: 0}
+        self.largest = 0
+
+    def _start(self):
+        # Started on first use, so importing the module does not spawn threads
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, daemon=True, name=f"embed-scheduler-{i}")
+            thread.start()
+            self._threads.append(thread)
+
+    def _enqueue(self, request: _Request) -> Future:
+        if not request.texts:
+            request.future.set_result([])
+            return request.future
+        with self._cond:
+            self._start()
+            self._queues[request.priority].append(request)
+            self._cond.notify_all()
+        return request.future
+
+    def submit(self, texts: list, priority: str = INTERACTIVE) -> Future:
+        """Queue texts for embedding; the future resolves to their vectors in order."""
+        return self._enqueue(_Request(texts, priority))
+
+    def embed(self, texts: list, priority: str = INTERACTIVE) -> list:
+        """Embed texts together with whatever other callers submit at the same time."""
+        request = _Request(texts, priority)
+        vectors = self._enqueue(request).result()
+        if request.dispatched is not None:
+            record("embed_queue", request.dispatched - request.submitted)
+        return vectors
+
+    def _take(self):
+        """Wait for the next batch; returns (priority, requests)."""
+        with self._cond:
+            while True:
+                interactive = self._queues[INTERACTIVE]
+                if interactive:
+                    # Hold the batch open until the window of its oldest question ends or it is full
+                    deadline = interactive[0].submitted + self.window
+                    while interactive and sum(len(r.texts) for r in interactive) < self.max_batch:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    if interactive:
+                        return INTERACTIVE, self._pop(interactive)
+                    continue
+                bulk = self._queues[BULK]
+                # One dispatcher always stays free for questions (unless there is only one)
+                if bulk and (self._bulk_running < self.workers - 1 or self.workers == 1):
+                    self._bulk_running += 1
+                    return BULK, self._pop(bulk)
+                self._cond.wait()
+
+    def _pop(self, queue: deque) -> list:
+        """Whole requests from the front of queue, up to max_batch texts (at least one request)."""
+        requests = [queue.popleft()]
+        size = len(requests[0].texts)
+        while queue and size + len(queue[0].texts) <= self.max_batch:
+            size += len(queue[0].texts)
+            requests.append(queue.popleft())
+        return requests
+
+    def _run(self):
+        while True:
+            priority, requests = self._take()
+            try:
+                self._dispatch(priority, requests)
+            finally:
+                if priority == BULK:
+                    with self._cond:
+                        self._bulk_running -= 1
+                        self._cond.notify_all()
+
+    def _dispatch(self, priority: str, requests: list):
+        texts = [text for request in requests for text in request.texts]
+        now = time.perf_counter()
+        for request in requests:
+            request.dispatched = now
+        with self._cond:
+            self.batches[priority] += 1
+            self.texts[priority] += len(texts)
+            self.requests[priority] += len(requests)
+            self.largest = max(self.largest, len(texts))
+        try:
+            vectors = self.embed_fn(texts)
+            if len(vectors) != len(texts):
+                raise RuntimeError(f"expected {len(texts)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        start = 0
+        for request in requests:
+            end = start + len(request.texts)
+            request.future.set_result(vectors[start:end])
+            start = end
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "enabled": True,
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "workers": self.workers,
+                "queued": {p: sum(len(r.texts) for r in q) for p, q in self._queues.items()},
+                "largest_batch": self.largest,
+                **{
+                    p: {
+                        "batches": self.batches[p],
+                        "requests": self.requests[p],
+                        "texts": self.texts[p],
+                        "mean_batch": round(self.texts[p] / self.batches[p], 2) if self.batches[p] else None,
+                    }
+                    for p in (INTERACTIVE, BULK)
+                },
+            }
@@ -0,0 +1,69 @@
+"""
+Text embeddings with nomic-embed-text.
+An Embedder strings together the steps every caller used to repeat: mock
+vectors in USE_MOCK mode, one embedding per distinct text, the persistent
+embedding cache, optionally the micro-batching scheduler, and adaptively sized
+Ollama requests.
+"""
+from .config import EMBEDDING_MODEL, USE_MOCK, OLLAMA_KEEP_ALIVE
+from .adaptive_batch import AdaptiveBatcher
+from .embedding_cache import get_cache
+from .single_flight import EmbeddingCoalescer
+from .embed_scheduler import EmbeddingScheduler, INTERACTIVE
+from .ollama_client import get_ollama_client
+from .metrics import span
+
+
+class Embedder:
+    """Embedding pipeline of one process."""
+
+    def __init__(self, batcher: AdaptiveBatcher = None, keep_alive=OLLAMA_KEEP_ALIVE):
+        # Embedding batch size adapts to Ollama's latency and the text lengths
+        self.batcher = batcher or AdaptiveBatcher()
+        # Repeated texts within and across concurrent embedding batches are embedded once
+        self.coalescer = EmbeddingCoalescer()
+        self.scheduler = None
+        # Passed to Ollama with every embed request (see OLLAMA_KEEP_ALIVE)
+        self.keep_alive = keep_alive
+
+    def use_scheduler(self, **kwargs) -> EmbeddingScheduler:
+        """Send cache misses through a micro-batching scheduler (see embed_scheduler)."""
+        self.scheduler = EmbeddingScheduler(self.ollama_embed, **kwargs)
+        return self.scheduler
+
+    def embed_batch(self, texts: list, max_retries: int = 3, priority: str = INTERACTIVE):
+        """Generate embeddings using Ollama with nomic-embed-text model.
+
+        Questions use the INTERACTIVE priority and ingestion BULK; with the
+        scheduler on, interactive texts are sent to Ollama first.
+        """
+        return self.coalescer.embed(texts, lambda distinct: self.embed_distinct(distinct, max_retries, priority))
+
+    def embed_distinct(self, texts: list, max_retries: int = 3, priority: str = INTERACTIVE):
+        if USE_MOCK:
+            from .mock_embedder import mock_embed
+            return mock_embed(texts)
+
+        if self.scheduler is not None:
+            send = lambda misses: self.scheduler.embed(misses, priority)
+        else:
+            send = lambda misses: self.ollama_embed(misses, max_retries)
+        cache = get_cache()
+        if cache is None:
+            return send(texts)
+        # Only cache misses are sent to Ollama
+        return cache.embed(EMBEDDING_MODEL, texts, send)
+
+    def ollama_embed(self, texts: list, max_retries: int = 3):
+        """Call Ollama's embed endpoint in batches sized from observed latency."""
+        client = get_ollama_client()
+        with span("ollama_embed"):
+            return self.batcher.run(
+                texts,
+                lambda batch: client.embed(model=EMBEDDING_MODEL, input=batch, keep_alive=self.keep_alive)['embeddings'],
+                max_retries,
+            )
+
+    def embed(self, text: str):
+        """Embed a single text."""
+        return self.embed_batch([text])[0]
@@ -0,0 +1,160 @@
+"""
+Persistent content-addressed embedding cache.
+Vectors are keyed by (model name, hash of the normalized text), kept in an
+in-process LRU and stored as float32 blobs in SQLite so they survive restarts.
+"""
+import os
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE", "1").lower() in ("1", "true", "yes")
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite3"))
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so that trivially different copies of a text share a key."""
+    return " ".join(text.split())
+
+
+def text_key(model: str, text: str) -> str:
+    """Content address of a text for a given embedding model."""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """LRU front over an SQLite store of float32 vectors."""
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, capacity: int = EMBED_CACHE_SIZE):
+        self.path = path
+        self.capacity = capacity
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _db(self):
+        # Connections must not be shared across fork(), so reopen in child processes.
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dim INTEGER, vector BLOB)"
+            )
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _remember(self, key, vec):
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def get_many(self, model: str, texts: list):
+        """Return cached vectors for texts, with None for every miss."""
+        keys = [text_key(model, t) for t in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+            self.memory_hits += sum(1 for k in keys if k in found)
+            pending = [k for k in dict.fromkeys(keys) if k not in found]
+            if pending:
+                try:
+                    db = self._db()
+                    for i in range(0, len(pending), 500):
+                        part = pending[i:i + 500]
+                        rows = db.execute(
+                            f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                            part,
+                        ).fetchall()
+                        for key, blob in rows:
+                            vec = array("f")
+                            vec.frombytes(blob)
+                            found[key] = vec.tolist()
+                            self._remember(key, found[key])
+                except sqlite3.Error as e:
+                    print(f"[warning] embedding cache read failed: {e}")
+            self.disk_hits += sum(1 for k in keys if k in found and k in pending)
+            self.misses += sum(1 for k in keys if k not in found)
+        return [found.get(k) for k in keys]
+
+    def put_many(self, model: str, texts: list, vectors: list):
+        """Store freshly computed vectors in both the LRU and the on-disk store."""
+        rows = []
+        with self._lock:
+            for text, vec in zip(texts, vectors):
+                if vec is None:
+                    continue
+                key = text_key(model, text)
+                self._remember(key, list(vec))
+                rows.append((key, len(vec), array("f", vec).tobytes()))
+            if not rows:
+                return
+            try:
+                db = self._db()
+                db.executemany("INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)", rows)
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"[warning] embedding cache write failed: {e}")
+
+    def embed(self, model: str, texts: list, embed_fn):
+        """Embed texts, sending only cache misses (deduplicated) to embed_fn."""
+        vectors = self.get_many(model, texts)
+        missing = {}
+        for i, vec in enumerate(vectors):
+            if vec is None:
+                missing.setdefault(normalize_text(texts[i]), []).append(i)
+        if missing:
+            miss_texts = [texts[idx[0]] for idx in missing.values()]
+            fresh = embed_fn(miss_texts)
+            self.put_many(model, miss_texts, fresh)
+            for idx, vec in zip(missing.values(), fresh):
+                for i in idx:
+                    vectors[i] = vec
+        return vectors
+
+    def stats(self):
+        """Hit/miss counters for status reporting."""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "enabled": True,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._lru),
+            }
+
+
+_default_cache = None
+
+
+def get_cache():
+    """Process-wide cache instance, or None when EMBED_CACHE=0."""
+    global _default_cache
+    if not EMBED_CACHE_ENABLED:
+        return None
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+    return _default_cache
+
+
+def cache_stats():
+    cache = get_cache()
+    return cache.stats() if cache else {"enabled": False}
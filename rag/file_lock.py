@@ -0,0 +1,49 @@
+"""
+Locks between processes, held on a lock file next to the data they guard.
+The local vector store, the keyword index and collection versions are written
+by several processes at once: upload jobs of the web app, ingest_pdf.py,
+snapshot.py and serve.py workers. A writer holds the lock from reloading what
+others wrote until its own write is on disk, so it never numbers rows or
+segments from a stale view. Readers that must not see files replaced under
+them take the lock shared.
+"""
+import os
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextlib.contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Hold a lock on path (created if missing) for the duration of the block.
+
+    Locks are per open file, so a process must not take the same lock again
+    while it holds it. On Windows shared locks are exclusive.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    # Gives up after 10 seconds of retrying, so keep waiting
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
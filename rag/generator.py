@@ -0,0 +1,69 @@
+"""
+Answer generation with the r1 chat model.
+Both completion functions take the earlier turns of a conversation as chat
+messages (see conversation.py) and Ollama's keep_alive for the model.
+"""
+from .config import CHAT_MODEL, USE_MOCK, MOCK_ANSWER, OLLAMA_KEEP_ALIVE
+from .ollama_client import get_ollama_client
+
+
+def build_prompt(question: str, context: str):
+    """Build the r1 prompt, with or without retrieved context."""
+    if context:
+        return f"""Use only this information to answer the question:
+{context}
+
+Question:
+{question}
+"""
+    return f"""Question:
+{question}
+
+Note: No specific context available. Please provide a general answer.
+"""
+
+
+def _messages(prompt: str, history):
+    return [*(history or ()), {"role": "user", "content": prompt}]
+
+
+def chat_completion(prompt: str, history: list = None, keep_alive=OLLAMA_KEEP_ALIVE):
+    """Generate chat completion using Ollama with r1 model."""
+    if USE_MOCK:
+        return {"choices": [{"message": {"content": MOCK_ANSWER}}]}
+    try:
+        response = get_ollama_client().chat(
+            model=CHAT_MODEL,
+            messages=_messages(prompt, history),
+            keep_alive=keep_alive
+        )
+        # Convert Ollama response format to OpenAI-like format for compatibility
+        return {
+            "choices": [{
+                "message": {
+                    "content": response['message']['content']
+                }
+            }]
+        }
+    except Exception as e:
+        raise RuntimeError(f"Ollama chat completion failed: {e}") from e
+
+
+def chat_completion_stream(prompt: str, history: list = None, keep_alive=OLLAMA_KEEP_ALIVE):
+    """Yield the r1 answer piece by piece as Ollama generates it."""
+    if USE_MOCK:
+        for word in MOCK_ANSWER.split(" "):
+            yield word + " "
+        return
+    try:
+        for part in get_ollama_client().chat(
+            model=CHAT_MODEL,
+            messages=_messages(prompt, history),
+            stream=True,
+            keep_alive=keep_alive
+        ):
+            content = part['message']['content']
+            if content:
+                yield content
+    except Exception as e:
+        raise RuntimeError(f"Ollama chat completion failed: {e}") from e
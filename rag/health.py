@@ -0,0 +1,158 @@
+"""
+Background health monitoring for the Qdrant and Ollama backends.
+Each backend is probed on its own thread at a fixed interval, and request
+handlers read the cached result instead of probing on every request. A circuit
+breaker lets the chat path skip a backend right away once it is marked down,
+while the background probe keeps checking for recovery.
+"""
+import os
+import time
+import threading
+
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "10"))
+HEALTH_RETRY_INTERVAL = float(os.getenv("HEALTH_RETRY_INTERVAL", "2"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; closed again by a successful probe."""
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, on_open=None):
+        self.failure_threshold = failure_threshold
+        self.on_open = on_open
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.is_open = False
+        self.opened_at = None
+        self.trips = 0
+
+    def allow(self) -> bool:
+        return not self.is_open
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.is_open = False
+            self.opened_at = None
+
+    def record_failure(self, force: bool = False):
+        with self._lock:
+            self.failures += 1
+            if self.is_open or (self.failures < self.failure_threshold and not force):
+                return
+            self.is_open = True
+            self.opened_at = time.time()
+            self.trips += 1
+        if self.on_open:
+            self.on_open()
+
+    def state(self):
+        with self._lock:
+            return {
+                "state": "open" if self.is_open else "closed",
+                "consecutive_failures": self.failures,
+                "opened_at": self.opened_at,
+                "trips": self.trips,
+            }
+
+
+class HealthMonitor:
+    """Runs probes in the background and caches their latest result."""
+
+    def __init__(self, interval: float = HEALTH_INTERVAL, retry_interval: float = HEALTH_RETRY_INTERVAL):
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self._checks = {}
+        self._status = {}
+        self._wake = {}
+        self._ready = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+
+    def add_check(self, name: str, probe, breaker: CircuitBreaker = None):
+        """Register a probe. It returns an info dict (or None) when healthy and raises or returns False otherwise."""
+        self._checks[name] = (probe, breaker)
+        self._wake[name] = threading.Event()
+        self._ready[name] = threading.Event()
+        self._status[name] = {"ok": False, "checked_at": None, "latency_ms": None, "info": {}, "error": None}
+        if breaker is not None and breaker.on_open is None:
+            breaker.on_open = lambda: self.refresh(name)
+
+    def breaker(self, name: str):
+        return self._checks[name][1]
+
+    def _probe(self, name):
+        probe, breaker = self._checks[name]
+        started = time.perf_counter()
+        try:
+            info = probe()
+            ok = info is not False
+            error = None if ok else "probe failed"
+        except Exception as e:
+            ok, info, error = False, None, str(e)
+        with self._lock:
+            self._status[name] = {
+                "ok": ok,
+                "checked_at": time.time(),
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                "info": info if isinstance(info, dict) else {},
+                "error": error,
+            }
+        if breaker is not None:
+            if ok:
+                breaker.record_success()
+            else:
+                breaker.record_failure(force=True)
+        return ok
+
+    def _loop(self, name):
+        while True:
+            ok = self._probe(name)
+            self._ready[name].set()
+            wake = self._wake[name]
+            # Probe more often while a backend is down so recovery is noticed quickly
+            wake.wait(self.interval if ok else self.retry_interval)
+            wake.clear()
+
+    def start(self, timeout: float = 5):
+        """Start the probe threads and wait (bounded) for their first results."""
+        if self._started:
+            return self
+        with self._start_lock:
+            if not self._started:
+                for name in self._checks:
+                    threading.Thread(target=self._loop, args=(name,), daemon=True, name=f"health-{name}").start()
+                deadline = time.monotonic() + timeout
+                for name in self._checks:
+                    self._ready[name].wait(max(0.0, deadline - time.monotonic()))
+                self._started = True
+        return self
+
+    def refresh(self, name: str = None):
+        """Ask the background thread(s) to probe now instead of waiting for the interval."""
+        for key in ([name] if name else list(self._wake)):
+            self._wake[key].set()
+
+    def is_up(self, name: str) -> bool:
+        """Cached health, also false while the circuit breaker is open."""
+        self.start()
+        breaker = self._checks[name][1]
+        if breaker is not None and not breaker.allow():
+            return False
+        with self._lock:
+            return self._status[name]["ok"]
+
+    def info(self, name: str) -> dict:
+        self.start()
+        with self._lock:
+            return dict(self._status[name]["info"])
+
+    def snapshot(self) -> dict:
+        self.start()
+        with self._lock:
+            result = {name: dict(status) for name, status in self._status.items()}
+        for name, (_, breaker) in self._checks.items():
+            if breaker is not None:
+                result[name]["circuit"] = breaker.state()
+        return result
@@ -0,0 +1,148 @@
+"""
+Ingestion manifest for incremental re-ingestion.
+Records file hash, mtime and chunk hashes per document so unchanged documents
+are skipped and only new chunks are embedded. Point IDs are derived from
+(source, chunk hash), which makes re-upserting the same chunk idempotent.
+ingest_pdf.py, upload jobs of the web app and snapshot.py write the same
+manifest, so saving merges this instance's changes into the file on disk under
+a lock file instead of overwriting the entries others recorded meanwhile.
+"""
+import os
+import json
+import uuid
+import hashlib
+import tempfile
+import threading
+
+from .file_lock import file_lock
+MANIFEST_DIR = os.getenv("INGEST_MANIFEST_DIR", ".cache")
+
+# Fixed namespace so point IDs are stable across machines and runs
+POINT_NAMESPACE = uuid.UUID("6f1c9a52-8d0e-4c4b-9a57-3f1e2b7d5c10")
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def point_id(source: str, digest: str) -> str:
+    """Deterministic Qdrant point ID for a chunk of a document."""
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{source}\0{digest}"))
+
+
+class DocumentPlan:
+    """What has to happen to one document to bring the collection up to date."""
+
+    def __init__(self, source, entry, chunks, new_chunks, stale_ids, is_new):
+        self.source = source
+        self.entry = entry
+        self.chunks = chunks  # every chunk of the document: [(point_id, chunk_hash, chunk dict)]
+        self.new_chunks = new_chunks  # the ones not yet in the collection
+        self.stale_ids = stale_ids
+        self.is_new = is_new
+
+
+class IngestManifest:
+    """JSON manifest of ingested documents for one collection."""
+
+    def __init__(self, collection: str, path: str = None):
+        self.path = path or os.path.join(MANIFEST_DIR, f"manifest-{collection}.json")
+        self.lock_path = self.path + ".lock"
+        self._lock = threading.Lock()
+        # source -> entry recorded, or None if forgotten, since the last save
+        self._changes = {}
+        self.documents = {}
+        if os.path.exists(self.path):
+            with file_lock(self.lock_path, shared=True):
+                self.documents = self._read()
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("documents", {})
+        except (OSError, ValueError) as e:
+            print(f"[warning] ignoring unreadable manifest {self.path}: {e}")
+            return {}
+
+    def sources(self):
+        with self._lock:
+            return set(self.documents)
+
+    def is_unchanged(self, source: str, path: str) -> bool:
+        """Cheap check on size and mtime, confirmed by the file hash when only the mtime moved."""
+        with self._lock:
+            entry = self.documents.get(source)
+        if not entry:
+            return False
+        st = os.stat(path)
+        if st.st_size != entry.get("size"):
+            return False
+        if st.st_mtime == entry.get("mtime"):
+            return True
+        if file_sha256(path) == entry.get("sha256"):
+            with self._lock:
+                entry["mtime"] = st.st_mtime
+                self._changes[source] = entry
+            return True
+        return False
+
+    def plan(self, source: str, path: str, chunks: list, sha256: str = None) -> DocumentPlan:
+        """Diff the document's chunks (dicts with a 'text' key) against the manifest."""
+        st = os.stat(path)
+        by_hash = {}
+        for c in chunks:
+            by_hash.setdefault(chunk_hash(c["text"]), c)
+        hashes = list(by_hash)
+        with self._lock:
+            old = self.documents.get(source)
+        old_hashes = set(old["chunks"]) if old else set()
+        chunks = [(point_id(source, h), h, by_hash[h]) for h in hashes]
+        new_chunks = [c for c in chunks if c[1] not in old_hashes]
+        stale_ids = [point_id(source, h) for h in old_hashes - set(hashes)]
+        entry = {
+            "sha256": sha256 or file_sha256(path),
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+            "chunks": hashes,
+        }
+        return DocumentPlan(source, entry, chunks, new_chunks, stale_ids, old is None)
+
+    def record(self, source: str, entry: dict):
+        with self._lock:
+            self.documents[source] = entry
+            self._changes[source] = entry
+
+    def forget(self, source: str):
+        with self._lock:
+            self.documents.pop(source, None)
+            self._changes[source] = None
+
+    def save(self):
+        """Merge the changes since the last save into the manifest on disk, atomically."""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with file_lock(self.lock_path):
+            documents = self._read()
+            with self._lock:
+                changes, self._changes = self._changes, {}
+                for source, entry in changes.items():
+                    if entry is None:
+                        documents.pop(source, None)
+                    else:
+                        documents[source] = entry
+                self.documents = documents
+                data = json.dumps({"documents": documents})
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
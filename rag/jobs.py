@@ -0,0 +1,141 @@
+"""
+Background job queue for long-running work such as PDF ingestion.
+Jobs are processed by a fixed pool of worker threads from a bounded queue and
+report progress counters that can be polled while they run.
+"""
+import os
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "16"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "100"))
+
+
+class QueueFull(Exception):
+    """Raised when no more jobs can be accepted."""
+
+
+class Job:
+    """A unit of background work and its progress."""
+
+    def __init__(self, kind: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def update(self, **progress):
+        """Set progress counters."""
+        with self._lock:
+            self.progress.update(progress)
+
+    def advance(self, key: str, amount: int = 1):
+        """Increment a progress counter."""
+        with self._lock:
+            self.progress[key] = self.progress.get(key, 0) + amount
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "params": dict(self.params),
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class JobQueue:
+    """Bounded queue of jobs processed by worker threads."""
+
+    def __init__(self, handler, workers: int = INGEST_WORKERS, max_pending: int = INGEST_QUEUE_SIZE,
+                 history: int = JOB_HISTORY):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.history = history
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._work, daemon=True, name=f"job-worker-{i}")
+                t.start()
+                self._threads.append(t)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with job._lock:
+                job.status = "running"
+                job.started_at = time.time()
+            try:
+                result = self.handler(job)
+                with job._lock:
+                    job.result = result
+                    job.status = "done"
+            except Exception as e:
+                print(f"[error] job {job.id} failed: {e}")
+                with job._lock:
+                    job.error = str(e)
+                    job.status = "failed"
+            finally:
+                with job._lock:
+                    job.finished_at = time.time()
+
+    def submit(self, kind: str, **params) -> Job:
+        """Queue a job, raising QueueFull when the backlog is at capacity."""
+        self._ensure_workers()
+        job = Job(kind, params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise QueueFull(f"ingestion queue is full ({self._queue.maxsize} pending jobs)")
+        return job
+
+    def _evict(self):
+        # Forget the oldest finished jobs beyond the history limit
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("done", "failed")]
+        for jid in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[jid]
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [j.to_dict() for j in reversed(jobs)]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for j in self._jobs.values():
+                counts[j.status] = counts.get(j.status, 0) + 1
+        return {"workers": self.workers, "pending": self._queue.qsize(), "jobs": counts}
@@ -0,0 +1,446 @@
+"""
+BM25 keyword index for hybrid retrieval.
+Dense search misses exact terms such as function names and API identifiers,
+so chunks are also indexed by their words. The index lives on disk next to the
+other caches: a log of indexed chunks (docs-*.jsonl) plus immutable segments
+whose postings are flat uint32/uint16 arrays that are memory-mapped, not
+loaded. Each commit writes one new segment; segments are merged and deleted
+chunks dropped once there are too many of them. Commits and compactions of
+several processes take turns on a lock file; readers take it shared, so a
+compaction never deletes a log they are reading. Results are combined with the
+vector search through reciprocal rank fusion.
+"""
+import os
+import re
+import json
+import sys
+import math
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from .file_lock import file_lock
+
+KEYWORD_INDEX_ENABLED = os.getenv("KEYWORD_INDEX", "1").lower() in ("1", "true", "yes")
+KEYWORD_INDEX_PATH = os.getenv("KEYWORD_INDEX_PATH", os.path.join(".cache", "keyword"))
+KEYWORD_MAX_SEGMENTS = int(os.getenv("KEYWORD_MAX_SEGMENTS", "8"))
+# Ranked candidates taken from each retriever before fusion, and the RRF damping constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"\w+")
+# Pieces of camelCase / PascalCase identifiers: "ManagedThreadId" -> managed, thread, id
+_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+STOPWORDS = frozenset((
+    "a an and are as at be by for from has have how in is it its of on or that the this to was what when "
+    "where which who why will with der die das und ist ein eine einer eines einem einen im in zu den dem "
+    "des mit von für auf nicht sich wie was wird werden oder auch es"
+).split())
+
+
+def tokenize(text: str) -> list:
+    """Lowercased index terms: every word, plus the parts of identifiers that combine several."""
+    terms = []
+    for word in _WORD.findall(text):
+        lower = word.lower()
+        if lower not in STOPWORDS:
+            terms.append(lower)
+        parts = [p.lower() for piece in word.split("_") for p in _PART.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p not in STOPWORDS)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: list, limit: int, k: int = RRF_K) -> list:
+    """Merge ranked hit lists by summing 1 / (k + rank) per point ID.
+
+    Hits keep the payload of their first occurrence; 'score' becomes the fused
+    score and 'ranks' records the 1-based rank in each list it appeared in.
+    """
+    fused = {}
+    for name, hits in rankings:
+        for rank, hit in enumerate(hits, start=1):
+            key = str(hit["id"])
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {**hit, "score": 0.0, "ranks": {}}
+            entry["score"] += 1.0 / (k + rank)
+            entry["ranks"][name] = rank
+    return sorted(fused.values(), key=lambda h: -h["score"])[:limit]
+
+
+class _Segment:
+    """Immutable postings: sorted terms, per-term offsets and memory-mapped (doc, tf) arrays."""
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        base = os.path.join(directory, name)
+        with open(base + ".terms", "r", encoding="utf-8") as f:
+            self.terms = f.read().split("\n") if os.path.getsize(base + ".terms") else []
+        self.lookup = {term: i for i, term in enumerate(self.terms)}
+        self.offsets = np.fromfile(base + ".offsets", dtype=np.int64)
+        size = int(self.offsets[-1]) if len(self.offsets) else 0
+        if size:
+            self.docs = np.memmap(base + ".docs", dtype=np.uint32, mode="r", shape=(size,))
+            self.tfs = np.memmap(base + ".tfs", dtype=np.uint16, mode="r", shape=(size,))
+        else:
+            self.docs = np.empty(0, dtype=np.uint32)
+            self.tfs = np.empty(0, dtype=np.uint16)
+
+    def postings(self, term: str):
+        i = self.lookup.get(term)
+        if i is None:
+            return None
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.docs[start:end], self.tfs[start:end]
+
+    @staticmethod
+    def write(directory: str, name: str, terms: list, offsets, docs, tfs):
+        base = os.path.join(directory, name)
+        with open(base + ".terms", "w", encoding="utf-8") as f:
+            f.write("\n".join(terms))
+        np.asarray(offsets, dtype=np.int64).tofile(base + ".offsets")
+        np.asarray(docs, dtype=np.uint32).tofile(base + ".docs")
+        np.asarray(tfs, dtype=np.uint16).tofile(base + ".tfs")
+
+    @staticmethod
+    def remove(directory: str, name: str):
+        for ext in (".terms", ".offsets", ".docs", ".tfs"):
+            try:
+                os.remove(os.path.join(directory, name + ext))
+            except FileNotFoundError:
+                pass
+
+
+class KeywordIndex:
+    """BM25 index of one collection's chunks, keyed by point ID.
+
+    Changes are buffered with add()/delete_source() and written by commit().
+    state.json names the current docs log, how much of it is committed and the
+    live segments; other processes reload when it changes, like the local
+    vector store does.
+    """
+
+    def __init__(self, collection: str, root: str = KEYWORD_INDEX_PATH):
+        self.dir = os.path.join(root, collection)
+        self.state_path = os.path.join(self.dir, "state.json")
+        self.lock_path = os.path.join(self.dir, ".lock")
+        self.lock = threading.RLock()
+        self._pending_docs = {}
+        self._pending_deletes = set()
+        self._pending_sources = set()
+        with file_lock(self.lock_path, shared=True):
+            self._load()
+
+    # ------------------------------------------------------------------ loading
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.state_path)
+            return (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = {"docs": None, "docs_bytes": 0, "segments": []}
+        self.state = state
+        self.ids = []
+        self.sources = []
+        self.offsets = array("q")
+        lengths = array("f")
+        self.rows = {}
+        if state["docs"]:
+            position = 0
+            with open(os.path.join(self.dir, state["docs"]), "rb") as f:
+                data = f.read(state["docs_bytes"])
+            for line in data.splitlines(keepends=True):
+                rec = json.loads(line)
+                if rec.get("deleted"):
+                    doc = rec["doc"]
+                    if self.rows.get(self.ids[doc]) == doc:
+                        del self.rows[self.ids[doc]]
+                    self.ids[doc] = None
+                else:
+                    old = self.rows.get(rec["id"])
+                    if old is not None:
+                        self.ids[old] = None
+                    self.rows[rec["id"]] = len(self.ids)
+                    self.ids.append(rec["id"])
+                    self.sources.append(sys.intern(rec["payload"].get("source") or ""))
+                    self.offsets.append(position)
+                    lengths.append(rec["len"])
+                position += len(line)
+        self.lengths = np.frombuffer(lengths, dtype=np.float32) if lengths else np.empty(0, dtype=np.float32)
+        self.alive = np.array([i is not None for i in self.ids], dtype=bool)
+        self.avgdl = float(self.lengths[self.alive].mean()) if self.alive.any() else 1.0
+        self.live_sources = {self.sources[row] for row in self.rows.values()}
+        self.segments = [_Segment(self.dir, name) for name in state["segments"]]
+        self._seen = self._stamp()
+
+    def refresh(self):
+        """Reload when another process committed changes."""
+        with self.lock, file_lock(self.lock_path, shared=True):
+            self._reload()
+
+    def _reload(self):
+        # Call with the lock file held
+        if self._stamp() != self._seen:
+            self._load()
+
+    def count(self) -> int:
+        self.refresh()
+        with self.lock:
+            return len(self.rows)
+
+    def has_source(self, source: str) -> bool:
+        self.refresh()
+        with self.lock:
+            return source in self.live_sources
+
+    # ------------------------------------------------------------------ writing
+
+    def add(self, point_id: str, payload: dict):
+        """Index (or re-index) one chunk; payload must contain its 'text'."""
+        with self.lock:
+            self._pending_docs[str(point_id)] = payload
+
+    def delete_source(self, source: str):
+        """Drop every chunk of a document, including ones added earlier in this batch."""
+        with self.lock:
+            self._pending_sources.add(source)
+            for pid in [p for p, payload in self._pending_docs.items() if payload.get("source") == source]:
+                del self._pending_docs[pid]
+
+    def replace_source(self, source: str, points: list):
+        """Make [(point_id, payload)] the document's complete set of chunks."""
+        with self.lock:
+            self.delete_source(source)
+            for pid, payload in points:
+                self.add(pid, payload)
+
+    def delete(self, point_ids):
+        with self.lock:
+            for pid in point_ids:
+                self._pending_docs.pop(str(pid), None)
+                self._pending_deletes.add(str(pid))
+
+    def commit(self) -> bool:
+        """Write buffered changes as one segment; returns whether anything changed."""
+        # Exclusive from reloading other processes' commits to the state update and compaction
+        with self.lock, file_lock(self.lock_path):
+            self._reload()
+            docs, deletes, sources = self._pending_docs, self._pending_deletes, self._pending_sources
+            self._pending_docs, self._pending_deletes, self._pending_sources = {}, set(), set()
+            dead = {row for pid, row in self.rows.items()
+                    if pid in deletes or pid in docs or self.sources[row] in sources}
+            if not docs and not dead:
+                return False
+            os.makedirs(self.dir, exist_ok=True)
+            docs_name = self.state["docs"] or "docs-000001.jsonl"
+            records = [json.dumps({"doc": row, "deleted": True}, separators=(",", ":")) for row in sorted(dead)]
+            postings = {}
+            first = len(self.ids)
+            for doc, (pid, payload) in enumerate(docs.items(), start=first):
+                counts = Counter(tokenize(payload.get("text", "")))
+                for term, tf in counts.items():
+                    postings.setdefault(term, ([], []))
+                    postings[term][0].append(doc)
+                    postings[term][1].append(min(tf, 65535))
+                records.append(json.dumps({"id": pid, "len": sum(counts.values()), "payload": payload},
+                                          separators=(",", ":")))
+            data = "".join(r + "\n" for r in records).encode("utf-8")
+            path = os.path.join(self.dir, docs_name)
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                # Drop anything an interrupted commit appended past the committed length
+                f.truncate(self.state["docs_bytes"])
+                f.seek(self.state["docs_bytes"])
+                f.write(data)
+            segments = list(self.state["segments"])
+            if postings:
+                terms = sorted(postings)
+                lengths = [len(postings[t][0]) for t in terms]
+                name = self._segment_name()
+                _Segment.write(self.dir, name, terms, np.concatenate([[0], np.cumsum(lengths)]),
+                               [d for t in terms for d in postings[t][0]],
+                               [n for t in terms for n in postings[t][1]])
+                segments.append(name)
+            self._write_state({**self.state, "docs": docs_name,
+                               "docs_bytes": self.state["docs_bytes"] + len(data), "segments": segments})
+            self._load()
+            deleted = len(self.ids) - len(self.rows)
+            if len(self.segments) > KEYWORD_MAX_SEGMENTS or deleted > max(1024, len(self.ids) // 3):
+                self._compact()
+            return True
+
+    def _segment_name(self) -> str:
+        self.state["next_segment"] = self.state.get("next_segment", 0) + 1
+        return f"seg-{self.state['next_segment']:06d}"
+
+    def _write_state(self, state: dict):
+        tmp = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def _compact(self):
+        """Merge all segments into one and rewrite the docs log without deleted chunks."""
+        live = np.flatnonzero(self.alive)
+        remap = np.full(len(self.ids), -1, dtype=np.int64)
+        remap[live] = np.arange(len(live))
+        vocab = sorted(set().union(*(seg.terms for seg in self.segments)))
+        term_ids = {term: i for i, term in enumerate(vocab)}
+        all_terms, all_docs, all_tfs = [], [], []
+        for seg in self.segments:
+            if not seg.terms:
+                continue
+            global_ids = np.array([term_ids[t] for t in seg.terms], dtype=np.int64)
+            terms = np.repeat(global_ids, np.diff(seg.offsets))
+            docs = remap[np.asarray(seg.docs, dtype=np.int64)]
+            keep = docs >= 0
+            all_terms.append(terms[keep])
+            all_docs.append(docs[keep])
+            all_tfs.append(np.asarray(seg.tfs)[keep])
+        terms = np.concatenate(all_terms) if all_terms else np.empty(0, dtype=np.int64)
+        docs = np.concatenate(all_docs) if all_docs else np.empty(0, dtype=np.int64)
+        tfs = np.concatenate(all_tfs) if all_tfs else np.empty(0, dtype=np.uint16)
+        order = np.lexsort((docs, terms))
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        used = np.unique(terms)
+        offsets = np.searchsorted(terms, np.append(used, len(vocab)))
+
+        generation = int(self.state["docs"].split("-")[1].split(".")[0]) + 1
+        docs_name = f"docs-{generation:06d}.jsonl"
+        with open(os.path.join(self.dir, self.state["docs"]), "rb") as src, \
+                open(os.path.join(self.dir, docs_name), "wb") as out:
+            for row in live:
+                src.seek(self.offsets[row])
+                out.write(src.readline())
+            size = out.tell()
+        name = self._segment_name()
+        _Segment.write(self.dir, name, [vocab[i] for i in used], offsets, docs, tfs)
+        old_docs, old_segments = self.state["docs"], self.state["segments"]
+        self.segments = []
+        self._write_state({**self.state, "docs": docs_name, "docs_bytes": size, "segments": [name]})
+        for seg in old_segments:
+            _Segment.remove(self.dir, seg)
+        os.remove(os.path.join(self.dir, old_docs))
+        self._load()
+
+    # ------------------------------------------------------------------ search
+
+    def _bm25(self, query: str, rows=None):
+        """BM25 scores for query of every row, or of the given sorted unique rows only;
+        None for an empty index. Call with the lock held."""
+        total = len(self.rows)
+        if not total or not self.segments:
+            return None
+        alive, lengths = self.alive, self.lengths
+        avgdl = self.avgdl or 1.0
+        scores = np.zeros(len(alive) if rows is None else len(rows), dtype=np.float32)
+        for term in set(tokenize(query)):
+            found = [p for p in (seg.postings(term) for seg in self.segments) if p is not None]
+            if not found:
+                continue
+            docs = np.concatenate([d for d, _ in found]).astype(np.int64)
+            tfs = np.concatenate([t for _, t in found]).astype(np.float32)
+            keep = alive[docs]
+            docs, tfs = docs[keep], tfs[keep]
+            if not len(docs):
+                continue
+            idf = math.log(1.0 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            targets = docs
+            if rows is not None:
+                # Only the postings of the requested rows are scored
+                positions = np.minimum(np.searchsorted(rows, docs), len(rows) - 1)
+                keep = rows[positions] == docs
+                docs, tfs, targets = docs[keep], tfs[keep], positions[keep]
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[docs] / avgdl)
+            # A chunk appears once per term across all segments, so plain fancy-index addition is safe
+            scores[targets] += idf * tfs * (BM25_K1 + 1.0) / (tfs + norm)
+        return scores
+
+    def _read_payloads(self, rows) -> list:
+        # Payloads are read from the docs log only for the requested chunks
+        payloads = []
+        with open(os.path.join(self.dir, self.state["docs"]), "rb") as f:
+            for row in rows:
+                f.seek(self.offsets[row])
+                payloads.append(json.loads(f.readline())["payload"])
+        return payloads
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Top chunks by BM25 as [{"id", "score", "payload"}], best first."""
+        # Held throughout, since a compaction would replace the files the results point into
+        with self.lock, file_lock(self.lock_path, shared=True):
+            self._reload()
+            scores = self._bm25(query)
+            if scores is None:
+                return []
+            matched = np.flatnonzero(scores)
+            if not len(matched):
+                return []
+            if len(matched) > limit:
+                matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+            matched = matched[np.argsort(-scores[matched], kind="stable")]
+            return [{"id": self.ids[row], "score": float(scores[row]), "payload": payload}
+                    for row, payload in zip(matched, self._read_payloads(matched))]
+
+    def score_ids(self, query: str, point_ids: list):
+        """BM25 scores of the given chunks for query as a float32 array; 0 for chunks not in the index."""
+        with self.lock, file_lock(self.lock_path, shared=True):
+            self._reload()
+            result = np.zeros(len(point_ids), dtype=np.float32)
+            rows = np.array([self.rows.get(str(pid), -1) for pid in point_ids], dtype=np.int64)
+            known = rows >= 0
+            if not known.any():
+                return result
+            unique, inverse = np.unique(rows[known], return_inverse=True)
+            scores = self._bm25(query, unique)
+            if scores is not None:
+                result[known] = scores[inverse]
+            return result
+
+    def payloads(self, point_ids: list) -> dict:
+        """Payloads of the given chunks as {str(id): payload}; chunks not in the index are left out."""
+        with self.lock, file_lock(self.lock_path, shared=True):
+            self._reload()
+            if not self.state["docs"]:
+                return {}
+            found = [(str(pid), self.rows[str(pid)]) for pid in point_ids if str(pid) in self.rows]
+            return {pid: payload for (pid, _), payload in
+                    zip(found, self._read_payloads([row for _, row in found]))}
+
+    def stats(self) -> dict:
+        self.refresh()
+        with self.lock:
+            return {
+                "enabled": True,
+                "chunks": len(self.rows),
+                "segments": len(self.segments),
+                "terms": sum(len(seg.terms) for seg in self.segments),
+                "postings": sum(len(seg.docs) for seg in self.segments),
+            }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_keyword_index(collection: str):
+    """The process-wide keyword index of a collection, or None if KEYWORD_INDEX=0."""
+    if not KEYWORD_INDEX_ENABLED:
+        return None
+    with _indexes_lock:
+        index = _indexes.get(collection)
+        if index is None:
+            index = _indexes[collection] = KeywordIndex(collection)
+        return index
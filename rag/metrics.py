@@ -0,0 +1,194 @@
+"""
+Latency instrumentation.
+Timing spans record how long each stage of a request or ingestion run takes.
+Every span is observed into a histogram rendered in the Prometheus text format
+(for a /metrics endpoint or a textfile collector), and, while a timing context
+is active, also collected per request so it can be returned to the caller.
+"""
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_timings = contextvars.ContextVar("timings", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative histogram with optional labels."""
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def summary(self):
+        """{labels: (count, sum)} of every series."""
+        with self._lock:
+            return {labels: (s[1], s[2]) for labels, s in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, count, total) in series:
+            for bound, n in zip(self.buckets, counts):
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [le])} {n}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [inf])} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics rendered together, plus collectors that report current values on scrape."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """collect() returns [(name, type, help, [(labels dict, value), ...]), ...]."""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collect in collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                lines.append(f"# collector {getattr(collect, '__name__', collect)} failed: {_escape(e)}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_labels(names, [labels[n] for n in names])} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """Write the metrics atomically, e.g. for node_exporter's textfile collector."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rag_stage_seconds", "Time spent in each stage of chat, upload and ingestion.", ["stage"]))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "rag_request_seconds", "HTTP request latency by endpoint and status code.", ["endpoint", "method", "status"]))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as one stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def record(stage: str, seconds: float):
+    """Record an already measured stage duration."""
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def start_timing():
+    """Begin collecting spans for the current request or job; returns a token for stop_timing."""
+    return _timings.set({})
+
+
+def current_timing():
+    """Stage durations collected so far in the current context, in seconds."""
+    return dict(_timings.get() or {})
+
+
+def active_timing():
+    """The live timing dict of the current context, or None outside a timing context."""
+    return _timings.get()
+
+
+@contextmanager
+def timing_scope(timings: dict):
+    """Collect spans into an existing timing dict, e.g. while a streamed response body runs."""
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        try:
+            _timings.reset(token)
+        except ValueError:
+            # Generators may be resumed in a different context than the one they started in
+            pass
+
+
+def stop_timing(token):
+    timings = current_timing()
+    _timings.reset(token)
+    return timings
+
+
+def format_timing(timings: dict, total: float = None) -> str:
+    """Server-Timing style breakdown: 'embed;dur=12.31, search;dur=2.05, total;dur=15.02'."""
+    parts = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+def timing_ms(timings: dict) -> dict:
+    return {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
+
+
+def stage_summary() -> dict:
+    """{stage: (count, total seconds)} of everything observed in this process."""
+    return {labels[0]: value for labels, value in STAGE_SECONDS.summary().items()}
@@ -0,0 +1,41 @@
+"""
+Deterministic mock embeddings for USE_MOCK and the benchmark stand-ins.
+Each text's SHA-256 digest is expanded into 256 ±1 values and projected through
+a fixed random matrix, so a whole batch costs one matrix product instead of a
+Python loop over every float. Equal texts get equal vectors; different texts
+get nearly orthogonal ones.
+"""
+import hashlib
+import threading
+
+import numpy as np
+
+MOCK_DIM = 768  # nomic-embed-text uses 768 dimensions
+
+_projections = {}
+_lock = threading.Lock()
+
+
+def _projection(dim: int):
+    with _lock:
+        matrix = _projections.get(dim)
+        if matrix is None:
+            rng = np.random.default_rng(0x5EED)
+            matrix = rng.standard_normal((256, dim), dtype=np.float32) / 16.0
+            _projections[dim] = matrix
+        return matrix
+
+
+def mock_embed_array(texts: list, dim: int = MOCK_DIM):
+    """Mock embeddings of texts as a float32 array of shape (len(texts), dim)."""
+    if not texts:
+        return np.zeros((0, dim), dtype=np.float32)
+    digests = b"".join(hashlib.sha256(t.encode("utf-8") + b"::embed").digest() for t in texts)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(texts), 256)
+    signs = bits.astype(np.float32) * 2.0 - 1.0
+    return signs @ _projection(dim)
+
+
+def mock_embed(texts: list, dim: int = MOCK_DIM) -> list:
+    """Mock embeddings of texts as lists of floats."""
+    return mock_embed_array(texts, dim).tolist()
@@ -0,0 +1,41 @@
+"""
+Process-wide Ollama client.
+The ollama package (and httpx below it) is imported on first use, so modules
+that only might talk to Ollama stay cheap to import.
+"""
+import threading
+
+from .config import OLLAMA_HOST, EMBEDDING_MODEL, CHAT_MODEL, OLLAMA_KEEP_ALIVE
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ollama_client():
+    """The synchronous Ollama client; its keep-alive connections are shared by all threads."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import ollama
+            _client = ollama.Client(host=OLLAMA_HOST)
+        return _client
+
+
+def preload_models(keep_alive=OLLAMA_KEEP_ALIVE):
+    """Load the embedding and chat models into Ollama and keep them loaded for keep_alive.
+
+    Requests without input only load the model, so the first real question does
+    not wait for it. Returns the models that could not be loaded.
+    """
+    client = get_ollama_client()
+    failed = []
+    for model, load in (
+        (EMBEDDING_MODEL, lambda: client.embed(model=EMBEDDING_MODEL, input=[], keep_alive=keep_alive)),
+        (CHAT_MODEL, lambda: client.generate(model=CHAT_MODEL, keep_alive=keep_alive)),
+    ):
+        try:
+            load()
+        except Exception as e:
+            print(f"[warning] could not preload {model}: {e}")
+            failed.append(model)
+    return failed
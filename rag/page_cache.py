@@ -0,0 +1,132 @@
+"""
+Persistent cache of extracted PDF page texts.
+PyPDF2 text extraction is the main CPU cost of ingestion. Page texts are stored
+zlib-compressed in SQLite, keyed by (SHA-256 of the file, page index), so
+re-chunking with other settings or ingesting into another collection reads
+them back instead of parsing the PDF again. Pages are stored as their
+extraction finishes, so an interrupted run resumes with the pages it is missing.
+"""
+import os
+import zlib
+import sqlite3
+import threading
+
+from .chunker import iter_pages
+
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE", "1").lower() in ("1", "true", "yes")
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", os.path.join(".cache", "pages.sqlite3"))
+
+
+class PageCache:
+    """Page texts of PDFs by content hash, in an SQLite file."""
+
+    def __init__(self, path: str = PAGE_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self):
+        # Connections must not be shared across fork(), so reopen in child processes.
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS documents (sha256 TEXT PRIMARY KEY, pages INTEGER)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages (sha256 TEXT, page INTEGER, text BLOB, "
+                "PRIMARY KEY (sha256, page)) WITHOUT ROWID"
+            )
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def get(self, sha256: str):
+        """(page count, {page index: text}) of a document; (None, {}) if it was never seen."""
+        with self._lock:
+            try:
+                db = self._db()
+                row = db.execute("SELECT pages FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+                if row is None:
+                    return None, {}
+                pages = {page: zlib.decompress(blob).decode("utf-8") for page, blob in
+                         db.execute("SELECT page, text FROM pages WHERE sha256 = ?", (sha256,))}
+            except sqlite3.Error as e:
+                print(f"[warning] page cache read failed: {e}")
+                return None, {}
+            self.hits += len(pages)
+            return row[0], pages
+
+    def put(self, sha256: str, total: int, pages: dict):
+        """Store extracted page texts ({page index: text}) of a document with total pages."""
+        rows = [(sha256, page, zlib.compress(text.encode("utf-8"))) for page, text in pages.items()]
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute("INSERT OR REPLACE INTO documents (sha256, pages) VALUES (?, ?)", (sha256, total))
+                db.executemany("INSERT OR REPLACE INTO pages (sha256, page, text) VALUES (?, ?, ?)", rows)
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"[warning] page cache write failed: {e}")
+            # Every stored page was a page that had to be extracted
+            self.misses += len(rows)
+
+    def read_pages(self, path, sha256: str, on_page=None):
+        """Yield (page_number, text) like chunker.iter_pages, parsing the PDF only for uncached pages."""
+        total, pages = self.get(sha256)
+        reader = None
+        if total is None or len(pages) < total:
+            from PyPDF2 import PdfReader
+            reader = PdfReader(path)
+            total = len(reader.pages)
+        for i in range(total):
+            text = pages.get(i)
+            if text is None:
+                text = reader.pages[i].extract_text() or ""
+                self.put(sha256, total, {i: text})
+            if on_page is not None:
+                on_page(i + 1, total)
+            yield i + 1, text
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "page_hits": self.hits,
+                "page_misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_page_cache():
+    """Process-wide page cache, or None when PAGE_CACHE=0."""
+    global _default_cache
+    if not PAGE_CACHE_ENABLED:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = PageCache()
+        return _default_cache
+
+
+def read_pages(path, sha256: str, on_page=None):
+    """Pages of a PDF through the page cache, or straight from the PDF when it is disabled."""
+    cache = get_page_cache()
+    if cache is None:
+        return iter_pages(path, on_page)
+    return cache.read_pages(path, sha256, on_page)
+
+
+def page_cache_stats():
+    cache = get_page_cache()
+    return cache.stats() if cache else {"enabled": False}
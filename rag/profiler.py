@@ -0,0 +1,98 @@
+"""
+Low-overhead sampling profiler.
+A background thread periodically samples the stacks of all other threads and
+counts them in collapsed-stack format ("outer;inner;leaf count"), which
+flamegraph.pl and speedscope read directly. Enabled with PROFILE=1; the
+profile is written to PROFILE_OUTPUT when the process exits.
+"""
+import os
+import sys
+import time
+import atexit
+import threading
+from collections import Counter
+
+PROFILE_ENABLED = os.getenv("PROFILE", "0").lower() in ("1", "true", "yes")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_OUTPUT = os.getenv("PROFILE_OUTPUT", os.path.join(".cache", "profile-{pid}.collapsed"))
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed interval."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000.0, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            with self._lock:
+                self.stacks[";".join(reversed(stack))] += 1
+        with self._lock:
+            self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="sampling-profiler")
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def collapsed(self) -> str:
+        """The profile in collapsed-stack format, most frequent stacks first."""
+        with self._lock:
+            items = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+
+
+_profiler = None
+
+
+def get_profiler():
+    """The process-wide profiler if PROFILE is enabled, started on first use, else None."""
+    global _profiler
+    if not PROFILE_ENABLED:
+        return None
+    if _profiler is None:
+        _profiler = SamplingProfiler().start()
+        path = PROFILE_OUTPUT.format(pid=os.getpid(), time=int(time.time()))
+        atexit.register(_profiler.write, path)
+        print(f"[info] sampling profiler on, every {PROFILE_INTERVAL_MS:g} ms; profile will be written to {path}")
+    return _profiler
@@ -0,0 +1,315 @@
+"""
+Shared Qdrant REST client.
+All Qdrant traffic goes through one pooled, keep-alive requests.Session with
+automatic retries on transient errors. Request bodies are encoded compactly
+(orjson when installed) and large upserts can optionally be gzip-compressed.
+Upserts use Qdrant's columnar batch format, with the vectors serialized straight
+from a float32 matrix. New collections can keep int8-quantized vectors in RAM
+and the full vectors on disk. AsyncQdrantHTTP covers the searches of the async
+chat path on httpx.
+"""
+import os
+import gzip
+import json
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .vector_store import VectorStore, PointBatch, as_point_batch
+
+try:
+    import orjson
+except ImportError:  # optional, only speeds up encoding of large vector batches
+    orjson = None
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL_SIZE", "16"))
+QDRANT_RETRIES = int(os.getenv("QDRANT_RETRIES", "3"))
+# Compress request bodies above this many bytes; 0 disables gzip
+QDRANT_GZIP_MIN_BYTES = int(os.getenv("QDRANT_GZIP_MIN_BYTES", "0"))
+# Collection layout, applied when a collection is created: "int8" scalar quantization
+# (4x smaller vectors in RAM, rescored with the originals) and original vectors on disk
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()
+QDRANT_ON_DISK = os.getenv("QDRANT_ON_DISK", "0").lower() in ("1", "true", "yes")
+
+
+def _encode_default(obj):
+    # NumPy arrays and scalars, for the json module (orjson serializes them itself)
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_json(obj) -> bytes:
+    """Compact JSON encoding, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(",", ":"), default=_encode_default).encode("utf-8")
+
+
+def decode_json(data: bytes):
+    """Parse a JSON response body, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def collection_config(size: int, distance: str, quantization: str = QDRANT_QUANTIZATION,
+                      on_disk: bool = QDRANT_ON_DISK) -> dict:
+    """Body of a create-collection request."""
+    vectors = {"size": size, "distance": distance}
+    if on_disk:
+        vectors["on_disk"] = True
+    body = {"vectors": vectors}
+    if quantization == "int8":
+        body["quantization_config"] = {"scalar": {"type": "int8", "quantile": 0.99, "always_ram": True}}
+    elif quantization not in ("", "none"):
+        raise ValueError(f"Unknown QDRANT_QUANTIZATION '{quantization}' (expected 'none' or 'int8')")
+    return body
+
+
+class QdrantHTTP(VectorStore):
+    """Thin wrapper over the Qdrant REST API on a pooled session."""
+
+    name = "qdrant"
+
+    def __init__(self, url: str = QDRANT_URL, pool_size: int = QDRANT_POOL_SIZE,
+                 retries: int = QDRANT_RETRIES, gzip_min_bytes: int = QDRANT_GZIP_MIN_BYTES):
+        self.url = url.rstrip("/")
+        self.pid = os.getpid()
+        self.gzip_min_bytes = gzip_min_bytes
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "PUT", "POST", "DELETE"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip"})
+
+    def request(self, method: str, path: str, json=None, timeout: float = 30):
+        headers = {}
+        data = None
+        if json is not None:
+            data = encode_json(json)
+            headers["Content-Type"] = "application/json"
+            if self.gzip_min_bytes and len(data) >= self.gzip_min_bytes:
+                data = gzip.compress(data, compresslevel=1)
+                headers["Content-Encoding"] = "gzip"
+        return self.session.request(method, f"{self.url}{path}", data=data, headers=headers, timeout=timeout)
+
+    def get(self, path: str, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, json=None, **kwargs):
+        return self.request("POST", path, json=json, **kwargs)
+
+    def put(self, path: str, json=None, **kwargs):
+        return self.request("PUT", path, json=json, **kwargs)
+
+    def is_available(self, timeout: float = 5) -> bool:
+        try:
+            return self.get("/collections", timeout=timeout).ok
+        except Exception:
+            return False
+
+    def list_collections(self, timeout: float = 10):
+        """Names of all collections, tolerating the different response shapes."""
+        r = self.get("/collections", timeout=timeout)
+        if not r.ok:
+            return None
+        j = r.json()
+        cols = []
+        if isinstance(j, dict):
+            if "result" in j and isinstance(j["result"], dict) and "collections" in j["result"]:
+                cols = j["result"]["collections"]
+            elif "collections" in j and isinstance(j["collections"], list):
+                cols = j["collections"]
+            elif "result" in j and isinstance(j["result"], list):
+                cols = j["result"]
+        return [c.get("name") if isinstance(c, dict) else c for c in cols]
+
+    def ensure_collection(self, collection: str, size: int = 768, distance: str = "Cosine"):
+        """Ensure that the collection exists. nomic-embed-text uses 768 dimensions."""
+        try:
+            names = self.list_collections()
+            if names is not None and collection in names:
+                return True
+        except Exception:
+            pass
+        body = collection_config(size, distance)
+        for path in (f"/collections/{collection}/create", f"/collections/{collection}"):
+            try:
+                r = self.put(path, json=body, timeout=10)
+                if r.ok or r.status_code in (200, 201, 204):
+                    print(f"[info] created collection via {self.url}{path}")
+                    return True
+            except Exception:
+                pass
+        return False
+
+    def points_count(self, collection: str, timeout: float = 5):
+        r = self.get(f"/collections/{collection}", timeout=timeout)
+        if r.ok:
+            data = r.json()
+            if "result" in data and "points_count" in data["result"]:
+                return data["result"]["points_count"]
+        return 0
+
+    def vector_params(self, collection: str, timeout: float = 5):
+        r = self.get(f"/collections/{collection}", timeout=timeout)
+        if r.status_code == 404:
+            return None
+        if not r.ok:
+            raise RuntimeError(f"Qdrant collection info failed: {r.status_code} {r.text}")
+        vectors = r.json()["result"]["config"]["params"]["vectors"]
+        return {"size": int(vectors["size"]), "distance": vectors["distance"]}
+
+    def scroll(self, collection: str, limit: int = 1024, offset=None, timeout: float = 60):
+        """One page of Qdrant's scroll API, with vectors; the vectors become a float32 matrix."""
+        body = {"limit": limit, "with_payload": True, "with_vector": True}
+        if offset is not None:
+            body["offset"] = offset
+        r = self.post(f"/collections/{collection}/points/scroll", json=body, timeout=timeout)
+        if not r.ok:
+            raise RuntimeError(f"Qdrant scroll failed: {r.status_code} {r.text}")
+        result = decode_json(r.content)["result"]
+        return PointBatch.from_points(result.get("points") or []), result.get("next_page_offset")
+
+    def search(self, collection: str, vector, limit: int = 5, with_payload=True, timeout: float = 30):
+        """Return the list of hits, raising on HTTP errors."""
+        body = {"vector": vector, "limit": limit, "with_payload": with_payload}
+        r = self.post(f"/collections/{collection}/points/search", json=body, timeout=timeout)
+        if not r.ok:
+            raise RuntimeError(f"Qdrant search failed: {r.status_code} {r.text}")
+        data = r.json()
+        return data.get("result") or data.get("data") or []
+
+    def search_batch(self, collection: str, vectors: list, limit: int = 5, with_payload=True,
+                     timeout: float = 30):
+        """Run all searches in one request to Qdrant's batch search endpoint."""
+        if not vectors:
+            return []
+        body = {"searches": [{"vector": v, "limit": limit, "with_payload": with_payload} for v in vectors]}
+        r = self.post(f"/collections/{collection}/points/search/batch", json=body, timeout=timeout)
+        if not r.ok:
+            raise RuntimeError(f"Qdrant batch search failed: {r.status_code} {r.text}")
+        return r.json().get("result") or [[] for _ in vectors]
+
+    def retrieve(self, collection: str, ids: list, timeout: float = 30):
+        """Payloads of points by ID, without their vectors."""
+        if not ids:
+            return {}
+        body = {"ids": list(ids), "with_payload": True, "with_vector": False}
+        r = self.post(f"/collections/{collection}/points", json=body, timeout=timeout)
+        if not r.ok:
+            raise RuntimeError(f"Qdrant retrieve failed: {r.status_code} {r.text}")
+        return {str(p["id"]): p.get("payload") or {} for p in r.json().get("result") or []}
+
+    def upsert(self, collection: str, points, timeout: float = 60):
+        """Upsert points with PUT, Qdrant's upsert endpoint.
+
+        Sent as columns ({"batch": {"ids", "vectors", "payloads"}}), so each
+        key is written once per request rather than once per point.
+        """
+        batch = as_point_batch(points)
+        body = {"batch": {"ids": batch.ids, "vectors": batch.vectors, "payloads": batch.payloads}}
+        try:
+            r = self.put(f"/collections/{collection}/points", json=body, timeout=timeout)
+            if r.ok:
+                return True
+            error = f"PUT returned {r.status_code}: {r.text}"
+        except Exception as e:
+            error = f"PUT failed: {e}"
+        print(f"[warning] upsert of {len(batch)} points failed: {error}")
+        return False
+
+    def delete_points(self, collection: str, selector: dict, timeout: float = 60):
+        """Bulk delete points by ID list or filter."""
+        try:
+            r = self.post(f"/collections/{collection}/points/delete?wait=true", json=selector, timeout=timeout)
+            if not r.ok:
+                print(f"[warning] delete returned {r.status_code}: {r.text}")
+            return r.ok
+        except Exception as e:
+            print(f"[warning] delete failed: {e}")
+            return False
+
+
+class AsyncQdrantHTTP:
+    """Searches over a pooled httpx.AsyncClient, for the ASGI chat routes.
+
+    Must be created and closed on the event loop that uses it.
+    """
+
+    name = "qdrant"
+
+    def __init__(self, url: str = QDRANT_URL, pool_size: int = QDRANT_POOL_SIZE, retries: int = QDRANT_RETRIES):
+        import httpx
+        self.url = url.rstrip("/")
+        self.retries = retries
+        self.client = httpx.AsyncClient(
+            base_url=self.url,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(retries=retries),
+            headers={"Accept-Encoding": "gzip"},
+        )
+
+    async def post(self, path: str, json=None, timeout: float = 30):
+        data = encode_json(json)
+        for attempt in range(self.retries + 1):
+            r = await self.client.post(path, content=data, headers={"Content-Type": "application/json"},
+                                       timeout=timeout)
+            # Same transient statuses the sync client retries on
+            if r.status_code not in (502, 503, 504) or attempt == self.retries:
+                return r
+            await asyncio.sleep(0.2 * (2 ** attempt))
+
+    async def search(self, collection: str, vector, limit: int = 5, with_payload=True, timeout: float = 30):
+        return (await self.search_batch(collection, [vector], limit, with_payload, timeout))[0]
+
+    async def search_batch(self, collection: str, vectors: list, limit: int = 5, with_payload=True,
+                           timeout: float = 30):
+        """Run all searches in one request to Qdrant's batch search endpoint."""
+        if not vectors:
+            return []
+        body = {"searches": [{"vector": v, "limit": limit, "with_payload": with_payload} for v in vectors]}
+        r = await self.post(f"/collections/{collection}/points/search/batch", json=body, timeout=timeout)
+        if r.status_code >= 400:
+            raise RuntimeError(f"Qdrant batch search failed: {r.status_code} {r.text}")
+        return r.json().get("result") or [[] for _ in vectors]
+
+    async def retrieve(self, collection: str, ids: list, timeout: float = 30):
+        """Payloads of points by ID, without their vectors."""
+        if not ids:
+            return {}
+        body = {"ids": list(ids), "with_payload": True, "with_vector": False}
+        r = await self.post(f"/collections/{collection}/points", json=body, timeout=timeout)
+        if r.status_code >= 400:
+            raise RuntimeError(f"Qdrant retrieve failed: {r.status_code} {r.text}")
+        return {str(p["id"]): p.get("payload") or {} for p in r.json().get("result") or []}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url: str = QDRANT_URL) -> QdrantHTTP:
+    """Process-wide client per Qdrant URL, so connections are reused."""
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None or client.pid != os.getpid():
+            client = QdrantHTTP(url)
+            _clients[url] = client
+        return client
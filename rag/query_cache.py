@@ -0,0 +1,268 @@
+"""
+Query-result cache for the chat path.
+Two levels: retrieval results keyed by the question embedding, and final
+answers keyed by (normalized question, retrieved context hash, model). Both
+carry the collection version, which ingestion bumps whenever documents change,
+so cached entries never outlive the data they were computed from. A semantic
+answer cache additionally serves paraphrased questions whose embedding is close
+to a recent one and whose retrieved context is identical.
+"""
+import os
+import re
+import time
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from .file_lock import file_lock
+
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE", "1").lower() in ("1", "true", "yes")
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "1").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+VERSION_DIR = os.getenv("COLLECTION_VERSION_DIR", ".cache")
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question, ignoring trailing punctuation."""
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def vector_hash(vector) -> str:
+    return hashlib.sha256(array("f", vector).tobytes()).hexdigest()
+
+
+class TTLCache:
+    """LRU cache whose entries also expire after a fixed time."""
+
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SemanticCache:
+    """Ring buffer of recent (question embedding, context hash, answer) entries.
+
+    Embeddings are kept normalized in one preallocated float32 matrix, so a
+    lookup is a single matrix-vector product and memory is bounded by capacity.
+    """
+
+    def __init__(self, capacity: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.capacity = capacity
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._versions = np.zeros(capacity, dtype=np.int64)
+        self._context_hashes = [None] * capacity
+        self._answers = [None] * capacity
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+        self.context_mismatches = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vec = np.asarray(vector, dtype=np.float32)
+        return vec / (np.linalg.norm(vec) + 1e-12)
+
+    def lookup(self, vector, context_hash: str, version: int):
+        """Return (answer, similarity) of the closest entry above the threshold with the same context."""
+        query = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(query):
+                self.misses += 1
+                return None
+            scores = self._vectors @ query
+            scores[~self._valid | (self._versions != version)] = -np.inf
+            candidates = np.flatnonzero(scores >= self.threshold)
+            similar = False
+            for i in candidates[np.argsort(-scores[candidates])]:
+                similar = True
+                if self._context_hashes[i] == context_hash:
+                    self.hits += 1
+                    return self._answers[i], float(scores[i])
+            if similar:
+                self.context_mismatches += 1
+            self.misses += 1
+            return None
+
+    def store(self, vector, context_hash: str, version: int, answer: str):
+        vec = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vec):
+                self._vectors = np.zeros((self.capacity, len(vec)), dtype=np.float32)
+                self._valid[:] = False
+            slot = self._next
+            if self._valid[slot]:
+                self.evictions += 1
+            self._vectors[slot] = vec
+            self._valid[slot] = True
+            self._versions[slot] = version
+            self._context_hashes[slot] = context_hash
+            self._answers[slot] = answer
+            self._next = (slot + 1) % self.capacity
+            self.stores += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": int(self._valid.sum()),
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "context_mismatches": self.context_mismatches,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "memory_bytes": int(self._vectors.nbytes) if self._vectors is not None else 0,
+            }
+
+
+class CollectionVersion:
+    """Monotonic version counter of a collection, shared between processes through a small file."""
+
+    def __init__(self, collection: str, directory: str = VERSION_DIR):
+        self.path = os.path.join(directory, f"version-{collection}")
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._value = 0
+
+    def current(self) -> int:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if stamp != self._stamp:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._value = int(f.read().strip() or 0)
+                except (OSError, ValueError):
+                    pass
+                self._stamp = stamp
+            return self._value
+
+    def bump(self) -> int:
+        """Mark the collection as changed, invalidating everything cached against it."""
+        # Read, increment and write under a lock file, so bumps of two processes never both write N+1
+        with self._lock, file_lock(self.path + ".lock"):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    value = int(f.read().strip() or 0) + 1
+            except (OSError, ValueError):
+                value = 1
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(str(value))
+            os.replace(tmp, self.path)
+            self._stamp = None
+            return value
+
+
+class QueryCache:
+    """Retrieval and answer caches for one collection."""
+
+    def __init__(self, collection: str, version: CollectionVersion = None):
+        self.version = version or CollectionVersion(collection)
+        self.retrieval = TTLCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+        self.answers = TTLCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+        self.semantic = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
+
+    def retrieval_key(self, vector, limit: int):
+        return (self.version.current(), vector_hash(vector), limit)
+
+    def answer_key(self, question: str, context: str, model: str):
+        return (self.version.current(), normalize_question(question), text_hash(context), model)
+
+    def get_retrieval(self, vector, limit: int):
+        return self.retrieval.get(self.retrieval_key(vector, limit))
+
+    def put_retrieval(self, vector, limit: int, hits):
+        self.retrieval.put(self.retrieval_key(vector, limit), hits)
+
+    def get_answer(self, question: str, context: str, model: str):
+        return self.answers.get(self.answer_key(question, context, model))
+
+    def put_answer(self, question: str, context: str, model: str, answer: str, vector=None):
+        self.answers.put(self.answer_key(question, context, model), answer)
+        if self.semantic is not None and vector is not None:
+            self.semantic.store(vector, text_hash(f"{model}\0{context}"), self.version.current(), answer)
+
+    def get_similar_answer(self, vector, context: str, model: str):
+        """Answer of a near-duplicate question with the same context, as (answer, similarity)."""
+        if self.semantic is None:
+            return None
+        return self.semantic.lookup(vector, text_hash(f"{model}\0{context}"), self.version.current())
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "collection_version": self.version.current(),
+            "retrieval": self.retrieval.stats(),
+            "answers": self.answers.stats(),
+            "semantic": self.semantic.stats() if self.semantic else {"enabled": False},
+        }
@@ -0,0 +1,77 @@
+"""
+Two-stage retrieval: an oversampled vector search followed by a local rerank.
+The vector store returns RERANK_CANDIDATES hits per question as IDs and
+cosine scores only, without payloads. The candidates of each question are
+rescored in one vectorized pass that mixes the min-max normalized cosine score
+with the chunk's normalized BM25 score for the question from the keyword index
+(weight RERANK_LEXICAL_WEIGHT), computed over the candidates' postings only.
+That is the only place BM25 counts: the chat path fuses in keyword hits by
+reciprocal rank fusion only when the weight is 0. Payloads are then fetched for the kept hits
+only: from the keyword index's local log when it has them, otherwise with one
+retrieve call to the vector store.
+"""
+import os
+
+import numpy as np
+
+from .metrics import span
+
+RERANK_ENABLED = os.getenv("RERANK", "1").lower() in ("1", "true", "yes")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_LEXICAL_WEIGHT = float(os.getenv("RERANK_LEXICAL_WEIGHT", "0.3"))
+
+
+def _minmax(scores):
+    low, high = scores.min(), scores.max()
+    if high - low < 1e-9:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def rerank(question: str, hits: list, limit: int, keyword_index=None, weight: float = RERANK_LEXICAL_WEIGHT) -> list:
+    """The best limit of a question's candidate hits after mixing in their lexical score.
+
+    Returned hits keep the cosine score as 'vector_score', the BM25 score as
+    'lexical_score', and get the mixed score in [0, 1] as 'score'.
+    """
+    if not hits:
+        return []
+    vector = np.array([h["score"] for h in hits], dtype=np.float32)
+    lexical = np.zeros(len(hits), dtype=np.float32)
+    if keyword_index is not None and weight > 0:
+        lexical = keyword_index.score_ids(question, [h["id"] for h in hits])
+    if lexical.any():
+        combined = (1.0 - weight) * _minmax(vector) + weight * _minmax(lexical)
+    else:
+        combined = _minmax(vector)
+    # Stable, so ties keep the vector store's order
+    order = np.argsort(-combined, kind="stable")[:limit]
+    return [{**hits[i], "score": float(combined[i]), "vector_score": hits[i]["score"],
+             "lexical_score": float(lexical[i])} for i in order]
+
+
+def local_payloads(hit_lists: list, keyword_index=None) -> tuple:
+    """Payloads the keyword index has for the hits, and the IDs it lacks: (payloads, missing)."""
+    ids = list(dict.fromkeys(str(h["id"]) for hits in hit_lists for h in hits))
+    payloads = keyword_index.payloads(ids) if keyword_index is not None else {}
+    return payloads, [pid for pid in ids if pid not in payloads]
+
+
+def attach_payloads(hit_lists: list, payloads: dict) -> list:
+    """Add payloads to the hits; hits whose point has gone since the search are dropped."""
+    return [[{**h, "payload": payloads[str(h["id"])]} for h in hits if str(h["id"]) in payloads]
+            for hits in hit_lists]
+
+
+def two_stage_search(store, collection: str, questions: list, vectors: list, limit: int,
+                     keyword_index=None, candidates: int = RERANK_CANDIDATES) -> list:
+    """Search, rerank and fetch payloads for several questions; one hit list (best first) per question."""
+    with span("vector_search"):
+        found = store.search_batch(collection, vectors, limit=max(limit, candidates), with_payload=False)
+    with span("rerank"):
+        ranked = [rerank(q, hits, limit, keyword_index) for q, hits in zip(questions, found)]
+    with span("fetch_payloads"):
+        payloads, missing = local_payloads(ranked, keyword_index)
+        if missing:
+            payloads.update(store.retrieve(collection, missing))
+    return attach_payloads(ranked, payloads)
@@ -0,0 +1,299 @@
+"""
+Request coalescing.
+When the same question arrives several times at once (a whole lecture asking
+the question on the slide), only the first request embeds, searches and
+generates; the others wait for that call and share its result. Streams are
+shared the same way: one producer runs the generation and every subscriber
+replays the tokens from the start, so late joiners still get the full answer.
+Identical texts within one embedding batch, or in batches embedded at the
+same time, are embedded once.
+"""
+import asyncio
+import threading
+
+
+class FlightCounters:
+    """How many calls ran ('leaders') and how many joined one in flight ('followers')."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def add(self, leader: bool):
+        with self._lock:
+            if leader:
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"leaders": self.leaders, "followers": self.followers}
+
+
+class _Broadcast:
+    """Items produced once and replayed to any number of subscribers."""
+
+    def __init__(self):
+        self.items = []
+        self.finished = False
+        self.cancelled = False
+        self.error = None
+        self.subscribers = 0
+        self.cond = threading.Condition()
+
+    def publish(self, item):
+        with self.cond:
+            self.items.append(item)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.finished = True
+            self.error = error
+            self.cond.notify_all()
+
+    def replay(self):
+        i = 0
+        while True:
+            with self.cond:
+                while i >= len(self.items) and not self.finished:
+                    self.cond.wait()
+                items = self.items[i:]
+                finished, error = self.finished, self.error
+            i += len(items)
+            yield from items
+            if finished and i >= len(self.items):
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """One call per key at a time, for threaded callers (the Flask routes)."""
+
+    def __init__(self, counters: FlightCounters = None):
+        self.counters = counters or FlightCounters()
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Run fn(), or wait for the call already running under key. Returns (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+        self.counters.add(leader)
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"], True
+        try:
+            call["result"] = fn()
+            return call["result"], False
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+    def stream(self, key, produce):
+        """Iterate produce() once per key; returns (iterator over all items, shared).
+
+        The producer runs on its own thread, so it keeps going for the other
+        subscribers when the first one stops listening; it is stopped once
+        every subscriber has gone.
+        """
+        with self._lock:
+            broadcast = self._calls.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._calls[key] = _Broadcast()
+        self.counters.add(leader)
+        if leader:
+            threading.Thread(target=self._produce, args=(key, broadcast, produce), daemon=True,
+                             name="single-flight-stream").start()
+        return self._subscribe(key, broadcast), not leader
+
+    def _produce(self, key, broadcast, produce):
+        error = None
+        items = produce()
+        try:
+            for item in items:
+                broadcast.publish(item)
+                if broadcast.cancelled:
+                    break
+        except Exception as e:
+            error = e
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+            with self._lock:
+                if self._calls.get(key) is broadcast:
+                    del self._calls[key]
+            broadcast.finish(error)
+
+    def _subscribe(self, key, broadcast):
+        with self._lock:
+            broadcast.subscribers += 1
+        try:
+            yield from broadcast.replay()
+        finally:
+            with self._lock:
+                broadcast.subscribers -= 1
+                if broadcast.subscribers == 0 and not broadcast.finished:
+                    # Nobody listens any more: stop generating, and let the next caller start afresh
+                    broadcast.cancelled = True
+                    if self._calls.get(key) is broadcast:
+                        del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop (the ASGI chat routes)."""
+
+    def __init__(self, counters: FlightCounters = None):
+        self.counters = counters or FlightCounters()
+        self._calls = {}
+
+    async def do(self, key, fn):
+        """Await fn(), or the call already running under key. Returns (result, shared)."""
+        future = self._calls.get(key)
+        if future is not None:
+            self.counters.add(False)
+            # Shielded, so a follower that is cancelled does not cancel the leader's call
+            return await asyncio.shield(future), True
+        self.counters.add(True)
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting; mark the exception as retrieved
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            del self._calls[key]
+
+    def stream(self, key, produce):
+        """Async iterator over produce()'s items, generated once per key; returns (iterator, shared).
+
+        The generation runs as its own task and is cancelled once every
+        subscriber has gone.
+        """
+        state = self._calls.get(key)
+        leader = state is None
+        self.counters.add(leader)
+        if leader:
+            state = self._calls[key] = {"items": [], "finished": False, "error": None, "subscribers": 0,
+                                        "changed": asyncio.Event()}
+
+            async def run():
+                try:
+                    async for item in produce():
+                        state["items"].append(item)
+                        state["changed"].set()
+                except Exception as e:
+                    state["error"] = e
+                finally:
+                    if self._calls.get(key) is state:
+                        del self._calls[key]
+                    state["finished"] = True
+                    state["changed"].set()
+
+            # Kept on the state so the task is not garbage collected while it runs
+            state["task"] = asyncio.get_running_loop().create_task(run())
+
+        async def subscribe():
+            state["subscribers"] += 1
+            i = 0
+            try:
+                while True:
+                    while i < len(state["items"]):
+                        yield state["items"][i]
+                        i += 1
+                    if state["finished"]:
+                        if state["error"] is not None:
+                            raise state["error"]
+                        return
+                    state["changed"].clear()
+                    await state["changed"].wait()
+            finally:
+                state["subscribers"] -= 1
+                if state["subscribers"] == 0 and not state["finished"]:
+                    if self._calls.get(key) is state:
+                        del self._calls[key]
+                    state["task"].cancel()
+
+        return subscribe(), not leader
+
+
+class EmbeddingCoalescer:
+    """Embeds each distinct text once, however often it occurs in a batch or in concurrent batches.
+
+    Texts are compared with their whitespace collapsed. A text another batch is
+    already embedding is not sent again: this batch waits for that vector.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.texts = 0
+        self.duplicates = 0
+        self.shared = 0
+
+    def embed(self, texts: list, embed_fn):
+        keys = [" ".join(text.split()) for text in texts]
+        own = {}
+        others = {}
+        with self._lock:
+            self.texts += len(texts)
+            for key, text in zip(keys, texts):
+                if key in own or key in others:
+                    self.duplicates += 1
+                    continue
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = {"done": threading.Event(), "vector": None, "error": None}
+                    own[key] = (text, call)
+                else:
+                    others[key] = call
+                    self.shared += 1
+        # Embed this batch's own texts before waiting on others, so two batches never wait on each other
+        try:
+            vectors = embed_fn([text for text, _ in own.values()]) if own else []
+            for (_, call), vector in zip(own.values(), vectors):
+                call["vector"] = vector
+        except BaseException as e:
+            for _, call in own.values():
+                call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                for key in own:
+                    del self._calls[key]
+            for _, call in own.values():
+                call["done"].set()
+        if len(own) == len(texts):
+            return vectors
+        found = {key: call["vector"] for key, (_, call) in own.items()}
+        for key, call in others.items():
+            call["done"].wait()
+            if call["error"] is not None:
+                raise RuntimeError(f"embedding shared with another batch failed: {call['error']}")
+            found[key] = call["vector"]
+        return [found[key] for key in keys]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"texts": self.texts, "duplicates": self.duplicates, "shared": self.shared}
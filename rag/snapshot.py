@@ -0,0 +1,227 @@
+"""
+Binary snapshots of a collection, for moving it between environments without
+embedding anything again. A snapshot is a directory:
+
+    manifest.json         collection, vector size and distance, dtype, point count
+    vectors.f32 / .f16    the vectors as one row-major (count, size) matrix, for np.memmap
+    payloads.jsonl.gz     one line per block of rows: {"start", "ids", "columns": {key: [values]}}
+    ingest-manifest.json  the collection's ingestion manifest, if it has one
+
+Export scrolls the collection in pages of SNAPSHOT_PAGE_SIZE points, fetching
+the next page while the current one is written. Import reads the vectors
+memory-mapped block by block and sends them through SNAPSHOT_WORKERS parallel
+upserts, rebuilding the keyword index on the way, and then merges the snapshot's
+ingestion manifest into the collection's if every upsert succeeded. With the manifest, a later
+ingest_pdf.py run skips the imported documents it finds unchanged in its folder,
+but removes those missing from it. Payload keys whose value is null are not
+restored. manifest.json is written last, so a directory without it
+is an unfinished export.
+"""
+import os
+import gzip
+import json
+import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .config import MAX_UPSERT
+from .ingest_manifest import IngestManifest
+from .qdrant_http import encode_json, decode_json
+from .vector_store import PointBatch
+
+SNAPSHOT_PAGE_SIZE = int(os.getenv("SNAPSHOT_PAGE_SIZE", "2048"))
+SNAPSHOT_WORKERS = int(os.getenv("SNAPSHOT_WORKERS", "4"))
+
+FORMAT_VERSION = 1
+DTYPES = {"float32": "vectors.f32", "float16": "vectors.f16"}
+# Chunks buffered in the keyword index before they are written as a segment
+KEYWORD_COMMIT_POINTS = 50000
+
+
+def _columns(payloads: list) -> dict:
+    """Payload dicts as one list of values per key, None where a payload lacks the key."""
+    keys = list(dict.fromkeys(key for payload in payloads for key in payload))
+    return {key: [payload.get(key) for payload in payloads] for key in keys}
+
+
+def _payloads(columns: dict, count: int) -> list:
+    payloads = [{} for _ in range(count)]
+    for key, values in columns.items():
+        for payload, value in zip(payloads, values):
+            if value is not None:
+                payload[key] = value
+    return payloads
+
+
+def _log_progress(verb: str, points: int, started: float):
+    elapsed = time.perf_counter() - started
+    print(f"[info] {verb} {points} points ({points / max(elapsed, 1e-9):.0f}/s)")
+
+
+def export_collection(store, collection: str, directory: str, dtype: str = "float32",
+                      page_size: int = SNAPSHOT_PAGE_SIZE) -> dict:
+    """Write a snapshot of the collection to directory; returns its manifest."""
+    import numpy as np
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown snapshot dtype '{dtype}' (expected one of {', '.join(DTYPES)})")
+    params = store.vector_params(collection)
+    if params is None:
+        raise KeyError(f"collection '{collection}' does not exist")
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    count = 0
+    started = time.perf_counter()
+    reported = 0
+    with open(os.path.join(directory, DTYPES[dtype]), "wb") as vectors, \
+            gzip.open(os.path.join(directory, "payloads.jsonl.gz"), "wb", compresslevel=1) as payloads, \
+            ThreadPoolExecutor(max_workers=1) as scroller:
+        page = scroller.submit(store.scroll, collection, page_size, None)
+        while page is not None:
+            batch, offset = page.result()
+            # The next page travels over the network while this one is written
+            page = scroller.submit(store.scroll, collection, page_size, offset) if offset is not None else None
+            if not len(batch):
+                continue
+            if batch.vectors.shape[1] != params["size"]:
+                raise ValueError(f"point {batch.ids[0]} has {batch.vectors.shape[1]} dimensions, "
+                                 f"the collection {params['size']}")
+            vectors.write(batch.vectors.astype(np.dtype(dtype), copy=False).tobytes())
+            payloads.write(encode_json({"start": count, "ids": batch.ids,
+                                        "columns": _columns(batch.payloads)}) + b"\n")
+            count += len(batch)
+            if count - reported >= 100000:
+                _log_progress("exported", count, started)
+                reported = count
+
+    ingest_manifest = IngestManifest(collection)
+    has_manifest = os.path.exists(ingest_manifest.path)
+    if has_manifest:
+        shutil.copyfile(ingest_manifest.path, os.path.join(directory, "ingest-manifest.json"))
+    manifest = {
+        "format": FORMAT_VERSION,
+        "collection": collection,
+        "size": params["size"],
+        "distance": params["distance"],
+        "dtype": dtype,
+        "count": count,
+        "vectors": DTYPES[dtype],
+        "payloads": "payloads.jsonl.gz",
+        "ingest_manifest": "ingest-manifest.json" if has_manifest else None,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(directory: str) -> dict:
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{directory} is not a complete snapshot (no manifest.json)")
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"unsupported snapshot format {manifest.get('format')} (expected {FORMAT_VERSION})")
+    return manifest
+
+
+def load_vectors(directory: str, manifest: dict = None):
+    """The snapshot's vectors as a read-only memory-mapped (count, size) matrix."""
+    import numpy as np
+    manifest = manifest or read_manifest(directory)
+    shape = (manifest["count"], manifest["size"])
+    if not manifest["count"]:
+        return np.empty(shape, dtype=manifest["dtype"])
+    path = os.path.join(directory, manifest["vectors"])
+    expected = shape[0] * shape[1] * np.dtype(manifest["dtype"]).itemsize
+    if os.path.getsize(path) != expected:
+        raise ValueError(f"{path} has {os.path.getsize(path)} bytes, expected {expected}")
+    return np.memmap(path, dtype=manifest["dtype"], mode="r", shape=shape)
+
+
+def iter_blocks(directory: str, manifest: dict = None):
+    """Yield the snapshot's rows as PointBatches, one per exported page."""
+    manifest = manifest or read_manifest(directory)
+    matrix = load_vectors(directory, manifest)
+    with gzip.open(os.path.join(directory, manifest["payloads"]), "rb") as f:
+        for line in f:
+            block = decode_json(line)
+            start, ids = block["start"], block["ids"]
+            yield PointBatch(ids, matrix[start:start + len(ids)], _payloads(block["columns"], len(ids)))
+
+
+def import_snapshot(store, directory: str, collection: str = None, workers: int = SNAPSHOT_WORKERS,
+                    upsert_size: int = MAX_UPSERT, keyword_index=None) -> dict:
+    """Upsert a snapshot into collection (default: the one it was exported from).
+
+    The ingestion manifest is restored only when every upsert succeeded.
+    Returns {"collection", "points", "failed_batches", "manifest_restored"}.
+    """
+    manifest = read_manifest(directory)
+    collection = collection or manifest["collection"]
+    if not store.ensure_collection(collection, size=manifest["size"], distance=manifest["distance"]):
+        raise RuntimeError(f"could not create collection '{collection}'")
+    params = store.vector_params(collection)
+    if params and params["size"] != manifest["size"]:
+        raise ValueError(f"collection '{collection}' has {params['size']} dimensions, the snapshot {manifest['size']}")
+
+    points = 0
+    failed = 0
+    buffered = 0
+    reported = 0
+    started = time.perf_counter()
+    pending = set()
+
+    def settle(blocking: bool):
+        nonlocal pending, failed
+        if not pending:
+            return
+        if blocking:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        else:
+            done = {f for f in pending if f.done()}
+            pending -= done
+        failed += sum(1 for f in done if not f.result())
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for block in iter_blocks(directory, manifest):
+            for i in range(0, len(block), upsert_size):
+                # Bounded in-flight upserts keep memory flat however large the snapshot is
+                while len(pending) >= max(1, workers) * 2:
+                    settle(blocking=True)
+                pending.add(pool.submit(store.upsert, collection, block[i:i + upsert_size]))
+            if keyword_index is not None:
+                for pid, payload in zip(block.ids, block.payloads):
+                    keyword_index.add(pid, payload)
+                buffered += len(block)
+                if buffered >= KEYWORD_COMMIT_POINTS:
+                    keyword_index.commit()
+                    buffered = 0
+            points += len(block)
+            settle(blocking=False)
+            if points - reported >= 100000:
+                _log_progress("imported", points, started)
+                reported = points
+        while pending:
+            settle(blocking=True)
+    if keyword_index is not None:
+        keyword_index.commit()
+
+    # A restored manifest marks every document as ingested, which is only true if every point arrived
+    restored = False
+    if manifest.get("ingest_manifest") and not failed:
+        with open(os.path.join(directory, manifest["ingest_manifest"]), "r", encoding="utf-8") as f:
+            documents = json.load(f).get("documents", {})
+        # Merged, so documents ingested into the target meanwhile keep their entries
+        target = IngestManifest(collection)
+        for source, entry in documents.items():
+            target.record(source, entry)
+        target.save()
+        restored = True
+    elif manifest.get("ingest_manifest"):
+        print(f"[warning] {failed} upserts failed, so the ingestion manifest was not restored; import again, "
+              "or re-ingest the documents with ingest_pdf.py --force")
+    return {"collection": collection, "points": points, "failed_batches": failed, "manifest_restored": restored}
@@ -0,0 +1,531 @@
+"""
+Pluggable vector store.
+VECTOR_STORE=qdrant (default) talks to a Qdrant server through qdrant_http;
+VECTOR_STORE=local keeps each collection on disk as a memory-mapped float32
+matrix plus a JSONL payload sidecar and searches it in-process with NumPy,
+so the whole stack can run without a Qdrant container. Writers of a local
+collection take a lock file, so several processes can write to it at once.
+"""
+import os
+import json
+import threading
+from abc import ABC, abstractmethod
+
+from .file_lock import file_lock
+
+VECTOR_STORE = os.getenv("VECTOR_STORE", "qdrant").lower()
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH", os.path.join(".cache", "vectors"))
+# "flat" searches every vector exactly; "ivf" probes the closest clusters of an inverted-file index
+LOCAL_INDEX = os.getenv("LOCAL_INDEX", "flat").lower()
+LOCAL_IVF_MIN_POINTS = int(os.getenv("LOCAL_IVF_MIN_POINTS", "20000"))
+LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", "8"))
+
+
+class PointBatch:
+    """Points in columns: IDs, an (n, dim) float32 matrix and payloads.
+
+    Vectors stay in one contiguous buffer until they are serialized, instead of
+    a list of 768 Python floats per point, which takes about eight times the
+    memory. Slicing and concatenation keep the columns aligned.
+    """
+
+    def __init__(self, ids, vectors, payloads):
+        import numpy as np
+        self.ids = list(ids)
+        self.payloads = list(payloads)
+        matrix = np.asarray(vectors, dtype=np.float32)
+        self.vectors = np.ascontiguousarray(matrix.reshape(len(self.ids), -1) if self.ids else matrix.reshape(0, 0))
+
+    @classmethod
+    def from_points(cls, points: list):
+        """Columns of a list of {"id", "vector", "payload"} dicts."""
+        return cls([p["id"] for p in points], [p["vector"] for p in points],
+                   [p.get("payload") or {} for p in points])
+
+    @classmethod
+    def concat(cls, batches: list):
+        import numpy as np
+        batches = [b for b in batches if len(b)]
+        if not batches:
+            return cls([], [], [])
+        return cls([i for b in batches for i in b.ids], np.concatenate([b.vectors for b in batches]),
+                   [p for b in batches for p in b.payloads])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index: slice):
+        return PointBatch(self.ids[index], self.vectors[index], self.payloads[index])
+
+    def points(self) -> list:
+        """The points as {"id", "vector", "payload"} dicts."""
+        return [{"id": i, "vector": v, "payload": p} for i, v, p in zip(self.ids, self.vectors, self.payloads)]
+
+
+def as_point_batch(points) -> PointBatch:
+    """A PointBatch from either a PointBatch or a list of point dicts."""
+    return points if isinstance(points, PointBatch) else PointBatch.from_points(points)
+
+
+class VectorStore(ABC):
+    """Operations the RAG scripts need from a vector database."""
+
+    name = "base"
+
+    @abstractmethod
+    def is_available(self, timeout: float = 5) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def ensure_collection(self, collection: str, size: int = 768, distance: str = "Cosine") -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def points_count(self, collection: str, timeout: float = 5) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def vector_params(self, collection: str, timeout: float = 5):
+        """{"size", "distance"} of the collection's vectors, or None if it does not exist."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def scroll(self, collection: str, limit: int = 1024, offset=None, timeout: float = 60) -> tuple:
+        """One page of points with vectors and payloads: (PointBatch, next offset).
+
+        Pass the returned offset to get the next page; it is None after the last one.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, collection: str, vector, limit: int = 5, with_payload=True, timeout: float = 30) -> list:
+        """Return hits as dicts with 'id', 'score' and (optionally) 'payload'."""
+        raise NotImplementedError
+
+    def search_batch(self, collection: str, vectors: list, limit: int = 5, with_payload=True,
+                     timeout: float = 30) -> list:
+        """Run several searches at once; returns one list of hits per vector."""
+        return [self.search(collection, v, limit, with_payload, timeout) for v in vectors]
+
+    @abstractmethod
+    def retrieve(self, collection: str, ids: list, timeout: float = 30) -> dict:
+        """Payloads of points by ID, as {str(id): payload}; unknown IDs are left out."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert(self, collection: str, points, timeout: float = 60) -> bool:
+        """Insert or replace points, given as a PointBatch or a list of point dicts."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_points(self, collection: str, selector: dict, timeout: float = 60) -> bool:
+        """Delete by {"points": [ids]} or by {"filter": {"must": [...]}}."""
+        raise NotImplementedError
+
+    def delete_source(self, collection: str, source: str) -> bool:
+        """Remove every point of a document."""
+        return self.delete_points(collection, {"filter": {"must": [{"key": "source", "match": {"value": source}}]}})
+
+
+def matches_filter(payload: dict, flt: dict) -> bool:
+    """Evaluate the subset of Qdrant filters used here: 'must' clauses with match.value."""
+    for cond in flt.get("must", []):
+        if payload.get(cond["key"]) != cond.get("match", {}).get("value"):
+            return False
+    return True
+
+
+class IVFIndex:
+    """Inverted-file index: k-means centroids with one posting list of rows per centroid."""
+
+    def __init__(self, matrix, rows, nlist: int, iterations: int = 8, seed: int = 0):
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        sample = rows if len(rows) <= nlist * 64 else rng.choice(rows, nlist * 64, replace=False)
+        data = np.asarray(matrix[np.sort(sample)])
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = data[assign == c]
+                # Re-seed empty clusters from a random sample point
+                centroids[c] = members.mean(axis=0) if len(members) else data[rng.integers(len(data))]
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+        assign = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), 65536):
+            block = rows[start:start + 65536]
+            assign[start:start + len(block)] = np.argmax(np.asarray(matrix[block]) @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self.centroids = centroids
+        self.lists = [rows[order[bounds[c]:bounds[c + 1]]] for c in range(nlist)]
+        self.built_rows = int(matrix.shape[0])
+
+    def candidates(self, query, nprobe: int, total_rows: int):
+        import numpy as np
+        nprobe = min(nprobe, len(self.lists))
+        nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        parts = [self.lists[c] for c in nearest]
+        # Rows appended since the index was built are always scanned exactly
+        parts.append(np.arange(self.built_rows, total_rows))
+        return np.concatenate(parts)
+
+
+class LocalCollection:
+    """One collection: vectors.f32 (row-major float32), points.jsonl (row log) and meta.json."""
+
+    def __init__(self, directory: str):
+        self.dir = directory
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.log_path = os.path.join(directory, "points.jsonl")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.lock_path = os.path.join(directory, ".lock")
+        self.lock = threading.RLock()
+        self.index = None
+        with file_lock(self.lock_path, shared=True):
+            self._load()
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.log_path)
+            return (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        import numpy as np
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim = meta["size"]
+        self.distance = meta.get("distance", "Cosine")
+        self.ids = []
+        self.payloads = []
+        self.rows = {}
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    rec = json.loads(line)
+                    self._apply(rec)
+        self._remap()
+        alive = np.zeros(self.matrix.shape[0], dtype=bool)
+        live_rows = [r for r in self.rows.values() if r < len(alive)]
+        alive[live_rows] = True
+        self.alive = alive
+        self.index = None
+        self._seen = self._stamp()
+
+    def _apply(self, rec):
+        row = rec["row"]
+        while len(self.ids) <= row:
+            self.ids.append(None)
+            self.payloads.append(None)
+        old = self.ids[row]
+        if old is not None and self.rows.get(str(old)) == row:
+            del self.rows[str(old)]
+        if rec.get("deleted"):
+            self.ids[row] = None
+            self.payloads[row] = None
+        else:
+            self.ids[row] = rec["id"]
+            self.payloads[row] = rec.get("payload") or {}
+            self.rows[str(rec["id"])] = row
+
+    def _remap(self):
+        import numpy as np
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        n = size // (4 * self.dim)
+        if n:
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+        else:
+            self.matrix = np.empty((0, self.dim), dtype=np.float32)
+
+    def refresh(self):
+        """Reload when another process changed the collection on disk."""
+        # Shared, so the log is never read half-appended or between the two renames of a compaction
+        with self.lock, file_lock(self.lock_path, shared=True):
+            self._reload()
+
+    def _reload(self):
+        # Call with the lock file held
+        if self._stamp() != self._seen:
+            self._load()
+
+    def count(self):
+        self.refresh()
+        with self.lock:
+            return len(self.rows)
+
+    def _prepare(self, vectors):
+        import numpy as np
+        mat = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if self.distance.lower() == "cosine":
+            mat = mat / (np.linalg.norm(mat, axis=1, keepdims=True) + 1e-12)
+        return np.ascontiguousarray(mat, dtype=np.float32)
+
+    def upsert(self, batch: PointBatch):
+        import numpy as np
+        # The last write of an ID within a batch wins
+        last = list({str(pid): i for i, pid in enumerate(batch.ids)}.values())
+        # Rows are numbered from what is on disk, so other writers must wait until this one is done
+        with self.lock, file_lock(self.lock_path):
+            self._reload()
+            mat = self._prepare(batch.vectors[last])
+            n = self.matrix.shape[0]
+            records = []
+            appended = []
+            with open(self.vectors_path, "r+b" if n else "wb") as f:
+                for i, vec in zip(last, mat):
+                    pid = batch.ids[i]
+                    row = self.rows.get(str(pid))
+                    if row is None:
+                        row = n + len(appended)
+                        appended.append(vec)
+                    else:
+                        f.seek(row * 4 * self.dim)
+                        f.write(vec.tobytes())
+                    records.append({"row": row, "id": pid, "payload": batch.payloads[i] or {}})
+                if appended:
+                    f.seek(n * 4 * self.dim)
+                    f.write(np.stack(appended).tobytes())
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records))
+            for rec in records:
+                self._apply(rec)
+            self._remap()
+            alive = np.zeros(self.matrix.shape[0], dtype=bool)
+            alive[:len(self.alive)] = self.alive
+            alive[[r["row"] for r in records]] = True
+            self.alive = alive
+            self._seen = self._stamp()
+        return True
+
+    def delete(self, selector):
+        with self.lock, file_lock(self.lock_path):
+            self._reload()
+            if "points" in selector:
+                rows = [self.rows[str(i)] for i in selector["points"] if str(i) in self.rows]
+            else:
+                flt = selector.get("filter", {})
+                rows = [row for row in self.rows.values() if matches_filter(self.payloads[row], flt)]
+            if not rows:
+                return True
+            records = [{"row": row, "deleted": True} for row in rows]
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records))
+            for rec in records:
+                self._apply(rec)
+            self.alive[rows] = False
+            self._seen = self._stamp()
+            if len(self.ids) - len(self.rows) > max(1024, len(self.ids) // 3):
+                self._compact()
+        return True
+
+    def _compact(self):
+        """Rewrite the vectors and log without deleted rows."""
+        import numpy as np
+        live = np.flatnonzero(self.alive)
+        tmp_vectors = self.vectors_path + ".tmp"
+        tmp_log = self.log_path + ".tmp"
+        with open(tmp_vectors, "wb") as f:
+            for start in range(0, len(live), 65536):
+                f.write(np.asarray(self.matrix[live[start:start + 65536]]).tobytes())
+        with open(tmp_log, "w", encoding="utf-8") as f:
+            for new_row, row in enumerate(live):
+                f.write(json.dumps({"row": new_row, "id": self.ids[row], "payload": self.payloads[row]},
+                                   separators=(",", ":")) + "\n")
+        self.matrix = None
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_log, self.log_path)
+        self._load()
+
+    def _candidates(self, query):
+        import numpy as np
+        n = self.matrix.shape[0]
+        if LOCAL_INDEX != "ivf" or len(self.rows) < LOCAL_IVF_MIN_POINTS:
+            return None
+        stale = self.index is None or n - self.index.built_rows > self.index.built_rows // 10
+        if stale:
+            live = np.flatnonzero(self.alive)
+            self.index = IVFIndex(self.matrix, live, nlist=max(16, int(np.sqrt(len(live)))))
+        return self.index.candidates(query, LOCAL_IVF_NPROBE, n)
+
+    def _top_hits(self, scores, rows, limit: int, with_payload):
+        import numpy as np
+        k = min(limit, len(self.rows), len(rows))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = []
+        for i in top:
+            if not np.isfinite(scores[i]):
+                continue
+            row = int(rows[i])
+            hit = {"id": self.ids[row], "score": float(scores[i])}
+            if with_payload:
+                hit["payload"] = self.payloads[row]
+            hits.append(hit)
+        return hits
+
+    def search(self, vector, limit: int, with_payload=True):
+        import numpy as np
+        self.refresh()
+        with self.lock:
+            if not self.rows:
+                return []
+            query = self._prepare([vector])[0]
+            rows = self._candidates(query)
+            if rows is None:
+                scores = self.matrix @ query
+                scores[~self.alive] = -np.inf
+                rows = np.arange(len(scores))
+            else:
+                rows = rows[self.alive[rows]]
+                scores = np.asarray(self.matrix[rows]) @ query
+            return self._top_hits(scores, rows, limit, with_payload)
+
+    def scroll(self, offset, limit: int):
+        """Live rows from row offset on, in row order."""
+        import numpy as np
+        self.refresh()
+        with self.lock:
+            start = offset or 0
+            rows = np.flatnonzero(self.alive[start:])[:limit] + start
+            batch = PointBatch([self.ids[r] for r in rows], self.matrix[rows].reshape(len(rows), self.dim),
+                               [self.payloads[r] for r in rows])
+            more = len(rows) == limit and rows[-1] + 1 < self.matrix.shape[0]
+            return batch, int(rows[-1]) + 1 if more else None
+
+    def retrieve(self, ids):
+        self.refresh()
+        with self.lock:
+            rows = ((str(pid), self.rows.get(str(pid))) for pid in ids)
+            return {pid: self.payloads[row] for pid, row in rows if row is not None}
+
+    def search_batch(self, vectors, limit: int, with_payload=True):
+        """Score all queries against the matrix in one matrix product."""
+        import numpy as np
+        if LOCAL_INDEX == "ivf" and len(self.rows) >= LOCAL_IVF_MIN_POINTS:
+            return [self.search(v, limit, with_payload) for v in vectors]
+        self.refresh()
+        with self.lock:
+            if not self.rows or not len(vectors):
+                return [[] for _ in vectors]
+            queries = self._prepare(vectors)
+            rows = np.arange(self.matrix.shape[0])
+            results = []
+            # Blocks of queries bound the score matrix for large collections
+            for i in range(0, len(queries), 64):
+                scores = queries[i:i + 64] @ np.asarray(self.matrix).T
+                scores[:, ~self.alive] = -np.inf
+                results.extend(self._top_hits(row_scores, rows, limit, with_payload) for row_scores in scores)
+            return results
+
+
+class LocalVectorStore(VectorStore):
+    """In-process vector store on memory-mapped files."""
+
+    name = "local"
+
+    def __init__(self, root: str = LOCAL_STORE_PATH):
+        self.root = root
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, collection: str):
+        with self._lock:
+            col = self._collections.get(collection)
+            if col is None:
+                directory = os.path.join(self.root, collection)
+                if not os.path.exists(os.path.join(directory, "meta.json")):
+                    raise KeyError(f"collection '{collection}' does not exist")
+                col = LocalCollection(directory)
+                self._collections[collection] = col
+            return col
+
+    def is_available(self, timeout: float = 5) -> bool:
+        return True
+
+    def ensure_collection(self, collection: str, size: int = 768, distance: str = "Cosine") -> bool:
+        if distance.lower() not in ("cosine", "dot"):
+            raise ValueError(f"local vector store does not support distance '{distance}'")
+        directory = os.path.join(self.root, collection)
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            os.makedirs(directory, exist_ok=True)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"size": size, "distance": distance}, f)
+        return True
+
+    def points_count(self, collection: str, timeout: float = 5) -> int:
+        try:
+            return self._collection(collection).count()
+        except KeyError:
+            return 0
+
+    def vector_params(self, collection: str, timeout: float = 5):
+        try:
+            col = self._collection(collection)
+        except KeyError:
+            return None
+        return {"size": col.dim, "distance": col.distance}
+
+    def scroll(self, collection: str, limit: int = 1024, offset=None, timeout: float = 60) -> tuple:
+        try:
+            return self._collection(collection).scroll(offset, limit)
+        except KeyError:
+            return PointBatch([], [], []), None
+
+    def search(self, collection: str, vector, limit: int = 5, with_payload=True, timeout: float = 30) -> list:
+        try:
+            return self._collection(collection).search(vector, limit, with_payload)
+        except KeyError:
+            return []
+
+    def search_batch(self, collection: str, vectors: list, limit: int = 5, with_payload=True,
+                     timeout: float = 30) -> list:
+        try:
+            return self._collection(collection).search_batch(vectors, limit, with_payload)
+        except KeyError:
+            return [[] for _ in vectors]
+
+    def retrieve(self, collection: str, ids: list, timeout: float = 30) -> dict:
+        try:
+            return self._collection(collection).retrieve(ids)
+        except KeyError:
+            return {}
+
+    def upsert(self, collection: str, points, timeout: float = 60) -> bool:
+        if not len(points):
+            return True
+        try:
+            return self._collection(collection).upsert(as_point_batch(points))
+        except Exception as e:
+            print(f"[warning] local upsert of {len(points)} points failed: {e}")
+            return False
+
+    def delete_points(self, collection: str, selector: dict, timeout: float = 60) -> bool:
+        try:
+            return self._collection(collection).delete(selector)
+        except KeyError:
+            return True
+
+
+_local_store = None
+_local_lock = threading.Lock()
+
+
+def get_store(url: str = None) -> VectorStore:
+    """The configured vector store backend (VECTOR_STORE=qdrant|local)."""
+    global _local_store
+    if VECTOR_STORE == "qdrant":
+        from .qdrant_http import get_client, QDRANT_URL
+        return get_client(url or QDRANT_URL)
+    if VECTOR_STORE == "local":
+        with _local_lock:
+            if _local_store is None:
+                _local_store = LocalVectorStore()
+            return _local_store
+    raise ValueError(f"Unknown VECTOR_STORE '{VECTOR_STORE}' (expected 'qdrant' or 'local')")
@@ -27,7 +27,7 @@ fi
 # Check if Python dependencies are installed
 echo "📦 Checking dependencies..."
 MISSING_DEPS=0
-for dep in flask requests PyPDF2 dotenv; do
+for dep in flask requests PyPDF2 dotenv uvicorn; do
     if ! python3 -c "import $dep" 2>/dev/null; then
         MISSING_DEPS=1
         break
@@ -60,5 +60,9 @@ echo "Starting web interface on port 5000..."
 echo "======================================"
 echo ""
 
-# Start the web application
-python3 web_app.py
+# Start the web application; FLASK_DEBUG=1 uses Flask's development server instead
+if [ "${FLASK_DEBUG:-0}" = "1" ]; then
+    python3 web_app.py
+else
+    exec python3 serve.py
+fi
@@ -0,0 +1,66 @@
+"""
+Production launcher for the web interface.
+Serves asgi_app.py with uvicorn: the chat routes run on an event loop, so many
+answers can be generated at once by one process, while uploads, status and the
+other Flask routes run on a thread pool. Replaces the Flask development server
+that `python web_app.py` starts.
+
+    python serve.py --port 5000 --chat-concurrency 4 --qdrant-concurrency 32
+"""
+import os
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the RAG web interface with uvicorn.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=1,
+                        help="server processes; each has its own caches and upload workers (default: 1)")
+    parser.add_argument("--chat-concurrency", type=int, default=None,
+                        help="concurrent Ollama chat generations per process (OLLAMA_CHAT_CONCURRENCY, default 4)")
+    parser.add_argument("--embed-concurrency", type=int, default=None,
+                        help="concurrent Ollama embedding calls per process: the embedding scheduler's dispatch "
+                             "threads (EMBED_SCHEDULER_WORKERS, default 2), or with EMBED_SCHEDULER=0 the limit "
+                             "of the async routes (OLLAMA_EMBED_CONCURRENCY, default 8)")
+    parser.add_argument("--qdrant-concurrency", type=int, default=None,
+                        help="concurrent Qdrant searches per process (QDRANT_CONCURRENCY, default 32)")
+    parser.add_argument("--wsgi-threads", type=int, default=None,
+                        help="threads serving the Flask routes (WSGI_THREADS, default 16)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--keep-alive", type=int, default=5, help="seconds idle connections are kept open")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        print("[error] uvicorn is not installed: pip install -r requirements.txt")
+        print("[info] For development, run the Flask server instead: python web_app.py")
+        return 1
+
+    # The limits are read when asgi_app is imported, which happens in each worker process
+    for env, value in (("OLLAMA_CHAT_CONCURRENCY", args.chat_concurrency),
+                       ("OLLAMA_EMBED_CONCURRENCY", args.embed_concurrency),
+                       ("EMBED_SCHEDULER_WORKERS", args.embed_concurrency),
+                       ("QDRANT_CONCURRENCY", args.qdrant_concurrency),
+                       ("WSGI_THREADS", args.wsgi_threads)):
+        if value is not None:
+            os.environ[env] = str(value)
+    if args.workers > 1:
+        print("[info] with several workers, uploads are ingested by whichever process receives them")
+
+    print(f"[info] serving on http://{args.host}:{args.port} with {args.workers} worker(s)")
+    uvicorn.run("asgi_app:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level,
+                timeout_keep_alive=args.keep_alive, lifespan="on")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
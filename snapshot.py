@@ -0,0 +1,88 @@
+"""
+Export a collection to a binary snapshot and import it elsewhere.
+Snapshots hold the stored vectors, so restoring a collection makes no
+embedding calls and does not need the PDFs or Ollama (see rag/snapshot.py for
+the format).
+
+    python snapshot.py export snapshots/docs --dtype float16
+    python snapshot.py import snapshots/docs --workers 8
+"""
+import os
+import time
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from rag.config import QDRANT_URL, COLLECTION, MAX_UPSERT
+from rag.snapshot import SNAPSHOT_PAGE_SIZE, SNAPSHOT_WORKERS, DTYPES
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import a collection snapshot.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write the collection to a snapshot directory")
+    export.add_argument("directory", help="snapshot directory to write")
+    export.add_argument("--collection", default=COLLECTION)
+    export.add_argument("--dtype", choices=sorted(DTYPES), default="float32",
+                        help="float16 halves the vector file; cosine scores change by about 1e-3")
+    export.add_argument("--page-size", type=int, default=SNAPSHOT_PAGE_SIZE, help="points per scroll request")
+    restore = commands.add_parser("import", help="upsert a snapshot into a collection")
+    restore.add_argument("directory", help="snapshot directory to read")
+    restore.add_argument("--collection", default=None,
+                         help="target collection (default: the collection the snapshot was exported from)")
+    restore.add_argument("--workers", type=int, default=SNAPSHOT_WORKERS, help="parallel upsert requests")
+    restore.add_argument("--upsert-size", type=int, default=MAX_UPSERT, help="points per upsert")
+    restore.add_argument("--no-keyword-index", action="store_true",
+                         help="do not rebuild the BM25 keyword index from the payloads")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from rag.vector_store import get_store
+    from rag.snapshot import export_collection, import_snapshot
+
+    store = get_store(QDRANT_URL)
+    if not store.is_available():
+        print(f"[error] Cannot reach the vector store at {QDRANT_URL}")
+        print("[error] Make sure Qdrant is running: docker run -p 6333:6333 qdrant/qdrant")
+        return 1
+
+    started = time.perf_counter()
+    if args.command == "export":
+        try:
+            manifest = export_collection(store, args.collection, args.directory, args.dtype, args.page_size)
+        except (KeyError, ValueError, RuntimeError) as e:
+            print(f"[error] export failed: {e}")
+            return 1
+        elapsed = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(args.directory, name)) for name in os.listdir(args.directory))
+        print(f"[info] exported {manifest['count']} points of '{args.collection}' to {args.directory} "
+              f"({size / 1e6:.1f} MB) in {elapsed:.1f}s")
+        return 0
+
+    from rag.keyword_index import get_keyword_index
+    from rag.query_cache import CollectionVersion
+    from rag.snapshot import read_manifest
+
+    try:
+        collection = args.collection or read_manifest(args.directory)["collection"]
+        keyword_index = None if args.no_keyword_index else get_keyword_index(collection)
+        result = import_snapshot(store, args.directory, collection, args.workers, args.upsert_size, keyword_index)
+    except (OSError, KeyError, ValueError, RuntimeError) as e:
+        print(f"[error] import failed: {e}")
+        return 1
+    # Invalidate cached retrievals and answers of running web apps
+    CollectionVersion(collection).bump()
+    elapsed = time.perf_counter() - started
+    print(f"[info] imported {result['points']} points into '{collection}' in {elapsed:.1f}s "
+          f"({result['points'] / max(elapsed, 1e-9):.0f}/s), {result['failed_batches']} failed upserts")
+    if result["manifest_restored"]:
+        print("[info] merged the snapshot's ingestion manifest; ingest_pdf.py removes imported documents missing from its folder")
+    return 1 if result["failed_batches"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
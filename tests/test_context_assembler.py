@@ -0,0 +1,27 @@
+from rag.chunker import chunk_pages
+from rag.context_assembler import assemble
+
+
+def _hits(chunks):
+    return [{"id": i, "score": 1 - i / 100, "payload": {**c, "source": "a.pdf"}} for i, c in enumerate(chunks)]
+
+
+def test_neighbours_with_a_short_overlap_merge_without_repeats():
+    # One short sentence of overlap, far below the 40 characters a text probe needs
+    text = " ".join(f"Fact {i} holds." for i in range(1, 40))
+    chunks = list(chunk_pages([(1, text)], max_tokens=16, overlap_tokens=4))[:5]
+    assert chunks[1]["text"].startswith("Fact 4 holds.") and chunks[0]["text"].endswith("Fact 4 holds.")
+
+    for ordered in (chunks, chunks[::-1]):
+        passages, report = assemble(_hits(ordered), limit=5, budget=10000)
+        assert len(passages) == 1 and report["merged"] == 4
+        assert passages[0]["text"] == " ".join(f"Fact {i} holds." for i in range(1, 17))
+        assert report["saved_tokens"] == 16
+
+
+def test_overlap_is_found_when_the_document_whitespace_differs():
+    text = "\n\n".join(f"Fact {i} holds.\n" for i in range(1, 40))
+    chunks = list(chunk_pages([(1, text)], max_tokens=16, overlap_tokens=4))[:3]
+    passages, _ = assemble(_hits(chunks), limit=5, budget=10000)
+    last = int(chunks[-1]["text"].split()[-2])
+    assert passages[0]["text"] == " ".join(f"Fact {i} holds." for i in range(1, last + 1))
@@ -0,0 +1,41 @@
+import multiprocessing
+
+from rag.ingest_manifest import IngestManifest
+
+
+def _record(path: str, writer: int, count: int):
+    # One long-lived manifest, like ingest_pdf.py, saving after every document
+    manifest = IngestManifest("docs", path)
+    for i in range(count):
+        manifest.record(f"{writer}-{i}.pdf", {"sha256": str(i), "chunks": []})
+        manifest.save()
+
+
+def test_concurrent_writers_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / "manifest-docs.json")
+    ctx = multiprocessing.get_context("fork")
+    writers = [ctx.Process(target=_record, args=(path, w, 50)) for w in range(4)]
+    for p in writers:
+        p.start()
+    for p in writers:
+        p.join(60)
+    assert all(p.exitcode == 0 for p in writers)
+    assert len(IngestManifest("docs", path).sources()) == 200
+
+
+def test_save_merges_forgotten_and_recorded_sources(tmp_path):
+    path = str(tmp_path / "manifest-docs.json")
+    first = IngestManifest("docs", path)
+    first.record("a.pdf", {"sha256": "a", "chunks": []})
+    first.record("b.pdf", {"sha256": "b", "chunks": []})
+    first.save()
+
+    stale = IngestManifest("docs", path)
+    other = IngestManifest("docs", path)
+    other.record("c.pdf", {"sha256": "c", "chunks": []})
+    other.save()
+    stale.forget("a.pdf")
+    stale.save()
+
+    assert IngestManifest("docs", path).sources() == {"b.pdf", "c.pdf"}
+    assert stale.sources() == {"b.pdf", "c.pdf"}
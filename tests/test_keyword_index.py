@@ -0,0 +1,26 @@
+import random
+
+import numpy as np
+
+from rag.keyword_index import KeywordIndex
+
+
+def test_score_ids_matches_bm25_over_the_whole_index(tmp_path):
+    index = KeywordIndex("docs", str(tmp_path))
+    rng = random.Random(0)
+    words = [f"w{i}" for i in range(300)]
+    for i in range(2000):
+        index.add(f"id{i}", {"text": " ".join(rng.choices(words, k=40)), "source": f"s{i % 7}.pdf"})
+        if i % 500 == 499:
+            index.commit()
+    index.delete_source("s3.pdf")
+    index.commit()
+
+    query = " ".join(rng.choices(words, k=6))
+    ids = [f"id{rng.randrange(2500)}" for _ in range(50)] + ["id1", "id1"]
+    with index.lock:
+        full = index._bm25(query)
+    expected = np.array([full[index.rows[i]] if i in index.rows else 0.0 for i in ids], dtype=np.float32)
+    scores = index.score_ids(query, ids)
+    assert scores.any()
+    assert np.allclose(scores, expected)
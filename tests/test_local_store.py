@@ -0,0 +1,63 @@
+import multiprocessing
+
+import numpy as np
+
+from rag.vector_store import LocalVectorStore, PointBatch
+
+DIM = 8
+
+
+def _points(start: int, count: int) -> PointBatch:
+    # Point i points along axis i % DIM, and its payload says which. The text
+    # makes log appends large enough for a reader to catch one half-written
+    ids = list(range(start, start + count))
+    vectors = np.eye(DIM, dtype=np.float32)[[i % DIM for i in ids]]
+    return PointBatch(ids, vectors, [{"slot": i % DIM, "text": "x" * 4000} for i in ids])
+
+
+def _write(root: str, rounds: int):
+    store = LocalVectorStore(root)
+    for r in range(rounds):
+        start = r * 2000
+        for i in range(start, start + 2000, 100):
+            store.upsert("docs", _points(i, 100))
+        # Deleting most of the round's points compacts the collection
+        store.delete_points("docs", {"points": list(range(start, start + 1800))})
+
+
+def _read(root: str, stop, errors):
+    store = LocalVectorStore(root)
+    queries = np.eye(DIM, dtype=np.float32)
+    searches = 0
+    while not stop.is_set() or searches < 100:
+        slot = searches % DIM
+        try:
+            for hit in store.search("docs", queries[slot], limit=3):
+                if hit["score"] > 0.5 and (hit["payload"]["slot"] != slot or hit["id"] % DIM != slot):
+                    errors.put(f"vector of slot {slot} paired with {hit}")
+                    return
+        except Exception as e:
+            errors.put(f"{type(e).__name__}: {e}")
+            return
+        searches += 1
+
+
+def test_reader_never_sees_a_partial_write(tmp_path):
+    root = str(tmp_path)
+    store = LocalVectorStore(root)
+    store.ensure_collection("docs", size=DIM)
+    store.upsert("docs", _points(-DIM, DIM))
+
+    ctx = multiprocessing.get_context("fork")
+    stop, errors = ctx.Event(), ctx.Queue()
+    reader = ctx.Process(target=_read, args=(root, stop, errors))
+    writer = ctx.Process(target=_write, args=(root, 10))
+    reader.start()
+    writer.start()
+    writer.join(120)
+    stop.set()
+    reader.join(120)
+
+    assert writer.exitcode == 0
+    assert errors.empty(), errors.get()
+    assert LocalVectorStore(root).points_count("docs") == DIM + 10 * 200
@@ -0,0 +1,34 @@
+from PyPDF2 import PageObject
+
+from bench.corpus import write_pdf
+from rag.page_cache import PageCache
+
+
+def test_interrupted_read_resumes_with_missing_pages(tmp_path, monkeypatch):
+    path = str(tmp_path / "doc.pdf")
+    write_pdf(path, [[f"Page {i} text."] for i in range(1, 7)])
+    parsed = []
+    extract_text = PageObject.extract_text
+
+    def counting_extract_text(page, *args, **kwargs):
+        text = extract_text(page, *args, **kwargs)
+        parsed.append(text)
+        return text
+
+    monkeypatch.setattr(PageObject, "extract_text", counting_extract_text)
+    cache = PageCache(str(tmp_path / "pages.sqlite3"))
+
+    pages = cache.read_pages(path, "doc")
+    assert [next(pages) for _ in range(3)][-1][0] == 3
+    pages.close()
+    assert len(parsed) == 3
+
+    parsed.clear()
+    resumed = list(cache.read_pages(path, "doc"))
+    assert [number for number, _ in resumed] == [1, 2, 3, 4, 5, 6]
+    assert all(f"Page {number} text." in text for number, text in resumed)
+    assert len(parsed) == 3
+
+    parsed.clear()
+    assert list(cache.read_pages(path, "doc")) == resumed
+    assert not parsed
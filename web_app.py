@@ -4,142 +4,424 @@ Provides a chat interface and PDF ingestion capabilities.
 Uses Ollama for local LLM operations.
 """
 import os
-import uuid
-import requests
+import json
 import time
-import random
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from PyPDF2 import PdfReader
+import threading
+import uuid
+from contextlib import closing
+from flask import Flask, Response, g, render_template, request, jsonify, send_from_directory, stream_with_context
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
-import ollama
 
 # Load environment variables
 load_dotenv()
 
+from rag.config import (OLLAMA_HOST, QDRANT_URL, EMBEDDING_MODEL, EMBEDDING_DIM, CHAT_MODEL, COLLECTION,
+                        PDF_FOLDER, MAX_UPSERT, USE_MOCK)
+from rag.embedder import Embedder
+from rag.generator import build_prompt, chat_completion, chat_completion_stream
+from rag.ollama_client import get_ollama_client
+from rag.embedding_cache import cache_stats
+from rag.ingest_manifest import IngestManifest, file_sha256
+from rag.vector_store import get_store, PointBatch
+from rag.health import HealthMonitor, CircuitBreaker
+from rag.jobs import JobQueue, QueueFull
+from rag.query_cache import QueryCache, CollectionVersion, QUERY_CACHE_ENABLED, normalize_question, text_hash
+from rag.chunker import chunk_pages
+from rag.page_cache import read_pages, page_cache_stats
+from rag.keyword_index import get_keyword_index, reciprocal_rank_fusion, HYBRID_CANDIDATES
+from rag.context_assembler import assemble, context_stats
+from rag.reranker import two_stage_search, RERANK_ENABLED, RERANK_CANDIDATES, RERANK_LEXICAL_WEIGHT
+from rag.single_flight import SingleFlight
+from rag.embed_scheduler import EMBED_SCHEDULER_ENABLED, INTERACTIVE, BULK
+from rag.metrics import (REGISTRY, REQUEST_SECONDS, span, record, start_timing, current_timing, active_timing,
+                         timing_scope, stop_timing, format_timing, timing_ms)
+from rag.profiler import get_profiler
+
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = os.getenv("PDF_FOLDER", "pdfs")
-
-# Configuration
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-EMBEDDING_MODEL = "nomic-embed-text"
-CHAT_MODEL = "r1"
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
-COLLECTION = "docs"
-CHUNK_SIZE = 500
-BATCH_SIZE = 16
-MAX_UPSERT = 500
-USE_MOCK = os.getenv("USE_MOCK", "0").lower() in ("1", "true", "yes")
-
-# Initialize Ollama client
-ollama_client = ollama.Client(host=OLLAMA_HOST)
+app.config['UPLOAD_FOLDER'] = PDF_FOLDER
+
+# Configuration (shared settings are in rag/config.py)
+MAX_BATCH_QUESTIONS = int(os.getenv("MAX_BATCH_QUESTIONS", "1000"))
+# Add the per-stage X-Timing breakdown to every response, not only when asked for
+TIMING_HEADER = os.getenv("TIMING_HEADER", "0").lower() in ("1", "true", "yes")
+# Concurrent identical questions share one retrieval and one generation (COALESCE_REQUESTS=0 disables it)
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "1").lower() in ("1", "true", "yes")
+
+# Ollama client shared with the embedder and the generator
+ollama_client = get_ollama_client()
+
+# Embeddings: cache, coalescing of repeated texts and adaptive batch sizes
+embedder = Embedder()
+embed_batcher = embedder.batcher
+embed_coalescer = embedder.coalescer
+# Questions of concurrent requests are collected for a few milliseconds and embedded in one
+# Ollama call (EMBED_SCHEDULER=0 sends every request's texts on its own)
+embed_scheduler = embedder.use_scheduler() if EMBED_SCHEDULER_ENABLED else None
+embed_batch = embedder.embed_batch
+embed = embedder.embed
+
+# Vector store backend (VECTOR_STORE=qdrant|local); Qdrant uses a pooled keep-alive client
+store = get_store(QDRANT_URL)
 
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Uploads are saved under a name of their own and moved into the PDF folder by their job,
+# so a new upload never rewrites a file an earlier job of the same name is still reading.
+# filename -> {"lock": serializes its jobs, "latest": newest upload, "placed": upload in the folder,
+# "jobs": its queued and running jobs}. Entries go when their last job ends, so only names
+# with jobs in flight are kept and sequences start over with the next upload.
+uploads = {}
+uploads_lock = threading.Lock()
+
+
+def release_upload(filename: str):
+    """Count off one job of an upload name, forgetting the name after its last job."""
+    with uploads_lock:
+        upload = uploads[filename]
+        upload['jobs'] -= 1
+        if not upload['jobs']:
+            del uploads[filename]
+
+# Bumped whenever documents change; invalidates cached retrievals and answers
+collection_version = CollectionVersion(COLLECTION)
+query_cache = QueryCache(COLLECTION, collection_version) if QUERY_CACHE_ENABLED else None
+
+# BM25 index over the same chunks, fused with the vector hits (KEYWORD_INDEX=0 disables it)
+keyword_index = get_keyword_index(COLLECTION)
+
+# In-flight retrievals and generations, keyed by the normalized question
+retrievals = SingleFlight()
+generations = SingleFlight()
+stream_generations = SingleFlight(generations.counters)
+
+
+def probe_vector_store():
+    """Health probe for the vector store; also refreshes the cached point count."""
+    if not store.is_available(timeout=5):
+        return False
+    return {"points_count": store.points_count(COLLECTION, timeout=5)}
+
+
+def probe_ollama():
+    """Health probe for Ollama."""
+    ollama_client.list()
+    return {}
+
+
+# Backends are probed in the background; request handlers only read the cached state
+health = HealthMonitor()
+health.add_check("vector_store", probe_vector_store, breaker=CircuitBreaker())
+health.add_check("ollama", probe_ollama)
+
 
 def check_qdrant_connection():
-    """Check if Qdrant is available."""
+    """Check if the vector store is available (cached, no network call)."""
+    return health.is_up("vector_store")
+
+
+def hits_to_retrieval(vector, hits, cached: bool, limit: int = 5):
+    """Build a retrieval result from ranked hits.
+
+    The context assembler drops duplicate hits, merges neighbouring chunks and
+    keeps the context within the token budget; 'context_report' says how.
+    """
+    passages, report = assemble(hits, limit)
+    return {
+        'context': "\n\n".join(p["text"] for p in passages),
+        'sources': [
+            {
+                "source": p["source"],
+                "score": p["score"],
+                "ranks": p["hits"][0].get("ranks"),
+                "page_start": p["page_start"],
+                "page_end": p["page_end"],
+                "chunks": len(p["hits"]),
+            }
+            for p in passages
+        ],
+        'context_report': report,
+        'vector': vector,
+        'cached': cached,
+    }
+
+
+def retrieval_candidates(limit: int):
+    """Hits each retriever ranks; more than end up in the prompt, so duplicates can be replaced."""
+    return max(limit, HYBRID_CANDIDATES)
+
+
+def fuse_keyword_hits(questions: list, vector_hits: list, limit: int):
+    """Merge each question's vector hits with its keyword hits by reciprocal rank fusion.
+
+    The rerank already mixes BM25 scores into the vector ranking, so with
+    RERANK on and a lexical weight the vector hits are returned as they are.
+    """
+    if keyword_index is None or (RERANK_ENABLED and RERANK_LEXICAL_WEIGHT > 0):
+        return vector_hits
+    candidates = retrieval_candidates(limit)
     try:
-        r = requests.get(f"{QDRANT_URL}/collections", timeout=5)
-        return r.ok
-    except Exception:
-        return False
+        with span("keyword_search"):
+            keyword_hits = [keyword_index.search(q, candidates) for q in questions]
+    except Exception as e:
+        print(f"[warning] keyword search error: {e}")
+        keyword_hits = [[] for _ in questions]
+    return [reciprocal_rank_fusion([("vector", h), ("keyword", k)], candidates)
+            for h, k in zip(vector_hits, keyword_hits)]
 
 
-def ensure_collection(url: str, collection: str, size: int = 768, distance: str = "Cosine"):
-    """Ensure that the collection exists in Qdrant. nomic-embed-text uses 768 dimensions."""
+def retrieve_many(questions: list, limit: int = 5):
+    """Search the vector store and the keyword index for several questions at once.
+
+    All questions are embedded in one call and the retrieval cache misses are
+    sent to the vector store as one batch search. With RERANK on, that search
+    returns RERANK_CANDIDATES hits without payloads, which are reranked locally
+    and get payloads only if they are kept (see rag/reranker.py); the rerank
+    mixes in the keyword index's BM25 scores. Without it, both retrievers rank
+    HYBRID_CANDIDATES hits, which are merged by reciprocal rank fusion and cut
+    back to limit, so the prompt does not grow. Returns one
+    dict per question with the joined 'context', hit metadata ('sources'), the
+    question 'vector' and whether the hits came from the retrieval cache ('cached').
+    """
+    results = [{'context': "", 'sources': [], 'context_report': None, 'vector': None, 'cached': False}
+               for _ in questions]
+    with span("health_check"):
+        connected = check_qdrant_connection()
+    if not questions or not connected:
+        return results
+    candidates = retrieval_candidates(limit)
     try:
-        r = requests.get(f"{url}/collections", timeout=10)
-        if r.ok:
-            j = r.json()
-            cols = []
-            if isinstance(j, dict):
-                if "result" in j and isinstance(j["result"], dict) and "collections" in j["result"]:
-                    cols = j["result"]["collections"]
-                elif "collections" in j and isinstance(j["collections"], list):
-                    cols = j["collections"]
-                elif "result" in j and isinstance(j["result"], list):
-                    cols = j["result"]
-            names = [c.get("name") if isinstance(c, dict) else c for c in cols]
-            if collection in names:
-                return True
-    except Exception:
-        pass
-    
-    body = {"vectors": {"size": size, "distance": distance}}
-    for endpoint in (f"{url}/collections/{collection}/create", f"{url}/collections/{collection}"):
-        try:
-            r = requests.put(endpoint, json=body, timeout=10)
-            if r.ok or r.status_code in (200, 201, 204):
-                return True
-        except Exception:
-            pass
-    return False
-
-
-def embed_batch(texts: list, max_retries: int = 3):
-    """Generate embeddings using Ollama with nomic-embed-text model."""
-    if USE_MOCK:
-        from hashlib import sha256
-        vecs = []
-        for t in texts:
-            h = sha256(t.encode("utf-8") + b"::embed").digest()
-            seed = int.from_bytes(h[:8], "big")
-            import random as _random
-            rnd = _random.Random(seed)
-            vec = [rnd.uniform(-1, 1) for _ in range(768)]  # nomic-embed-text uses 768 dimensions
-            vecs.append(vec)
-        return vecs
-    
-    for attempt in range(max_retries):
-        try:
-            # Ollama embed supports batch processing
-            response = ollama_client.embed(model=EMBEDDING_MODEL, input=texts)
-            return response['embeddings']
-        except Exception as e:
-            if attempt < max_retries - 1:
-                wait = (2 ** attempt) + random.random()
-                print(f"[warning] Ollama embedding failed (attempt {attempt+1}): {e}. Retrying in {wait:.1f}s...")
-                time.sleep(wait)
-                continue
-            raise RuntimeError(f"Failed to get embeddings after {max_retries} retries: {e}") from e
+        with span("embed"):
+            vectors = embed_batch(questions)
+        for result, vector in zip(results, vectors):
+            result['vector'] = vector
+        with span("retrieval_cache"):
+            hits = [query_cache.get_retrieval(v, candidates) if query_cache else None for v in vectors]
+        misses = [i for i, h in enumerate(hits) if h is None]
+        if misses:
+            try:
+                if RERANK_ENABLED:
+                    found = two_stage_search(store, COLLECTION, [questions[i] for i in misses],
+                                             [vectors[i] for i in misses], candidates, keyword_index)
+                else:
+                    with span("vector_search"):
+                        found = store.search_batch(COLLECTION, [vectors[i] for i in misses], limit=candidates)
+            except Exception:
+                health.breaker("vector_store").record_failure()
+                raise
+            health.breaker("vector_store").record_success()
+            for i, h in zip(misses, found):
+                hits[i] = h
+                if query_cache:
+                    query_cache.put_retrieval(vectors[i], candidates, h)
+        hits = fuse_keyword_hits(questions, hits, limit)
+        missed = set(misses)
+        with span("assemble_context"):
+            results = [hits_to_retrieval(v, h, i not in missed, limit)
+                       for i, (v, h) in enumerate(zip(vectors, hits))]
+    except Exception as e:
+        print(f"[warning] Qdrant search error: {e}")
+    return results
 
 
-def embed(text: str):
-    """Embed a single text."""
-    return embed_batch([text])[0]
+def retrieve(question: str):
+    """Search the vector store for one question (see retrieve_many).
 
+    Concurrent requests for the same normalized question share one embedding
+    and search; 'coalesced' says whether this one waited on another's.
+    """
+    retrieval, shared = coalesce(retrievals, normalize_question(question), lambda: retrieve_many([question])[0])
+    return {**retrieval, 'coalesced': shared}
 
-def pdf_to_text(path):
-    """Extract text from PDF file."""
-    reader = PdfReader(path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    return text
 
+def coalesce(flight: SingleFlight, key, fn):
+    """Run fn() through flight unless coalescing is disabled; returns (result, shared)."""
+    if not COALESCE_REQUESTS:
+        return fn(), False
+    started = time.perf_counter()
+    result, shared = flight.do(key, fn)
+    if shared:
+        record("coalesced_wait", time.perf_counter() - started)
+    return result, shared
 
-def chat_completion(prompt: str):
-    """Generate chat completion using Ollama with r1 model."""
-    if USE_MOCK:
-        return {"choices": [{"message": {"content": "[MOCK] This is a mock response."}}]}
+
+def generation_key(question: str, context: str):
+    """Identifies one generation: the same question over the same context and model."""
+    return normalize_question(question), text_hash(context), CHAT_MODEL
+
+
+def stream_completion(question: str, retrieval: dict):
+    """Stream the answer for a retrieval; returns (tokens, shared).
+
+    Concurrent identical requests subscribe to one generation, and each gets
+    every token from the start. The answer is remembered once it is complete.
+    """
+    prompt = build_prompt(question, retrieval['context'])
+
+    def produce():
+        parts = []
+        for token in chat_completion_stream(prompt):
+            parts.append(token)
+            yield token
+        remember_answer(question, retrieval, "".join(parts))
+
+    if not COALESCE_REQUESTS:
+        return produce(), False
+    return stream_generations.stream(generation_key(question, retrieval['context']), produce)
+
+
+def cached_answer(question: str, retrieval: dict, semantic: bool = True):
+    """Previously generated answer for this question and context.
+
+    Returns (answer, 'exact' | 'semantic') or (None, None). The semantic cache
+    serves paraphrases with the same context and can be skipped per request.
+    """
+    if query_cache is None:
+        return None, None
+    with span("answer_cache"):
+        answer = query_cache.get_answer(question, retrieval['context'], CHAT_MODEL)
+        if answer is not None:
+            return answer, 'exact'
+        if semantic and retrieval['vector'] is not None:
+            similar = query_cache.get_similar_answer(retrieval['vector'], retrieval['context'], CHAT_MODEL)
+            if similar is not None:
+                return similar[0], 'semantic'
+    return None, None
+
+
+def remember_answer(question: str, retrieval: dict, answer: str):
+    if query_cache is not None:
+        query_cache.put_answer(question, retrieval['context'], CHAT_MODEL, answer, vector=retrieval['vector'])
+
+
+def semantic_cache_requested(data: dict):
+    """Per-request switch: {"semantic_cache": false} or ?semantic_cache=0 disables it."""
+    value = data.get('semantic_cache', request.args.get('semantic_cache', True))
+    if isinstance(value, str):
+        return value.lower() not in ("0", "false", "no")
+    return bool(value)
+
+
+def sse_event(event: str, data: dict):
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def timing_requested():
+    """Per-request switch for the X-Timing breakdown: TIMING_HEADER=1, an 'X-Timing: 1' header or ?timing=1."""
+    value = request.headers.get('X-Timing', request.args.get('timing'))
+    if value is None:
+        return TIMING_HEADER
+    return value.lower() not in ("0", "false", "no")
+
+
+@app.before_request
+def begin_request_timing():
+    g.request_started = time.perf_counter()
+    g.timing_token = start_timing()
+
+
+@app.after_request
+def add_timing_header(response):
+    g.response_status = response.status_code
+    if timing_requested() and not response.is_streamed:
+        response.headers['X-Timing'] = format_timing(current_timing(), time.perf_counter() - g.request_started)
+    return response
+
+
+@app.teardown_request
+def end_request_timing(exc):
+    # Runs after streamed bodies are complete, so SSE requests are timed end to end
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = g.pop('response_status', 500 if exc else 200)
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method, str(status))
     try:
-        response = ollama_client.chat(
-            model=CHAT_MODEL,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        # Convert Ollama response format to OpenAI-like format for compatibility
-        return {
-            "choices": [{
-                "message": {
-                    "content": response['message']['content']
-                }
-            }]
-        }
-    except Exception as e:
-        raise RuntimeError(f"Ollama chat completion failed: {e}") from e
+        stop_timing(g.pop('timing_token'))
+    except (KeyError, ValueError):
+        pass
+
+
+def collect_app_metrics():
+    """Current cache, queue and backend state for /metrics."""
+    families = []
+    emb = cache_stats()
+    if emb.get('enabled', True) and 'misses' in emb:
+        families.append(('rag_embedding_cache_lookups_total', 'counter', 'Embedding cache lookups by result.', [
+            ({'result': 'memory_hit'}, emb['memory_hits']),
+            ({'result': 'disk_hit'}, emb['disk_hits']),
+            ({'result': 'miss'}, emb['misses']),
+        ]))
+    if query_cache:
+        qc = query_cache.stats()
+        families.append(('rag_query_cache_lookups_total', 'counter', 'Query cache lookups by level and result.', [
+            ({'level': level, 'result': result}, qc[level][key])
+            for level in ('retrieval', 'answers') for result, key in (('hit', 'hits'), ('miss', 'misses'))
+        ]))
+    jobs = ingest_jobs.stats()
+    families.append(('rag_ingest_jobs', 'gauge', 'Ingestion jobs by status.',
+                     [({'status': 'pending'}, jobs['pending'])] +
+                     [({'status': status}, n) for status, n in jobs['jobs'].items() if status != 'queued']))
+    families.append(('rag_backend_up', 'gauge', 'Whether a backend passed its last health probe.', [
+        ({'backend': name}, 1 if health.is_up(name) else 0) for name in ('vector_store', 'ollama')
+    ]))
+    ctx = context_stats.snapshot()
+    families.append(('rag_context_tokens_total', 'counter', 'Prompt context tokens sent and saved by deduplication.', [
+        ({'kind': 'sent'}, ctx['tokens']),
+        ({'kind': 'saved'}, ctx['saved_tokens']),
+    ]))
+    coalescing = coalescing_stats()
+    families.append(('rag_coalesced_requests_total', 'counter',
+                     'Requests that ran a call (leader) or shared one already in flight (follower).', [
+        ({'call': call, 'role': role[:-1]}, coalescing[call][role])
+        for call in ('retrieval', 'generation') for role in ('leaders', 'followers')
+    ]))
+    families.append(('rag_embed_duplicates_total', 'counter',
+                     'Texts not embedded again because the same text was in the batch or in flight.', [
+        ({'kind': 'batch'}, coalescing['embeddings']['duplicates']),
+        ({'kind': 'in_flight'}, coalescing['embeddings']['shared']),
+    ]))
+    if embed_scheduler is not None:
+        scheduler = embed_scheduler.stats()
+        families.append(('rag_embed_scheduler_batches_total', 'counter',
+                         'Embedding calls sent by the scheduler, by priority.', [
+            ({'priority': p}, scheduler[p]['batches']) for p in (INTERACTIVE, BULK)
+        ]))
+        families.append(('rag_embed_scheduler_texts_total', 'counter',
+                         'Texts embedded through the scheduler, by priority.', [
+            ({'priority': p}, scheduler[p]['texts']) for p in (INTERACTIVE, BULK)
+        ]))
+        families.append(('rag_embed_scheduler_queued', 'gauge', 'Texts waiting in the embedding scheduler.', [
+            ({'priority': p}, n) for p, n in scheduler['queued'].items()
+        ]))
+    families.append(('rag_embed_batch_size', 'gauge', 'Current adaptive embedding batch size.',
+                     [({}, embed_batcher.stats()['batch_size'])]))
+    return families
+
+
+REGISTRY.add_collector(collect_app_metrics)
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text-format metrics."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/debug/profile')
+def profile():
+    """Collapsed stacks sampled so far (PROFILE=1); ?reset=1 starts a new profile."""
+    profiler = get_profiler()
+    if profiler is None:
+        return jsonify({'error': 'Profiler disabled, start with PROFILE=1'}), 404
+    body = profiler.collapsed()
+    if request.args.get('reset', '0').lower() in ('1', 'true', 'yes'):
+        profiler.reset()
+    return Response(body, mimetype='text/plain')
 
 
 @app.route('/')
@@ -160,59 +442,308 @@ def chat():
     
     try:
         # Get context from Qdrant if available
-        context = ""
-        if check_qdrant_connection():
-            try:
-                qvec = embed(question)
-                body = {"vector": qvec, "limit": 5, "with_payload": True}
-                r = requests.post(
-                    f"{QDRANT_URL}/collections/{COLLECTION}/points/search",
-                    json=body,
-                    timeout=30
-                )
-                if r.ok:
-                    result = r.json()
-                    hits = result.get("result") or result.get("data") or []
-                    texts = []
-                    for h in hits:
-                        payload = h.get("payload", {})
-                        if isinstance(payload, dict) and "text" in payload:
-                            texts.append(payload["text"])
-                    context = "\n".join(texts)
-            except Exception as e:
-                print(f"[warning] Qdrant search error: {e}")
-        
-        # Build prompt
-        if context:
-            prompt = f"""Use only this information to answer the question:
-{context}
-
-Question:
-{question}
-"""
-        else:
-            prompt = f"""Question:
-{question}
-
-Note: No specific context available. Please provide a general answer.
-"""
+        retrieval = retrieve(question)
+        context = retrieval['context']
         
-        # Get response from OpenAI
-        response = chat_completion(prompt)
-        answer = response["choices"][0]["message"]["content"]
+        answer, answer_hit = cached_answer(question, retrieval, semantic_cache_requested(data))
+        shared = False
+        if answer is None:
+            def generate_answer():
+                # Get response from Ollama
+                with span("generate"):
+                    response = chat_completion(build_prompt(question, context))
+                answer = response["choices"][0]["message"]["content"]
+                remember_answer(question, retrieval, answer)
+                return answer
+            
+            answer, shared = coalesce(generations, generation_key(question, context), generate_answer)
         
         return jsonify({
             'answer': answer,
-            'has_context': bool(context)
+            'has_context': bool(context),
+            'sources': retrieval['sources'],
+            'context_report': retrieval['context_report'],
+            'cache': {'retrieval': retrieval['cached'], 'answer': answer_hit},
+            'coalesced': {'retrieval': retrieval['coalesced'], 'answer': shared}
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/chat/stream', methods=['GET', 'POST'])
+def chat_stream():
+    """Stream the answer as Server-Sent Events.
+
+    The first event ('meta') carries the retrieval results, followed by one
+    'token' event per generated piece and a final 'done' or 'error' event.
+    """
+    data = (request.json or {}) if request.method == 'POST' else request.args
+    question = data.get('question', '')
+    semantic = semantic_cache_requested(data)
+    timing = timing_requested()
+    timings = active_timing()
+    if timings is None:
+        timings = {}
+    
+    if not question:
+        return jsonify({'error': 'No question provided'}), 400
+    
+    def done_event():
+        # Headers are already sent, so the breakdown goes into the final event
+        return sse_event('done', {'timing': timing_ms(timings)} if timing else {})
+    
+    def generate():
+        # The body runs after the view returned; keep collecting into this request's timings
+        with timing_scope(timings):
+            yield from stream_answer()
+    
+    def stream_answer():
+        retrieval = retrieve(question)
+        context = retrieval['context']
+        answer, answer_hit = cached_answer(question, retrieval, semantic)
+        tokens, shared = (None, False) if answer is not None else stream_completion(question, retrieval)
+        yield sse_event('meta', {
+            'has_context': bool(context),
+            'sources': retrieval['sources'],
+            'context_report': retrieval['context_report'],
+            'cache': {'retrieval': retrieval['cached'], 'answer': answer_hit},
+            'coalesced': {'retrieval': retrieval['coalesced'], 'answer': shared}
+        })
+        if answer is not None:
+            yield sse_event('token', {'content': answer})
+            yield done_event()
+            return
+        first = True
+        started = time.perf_counter()
+        try:
+            with closing(tokens):
+                for token in tokens:
+                    if first:
+                        record("first_token", time.perf_counter() - started)
+                        first = False
+                    yield sse_event('token', {'content': token})
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+            return
+        record("generate", time.perf_counter() - started)
+        yield done_event()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def batch_questions(data):
+    """Validate the 'questions' list of a batch request; returns (questions, error response)."""
+    questions = (data or {}).get('questions')
+    if not isinstance(questions, list) or not questions:
+        return None, (jsonify({'error': 'No questions provided'}), 400)
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        return None, (jsonify({'error': f'At most {MAX_BATCH_QUESTIONS} questions per batch'}), 400)
+    if not all(isinstance(q, str) and q for q in questions):
+        return None, (jsonify({'error': 'Questions must be non-empty strings'}), 400)
+    return questions, None
+
+
+@app.route('/api/search/batch', methods=['POST'])
+def search_batch():
+    """Retrieve context for many questions with one embedding call and one batch search."""
+    data = request.json
+    questions, error = batch_questions(data)
+    if error:
+        return error
+    try:
+        limit = max(1, min(int(data.get('limit', 5)), 100))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit must be an integer'}), 400
+    
+    retrievals = retrieve_many(questions, limit)
+    return jsonify({
+        'results': [
+            {
+                'question': q,
+                'context': r['context'],
+                'sources': r['sources'],
+                'context_report': r['context_report'],
+                'cache': {'retrieval': r['cached']}
+            }
+            for q, r in zip(questions, retrievals)
+        ]
+    })
+
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer many questions; retrieval is batched, generation runs per question."""
+    data = request.json
+    questions, error = batch_questions(data)
+    if error:
+        return error
+    semantic = semantic_cache_requested(data)
+    
+    results = []
+    for question, retrieval in zip(questions, retrieve_many(questions)):
+        context = retrieval['context']
+        try:
+            answer, answer_hit = cached_answer(question, retrieval, semantic)
+            if answer is None:
+                with span("generate"):
+                    response = chat_completion(build_prompt(question, context))
+                answer = response["choices"][0]["message"]["content"]
+                remember_answer(question, retrieval, answer)
+        except Exception as e:
+            results.append({'question': question, 'error': str(e)})
+            continue
+        results.append({
+            'question': question,
+            'answer': answer,
+            'has_context': bool(context),
+            'sources': retrieval['sources'],
+            'context_report': retrieval['context_report'],
+            'cache': {'retrieval': retrieval['cached'], 'answer': answer_hit}
+        })
+    return jsonify({'results': results})
+
+
+def ingest_document(job):
+    """Ingest one uploaded PDF. Runs on a job worker thread, reporting progress on the job."""
+    filename, staging, sequence = job.params["filename"], job.params["staging"], job.params["sequence"]
+    with uploads_lock:
+        upload = uploads[filename]
+    try:
+        with upload["lock"]:
+            token = start_timing()
+            try:
+                if sequence < upload["placed"]:
+                    # A newer upload of the same document was ingested already
+                    result = {'filename': filename, 'chunks': 0, 'upserted': 0, 'superseded': True}
+                else:
+                    result = _ingest_document(job, staging)
+            finally:
+                timings = stop_timing(token)
+                if sequence > upload["placed"]:
+                    os.replace(staging, job.params["filepath"])
+                    upload["placed"] = sequence
+                else:
+                    os.remove(staging)
+    finally:
+        release_upload(filename)
+    result['timing'] = timing_ms(timings)
+    return result
+
+
+def _ingest_document(job, filepath):
+    filename = job.params["filename"]
+    
+    # Ensure collection exists
+    if not store.ensure_collection(COLLECTION, size=EMBEDDING_DIM):
+        raise RuntimeError('Could not create collection in Qdrant')
+    
+    manifest = IngestManifest(COLLECTION)
+    # Unchanged documents are still read once if they are missing from the keyword index
+    indexed = keyword_index is None or keyword_index.has_source(filename)
+    if manifest.is_unchanged(filename, filepath) and indexed:
+        manifest.save()
+        return {'filename': filename, 'chunks': 0, 'upserted': 0, 'unchanged': True}
+    
+    # Stream pages through the chunker, reporting parsed pages; a re-upload of the same file reads the page cache
+    sha256 = file_sha256(filepath)
+    with span("extract"):
+        pages = read_pages(filepath, sha256, on_page=lambda n, total: job.update(pages_total=total, pages_parsed=n))
+        chunks = list(chunk_pages(pages))
+    with span("plan"):
+        plan = manifest.plan(filename, filepath, chunks, sha256)
+    job.update(chunks_total=len(plan.new_chunks), chunks_embedded=0, points_upserted=0)
+    
+    # The keyword index needs no embeddings, so the whole document is indexed up front
+    reindexed = False
+    if keyword_index is not None:
+        with span("keyword_index"):
+            keyword_index.replace_source(filename, [
+                (pid, {**chunk, "source": filename, "chunk_hash": digest}) for pid, digest, chunk in plan.chunks])
+            reindexed = keyword_index.commit()
+    
+    # Drop chunks that are no longer part of the document
+    with span("delete_stale"):
+        if plan.is_new:
+            store.delete_source(COLLECTION, filename)
+        elif plan.stale_ids:
+            for i in range(0, len(plan.stale_ids), 1000):
+                store.delete_points(COLLECTION, {"points": plan.stale_ids[i:i+1000]})
+    
+    # Only new chunks are embedded, in adaptively sized batches; points are upserted as batches fill
+    parts = []
+    buffered = 0
+    total_upserted = 0
+    embedded = 0
+    for batch in embed_batcher.batches(plan.new_chunks, text=lambda c: c[2]["text"]):
+        try:
+            # Limits how much Ollama capacity uploads can take away from chat
+            waited = time.perf_counter()
+            with ingest_embed_slots:
+                record("embed_wait", time.perf_counter() - waited)
+                with span("embed"):
+                    vectors = embed_batch([chunk["text"] for _, _, chunk in batch], priority=BULK)
+        except Exception as e:
+            print(f"[error] embedding batch failed: {e}")
+            vectors = [None] * len(batch)
+        
+        kept = [(item, vec) for item, vec in zip(batch, vectors) if vec is not None]
+        # Vectors are held as one float32 matrix per batch until they are sent
+        parts.append(PointBatch([pid for (pid, _, _), _ in kept], [vec for _, vec in kept],
+                                [{**chunk, "source": filename, "chunk_hash": digest}
+                                 for (_, digest, chunk), _ in kept]))
+        buffered += len(kept)
+        embedded += len(batch)
+        job.update(chunks_embedded=embedded)
+        
+        if buffered >= MAX_UPSERT or embedded >= len(plan.new_chunks):
+            points = PointBatch.concat(parts)
+            with span("upsert"):
+                upserted = bool(len(points)) and store.upsert(COLLECTION, points)
+            if upserted:
+                total_upserted += len(points)
+                job.update(points_upserted=total_upserted)
+            parts = []
+            buffered = 0
+    
+    # Only remember the document once all of its new chunks are stored
+    if total_upserted == len(plan.new_chunks):
+        # save() merges with what other jobs and processes recorded meanwhile
+        with span("manifest"):
+            manifest.record(filename, plan.entry)
+            manifest.save()
+    
+    # New documents invalidate cached retrievals and answers
+    if total_upserted or plan.stale_ids or plan.is_new or reindexed:
+        collection_version.bump()
+    
+    # Pick up the new point count without waiting for the next probe
+    health.refresh("vector_store")
+    
+    # Fail the job, so its status says the document is incomplete; the next upload retries the rest
+    if total_upserted < len(plan.new_chunks):
+        raise RuntimeError(f"only {total_upserted} of {len(plan.new_chunks)} new chunks of {filename} were stored")
+    
+    return {
+        'filename': filename,
+        'chunks': len(plan.new_chunks),
+        'upserted': total_upserted,
+        'removed': len(plan.stale_ids)
+    }
+
+
+# Uploads are ingested in the background by a bounded pool of workers
+ingest_jobs = JobQueue(ingest_document)
+ingest_embed_slots = threading.BoundedSemaphore(int(os.getenv("INGEST_EMBED_CONCURRENCY", "1")))
+
+
 @app.route('/api/upload', methods=['POST'])
 def upload_pdf():
-    """Handle PDF upload and ingestion."""
+    """Save an uploaded PDF and queue it for ingestion."""
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
@@ -227,99 +758,95 @@ def upload_pdf():
         # Save file
         filename = secure_filename(file.filename)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Ensure collection exists
-        if not ensure_collection(QDRANT_URL, COLLECTION):
-            return jsonify({'error': 'Could not create collection in Qdrant'}), 500
-        
-        # Extract text and chunk it
-        text = pdf_to_text(filepath)
-        chunks = [text[i:i+CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
-        
-        # Process chunks in batches
-        points = []
-        for i in range(0, len(chunks), BATCH_SIZE):
-            batch_chunks = chunks[i:i+BATCH_SIZE]
-            try:
-                vectors = embed_batch(batch_chunks)
-            except Exception as e:
-                print(f"[error] embedding batch failed: {e}")
-                vectors = [None] * len(batch_chunks)
-            
-            for chunk, vec in zip(batch_chunks, vectors):
-                if vec is None:
-                    continue
-                points.append({
-                    "id": str(uuid.uuid4()),
-                    "vector": vec,
-                    "payload": {"text": chunk, "source": filename}
-                })
-        
-        # Upsert to Qdrant
-        total_upserted = 0
-        for i in range(0, len(points), MAX_UPSERT):
-            sub = {"points": points[i:i+MAX_UPSERT]}
-            for method in ("post", "put"):
-                try:
-                    fn = getattr(requests, method)
-                    r = fn(f"{QDRANT_URL}/collections/{COLLECTION}/points", json=sub, timeout=60)
-                    if r.ok:
-                        total_upserted += len(sub['points'])
-                        break
-                except Exception:
-                    pass
-        
+        with uploads_lock:
+            upload = uploads.setdefault(filename, {'lock': threading.Lock(), 'latest': 0, 'placed': 0, 'jobs': 0})
+            upload['latest'] += 1
+            upload['jobs'] += 1
+            sequence = upload['latest']
+        # Hidden and not ending in .pdf, so ingest_pdf.py does not pick it up
+        staging = os.path.join(app.config['UPLOAD_FOLDER'], f'.{filename}.{uuid.uuid4().hex}.upload')
+        try:
+            with span("save_upload"):
+                file.save(staging)
+            with span("enqueue"):
+                job = ingest_jobs.submit('ingest', filename=filename, filepath=filepath, staging=staging,
+                                         sequence=sequence)
+        except Exception:
+            # No job will run for this upload
+            release_upload(filename)
+            if os.path.exists(staging):
+                os.remove(staging)
+            raise
         return jsonify({
             'success': True,
             'filename': filename,
-            'chunks': len(points),
-            'upserted': total_upserted
-        })
+            'job_id': job.id,
+            'status_url': f'/api/jobs/{job.id}'
+        }), 202
     
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/jobs')
+def list_jobs():
+    """List recent ingestion jobs."""
+    return jsonify({'jobs': ingest_jobs.list()})
+
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Report the status and progress of an ingestion job."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+
+def coalescing_stats():
+    return {
+        'enabled': COALESCE_REQUESTS,
+        'retrieval': retrievals.counters.stats(),
+        'generation': generations.counters.stats(),
+        'embeddings': embed_coalescer.stats(),
+    }
+
+
 @app.route('/api/status')
 def status():
     """Get system status."""
     qdrant_connected = check_qdrant_connection()
+    ollama_connected = health.is_up("ollama")
     
-    # Check Ollama connection
-    ollama_connected = False
-    try:
-        # Try to list models to verify Ollama is running
-        ollama_client.list()
-        ollama_connected = True
-    except Exception as e:
-        # Silently fail for status endpoint - Ollama may not be required in mock mode
-        import logging
-        logging.debug(f"Ollama connection check failed: {e}")
-    
-    # Count documents in collection
-    doc_count = 0
-    if qdrant_connected:
-        try:
-            r = requests.get(f"{QDRANT_URL}/collections/{COLLECTION}", timeout=5)
-            if r.ok:
-                data = r.json()
-                if "result" in data and "points_count" in data["result"]:
-                    doc_count = data["result"]["points_count"]
-        except Exception:
-            pass
+    # Point count is refreshed by the background Qdrant probe
+    doc_count = health.info("vector_store").get("points_count", 0) if qdrant_connected else 0
     
     return jsonify({
         'qdrant_connected': qdrant_connected,
         'ollama_connected': ollama_connected,
         'use_mock': USE_MOCK,
+        'vector_store': store.name,
         'document_count': doc_count,
         'embedding_model': EMBEDDING_MODEL,
-        'chat_model': CHAT_MODEL
+        'chat_model': CHAT_MODEL,
+        'embedding_cache': cache_stats(),
+        'page_cache': page_cache_stats(),
+        'rerank': {'enabled': RERANK_ENABLED, 'candidates': RERANK_CANDIDATES, 'lexical_weight': RERANK_LEXICAL_WEIGHT},
+        'embedding_batches': embed_batcher.stats(),
+        'embedding_scheduler': embed_scheduler.stats() if embed_scheduler else {'enabled': False},
+        'query_cache': query_cache.stats() if query_cache else {'enabled': False},
+        'keyword_index': keyword_index.stats() if keyword_index else {'enabled': False},
+        'context': context_stats.snapshot(),
+        'coalescing': coalescing_stats(),
+        'health': health.snapshot(),
+        'ingest_jobs': ingest_jobs.stats()
     })
 
 
-if __name__ == '__main__':
+def startup_checks():
+    """Print the configuration and warn about backends that are not reachable."""
     # Check Ollama connection (only in non-mock mode)
     if not USE_MOCK:
         try:
@@ -340,14 +867,21 @@ if __name__ == '__main__':
     print(f"Ollama Host: {OLLAMA_HOST}")
     print(f"Embedding Model: {EMBEDDING_MODEL}")
     print(f"Chat Model: {CHAT_MODEL}")
+    print(f"Vector Store: {store.name}")
     print(f"Qdrant URL: {QDRANT_URL}")
     print(f"Collection: {COLLECTION}")
     print(f"Mock Mode: {USE_MOCK}")
     print("="*60 + "\n")
+
+
+if __name__ == '__main__':
+    # Sampling profiler, only when PROFILE=1
+    get_profiler()
+    startup_checks()
     
     # Only enable debug mode in development (via environment variable)
     debug_mode = os.getenv("FLASK_DEBUG", "0").lower() in ("1", "true", "yes")
     if debug_mode:
         print("[WARNING] Running in DEBUG mode. Do not use in production!")
     
-    app.run(debug=debug_mode, host='0.0.0.0', port=5000)
+    app.run(debug=debug_mode, host='0.0.0.0', port=int(os.getenv("PORT", "5000")))